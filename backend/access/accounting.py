@@ -0,0 +1,186 @@
+"""
+Usage accounting pipeline for session byte counters.
+
+Gateways report cumulative counters per client. Reports are turned into
+deltas in Redis (handling counter resets and out-of-order reports) and
+accumulated with HINCRBY; a periodic flush applies the pending deltas to
+``access_session`` with one set-based UPDATE per batch, and to the usage
+rollups in the same transaction.
+"""
+import logging
+from django.db import connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .models import Session
+from .rollups import record_usage
+from .series import record_samples
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'access:acct:pending'
+FLUSHING_KEY = 'access:acct:flushing'
+LAST_KEY = 'access:acct:last'
+FLUSH_LOCK_KEY = 'access:acct:flush-lock'
+
+# For each report: compare with the last counters seen for the session,
+# derive the delta and accumulate it. A report that is not newer than the
+# last one is dropped, except a final report of the same second; a counter
+# lower than the last one means the gateway reset it, so the new value is
+# the delta.
+_RECORD_SCRIPT = """
+local results = {}
+for i = 1, #ARGV, 5 do
+    local sid = ARGV[i]
+    local down = tonumber(ARGV[i + 1])
+    local up = tonumber(ARGV[i + 2])
+    local ts = tonumber(ARGV[i + 3])
+    local final = ARGV[i + 4] == '1'
+    local d_down, d_up, d_sec = down, up, 0
+    local fresh = true
+
+    local last = redis.call('HGET', KEYS[2], sid)
+    if last then
+        local l_down, l_up, l_ts = string.match(last, '(%d+):(%d+):(%d+)')
+        l_down, l_up, l_ts = tonumber(l_down), tonumber(l_up), tonumber(l_ts)
+        if ts < l_ts or (ts == l_ts and not final) then
+            fresh = false
+        else
+            d_sec = ts - l_ts
+            if down >= l_down then d_down = down - l_down end
+            if up >= l_up then d_up = up - l_up end
+        end
+    end
+
+    if fresh then
+        redis.call('HSET', KEYS[2], sid, string.format('%.0f:%.0f:%.0f', down, up, ts))
+        if d_down > 0 then redis.call('HINCRBY', KEYS[1], sid .. ':down', string.format('%.0f', d_down)) end
+        if d_up > 0 then redis.call('HINCRBY', KEYS[1], sid .. ':up', string.format('%.0f', d_up)) end
+        if d_sec > 0 then redis.call('HINCRBY', KEYS[1], sid .. ':sec', d_sec) end
+        table.insert(results, {string.format('%.0f', d_down), string.format('%.0f', d_up), d_sec})
+    else
+        table.insert(results, {'0', '0', 0})
+    end
+end
+return results
+"""
+
+_UPDATE_SQL = """
+WITH v(id, down, up, sec) AS (VALUES {values})
+UPDATE {table}
+SET bytes_downloaded = {table}.bytes_downloaded + v.down,
+    bytes_uploaded = {table}.bytes_uploaded + v.up,
+    duration_seconds = {table}.duration_seconds + v.sec,
+    updated_at = %s
+FROM v
+WHERE {table}.id = v.id
+RETURNING {table}.id, {table}.user_id
+"""
+
+
+def record_counters(reports):
+    """
+    Record cumulative counter reports from gateways.
+
+    Args:
+        reports: list of dicts with ``session_id``, ``bytes_downloaded``,
+            ``bytes_uploaded`` (cumulative), ``timestamp`` (epoch seconds)
+            and optional ``final`` (session end, kept when it shares the
+            second of the last report)
+
+    Returns:
+        list of (delta_downloaded, delta_uploaded, delta_seconds) tuples,
+        one per report; dropped reports yield zeros
+    """
+    if not reports:
+        return []
+
+    args = []
+    for report in reports:
+        args.extend([
+            report['session_id'],
+            int(report['bytes_downloaded']),
+            int(report['bytes_uploaded']),
+            int(report['timestamp']),
+            1 if report.get('final') else 0,
+        ])
+
+    redis = get_redis_connection('default')
+    script = redis.register_script(_RECORD_SCRIPT)
+    results = script(keys=[PENDING_KEY, LAST_KEY], args=args)
+    deltas = [(int(down), int(up), int(sec)) for down, up, sec in results]
+    record_samples(
+        (report['session_id'], report['timestamp'], down, up, sec)
+        for report, (down, up, sec) in zip(reports, deltas)
+    )
+    return deltas
+
+
+def forget_sessions(session_ids):
+    """Drop the last-seen counters of sessions that ended."""
+    if session_ids:
+        get_redis_connection('default').hdel(LAST_KEY, *session_ids)
+
+
+def _apply_deltas(deltas, batch_size):
+    """
+    Apply {session_id: [down, up, sec]} with one UPDATE per batch.
+
+    Returns:
+        dict: {session_id: user_id} of the sessions that were updated
+    """
+    table = connection.ops.quote_name(Session._meta.db_table)
+    items = list(deltas.items())
+    owners = {}
+    now = timezone.now()
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            values = ', '.join(['(%s, %s, %s, %s)'] * len(batch))
+            params = []
+            for session_id, (down, up, sec) in batch:
+                params.extend([session_id, down, up, sec])
+            params.append(now)
+            cursor.execute(_UPDATE_SQL.format(values=values, table=table), params)
+            owners.update(cursor.fetchall())
+    return owners
+
+
+def flush_usage(batch_size=1000):
+    """
+    Flush pending deltas from Redis to ``access_session``.
+
+    The pending hash is atomically renamed before it is read, so reports
+    arriving during the flush accumulate in a fresh hash. If a previous
+    flush failed after the rename, its data is retried first.
+
+    Returns:
+        dict: {session_id: (down, up, sec)} of the deltas that were applied
+    """
+    redis = get_redis_connection('default')
+
+    lock = redis.lock(FLUSH_LOCK_KEY, timeout=300)
+    if not lock.acquire(blocking=False):
+        return {}
+
+    try:
+        if not redis.exists(FLUSHING_KEY):
+            if not redis.exists(PENDING_KEY):
+                return {}
+            redis.rename(PENDING_KEY, FLUSHING_KEY)
+
+        deltas = {}
+        for field, value in redis.hgetall(FLUSHING_KEY).items():
+            session_id, counter = field.decode().split(':')
+            totals = deltas.setdefault(int(session_id), [0, 0, 0])
+            totals[('down', 'up', 'sec').index(counter)] = int(value)
+
+        with transaction.atomic():
+            owners = _apply_deltas(deltas, batch_size)
+            record_usage(deltas, owners)
+        redis.delete(FLUSHING_KEY)
+    finally:
+        lock.release()
+
+    logger.info(f"Flushed usage for {len(owners)} sessions")
+    return {session_id: tuple(totals) for session_id, totals in deltas.items()}
@@ -0,0 +1,208 @@
+"""
+Negative-lookup filter of redeemable voucher codes.
+
+The codes of ACTIVE vouchers are kept in a Redis set, maintained
+incrementally as vouchers are minted, used up, revoked or expired, and
+mirrored in process memory. Every change bumps a version and is appended
+to a short change log, so a process brings its mirror up to date by
+applying the changes it missed instead of reloading the whole set. A
+code missing from a mirror checked within ``VOUCHER_FILTER_REFRESH``
+seconds is rejected without any Redis or database call, so guessing
+codes costs the attacker a set lookup in process memory.
+
+The filter only ever answers "maybe" for codes it does not know about
+while it is being rebuilt; the database stays the authority for codes it
+lets through.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .models import Voucher
+
+logger = logging.getLogger(__name__)
+
+CODES_KEY = 'access:voucher:codes'
+VERSION_KEY = 'access:voucher:codes:version'
+CHANGES_KEY = 'access:voucher:codes:changes'
+READY_KEY = 'access:voucher:codes:ready'
+
+# Changes kept for mirrors to catch up; older mirrors reload the set
+CHANGES_MAX = 1000
+
+# KEYS: codes, version, changes. ARGV: '+' or '-', CHANGES_MAX, codes...
+# Each change is logged as "<version> <op> <code>,<code>,..."
+_CHANGE_SCRIPT = """
+local command = ARGV[1] == '+' and 'SADD' or 'SREM'
+local codes = {}
+for i = 3, #ARGV do
+    codes[#codes + 1] = ARGV[i]
+    if #codes == 1000 or i == #ARGV then
+        redis.call(command, KEYS[1], unpack(codes))
+        codes = {}
+    end
+end
+local version = redis.call('INCR', KEYS[2])
+redis.call('RPUSH', KEYS[3], version .. ' ' .. ARGV[1] .. ' ' .. table.concat(ARGV, ',', 3))
+redis.call('LTRIM', KEYS[3], -tonumber(ARGV[2]), -1)
+return version
+"""
+
+# Process-local mirror of the Redis set
+_local = {'codes': set(), 'version': None, 'ready': False, 'checked': 0.0}
+_lock = threading.Lock()
+
+
+def _apply(op, codes):
+    if op == '+':
+        _local['codes'].update(codes)
+    else:
+        _local['codes'].difference_update(codes)
+
+
+def _change(op, codes):
+    redis = get_redis_connection('default')
+    version = redis.register_script(_CHANGE_SCRIPT)(
+        keys=[CODES_KEY, VERSION_KEY, CHANGES_KEY],
+        args=[op, CHANGES_MAX, *codes],
+    )
+    with _lock:
+        # Keep this process's mirror current when it saw the previous version
+        if _local['version'] == version - 1:
+            _apply(op, codes)
+            _local['version'] = version
+
+
+def add_codes(codes):
+    """Mark codes as redeemable."""
+    codes = list(codes)
+    if not codes:
+        return
+    try:
+        _change('+', codes)
+    except Exception as e:
+        logger.warning(f"Failed to add {len(codes)} voucher codes to the filter: {e}")
+
+
+def remove_codes(codes):
+    """Mark codes as no longer redeemable."""
+    codes = list(codes)
+    if not codes:
+        return
+    try:
+        _change('-', codes)
+    except Exception as e:
+        # A stale code only costs one database lookup
+        logger.warning(f"Failed to remove {len(codes)} voucher codes from the filter: {e}")
+
+
+def _parse_version(value):
+    return int(value) if value is not None else None
+
+
+def _catch_up(redis):
+    """Apply the logged changes the mirror missed, or reload the set."""
+    pipe = redis.pipeline()
+    pipe.get(VERSION_KEY)
+    pipe.lrange(CHANGES_KEY, 0, -1)
+    version, changes = pipe.execute()
+    version = _parse_version(version)
+
+    missed = []
+    for change in changes:
+        change_version, op, codes = change.decode().split(' ', 2)
+        if _local['version'] is not None and int(change_version) > _local['version']:
+            missed.append((int(change_version), op, codes.split(',')))
+    if _local['version'] is not None and missed and missed[0][0] == _local['version'] + 1 \
+            and missed[-1][0] == version:
+        for _, op, codes in missed:
+            _apply(op, codes)
+        _local['version'] = version
+        return
+
+    # Too far behind, or the set was rebuilt
+    pipe = redis.pipeline()
+    pipe.get(VERSION_KEY)
+    pipe.smembers(CODES_KEY)
+    version, codes = pipe.execute()
+    _local['codes'] = {code.decode() for code in codes}
+    _local['version'] = _parse_version(version)
+
+
+def _refresh_local(redis):
+    """Check the Redis version and bring the mirror up to date."""
+    now = time.monotonic()
+    if now - _local['checked'] < settings.PORTAL_CONFIG['VOUCHER_FILTER_REFRESH']:
+        return
+    with _lock:
+        if now - _local['checked'] < settings.PORTAL_CONFIG['VOUCHER_FILTER_REFRESH']:
+            return
+        pipe = redis.pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.get(VERSION_KEY)
+        ready, version = pipe.execute()
+        _local['ready'] = bool(ready)
+        if ready and _parse_version(version) != _local['version']:
+            _catch_up(redis)
+        _local['checked'] = now
+
+
+def might_exist(code):
+    """
+    Check whether a code may belong to an ACTIVE voucher.
+
+    Returns False only when the code is known not to be redeemable.
+    """
+    if code in _local['codes']:
+        return True
+    try:
+        _refresh_local(get_redis_connection('default'))
+    except Exception as e:
+        logger.warning(f"Voucher filter unavailable: {e}")
+        return not _local['codes']
+    if not _local['ready']:
+        return True
+    return code in _local['codes']
+
+
+def rebuild(batch_size=10000):
+    """Rebuild the filter from the ACTIVE vouchers in the database."""
+    redis = get_redis_connection('default')
+    building_key = f"{CODES_KEY}:rebuild"
+    redis.delete(building_key)
+    started = timezone.now()
+
+    total = 0
+    batch = []
+    codes = Voucher.objects.filter(status=Voucher.Status.ACTIVE).values_list('code', flat=True)
+    for code in codes.iterator(chunk_size=batch_size):
+        batch.append(code)
+        if len(batch) >= batch_size:
+            redis.sadd(building_key, *batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        redis.sadd(building_key, *batch)
+        total += len(batch)
+
+    # Mirrors cannot catch up across a rebuild: they reload the set
+    pipe = redis.pipeline()
+    if total:
+        pipe.rename(building_key, CODES_KEY)
+    else:
+        pipe.delete(CODES_KEY)
+    pipe.incr(VERSION_KEY)
+    pipe.delete(CHANGES_KEY)
+    pipe.set(READY_KEY, 1)
+    pipe.execute()
+
+    # Vouchers minted while the set was built were added to the old set
+    add_codes(
+        Voucher.objects
+        .filter(status=Voucher.Status.ACTIVE, created_at__gte=started - timedelta(minutes=1))
+        .values_list('code', flat=True)
+    )
+    return total
@@ -0,0 +1,163 @@
+"""
+Active-device sets for ``Plan.max_devices`` enforcement.
+
+Each user with authorized sessions has a Redis set of the MACs they are
+currently connected from. Admitting a device is an atomic check-and-add
+in Lua, so concurrent logins cannot exceed the plan limit, and no login
+counts ``access_session`` rows. The sets are seeded per user on first use
+and can be rebuilt from the database after a Redis flush.
+"""
+import logging
+from django_redis import get_redis_connection
+from .models import Session
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'access:devices'
+
+# Member marking a set as seeded from the database; never a valid MAC
+SEEDED = '-'
+
+# Returns -1 when the set was never seeded, 0 when the set is full,
+# 1 when the device is (already) admitted.
+_ADMIT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    return 1
+end
+local limit = tonumber(ARGV[2])
+if limit > 0 and redis.call('SCARD', KEYS[1]) - 1 >= limit then
+    return 0
+end
+redis.call('SADD', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Add only to sets that are already seeded
+_TRACK_SCRIPT = """
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('SADD', KEYS[i], ARGV[i])
+    end
+end
+return 0
+"""
+
+
+def _key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def _authorized_macs(user_ids):
+    """Return {user_id: set of MACs} of authorized sessions."""
+    macs = {}
+    sessions = (
+        Session.objects
+        .filter(user_id__in=user_ids, status=Session.Status.AUTHORIZED)
+        .values_list('user_id', 'mac_address')
+    )
+    for user_id, mac in sessions:
+        macs.setdefault(user_id, set()).add(mac)
+    return macs
+
+
+def _seed(redis, user_id):
+    macs = _authorized_macs([user_id]).get(user_id, set())
+    redis.sadd(_key(user_id), SEEDED, *macs)
+
+
+def admit(user_id, mac, limit):
+    """
+    Admit a device for a user unless it would exceed ``limit``.
+
+    A device that is already active is always admitted. A limit of 0
+    means unlimited.
+
+    Returns:
+        bool: whether the device was admitted
+    """
+    redis = get_redis_connection('default')
+    script = redis.register_script(_ADMIT_SCRIPT)
+    admitted = script(keys=[_key(user_id)], args=[mac, limit])
+    if admitted == -1:
+        _seed(redis, user_id)
+        admitted = script(keys=[_key(user_id)], args=[mac, limit])
+    return admitted == 1
+
+
+def active_devices(user_id):
+    """Return the MACs a user is currently connected from."""
+    members = get_redis_connection('default').smembers(_key(user_id))
+    if not members:
+        return sorted(_authorized_macs([user_id]).get(user_id, set()))
+    return sorted(m.decode() for m in members if m.decode() != SEEDED)
+
+
+def track(entries):
+    """Record (user_id, mac) pairs of sessions that were authorized."""
+    entries = [(user_id, mac) for user_id, mac in entries if user_id]
+    if not entries:
+        return
+    try:
+        redis = get_redis_connection('default')
+        redis.register_script(_TRACK_SCRIPT)(
+            keys=[_key(user_id) for user_id, _ in entries],
+            args=[mac for _, mac in entries],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to track {len(entries)} active devices: {e}")
+
+
+def release(entries):
+    """Remove (user_id, mac) pairs of sessions that ended."""
+    entries = [(user_id, mac) for user_id, mac in entries if user_id]
+    if not entries:
+        return
+    try:
+        pipe = get_redis_connection('default').pipeline()
+        for user_id, mac in entries:
+            pipe.srem(_key(user_id), mac)
+        pipe.execute()
+    except Exception as e:
+        # Reconciliation drops stale devices
+        logger.warning(f"Failed to release {len(entries)} active devices: {e}")
+
+
+def reconcile(batch_size=1000):
+    """
+    Rebuild the active-device sets from ``access_session``.
+
+    Returns:
+        int: number of users with active devices
+    """
+    redis = get_redis_connection('default')
+    user_ids = set(
+        Session.objects
+        .filter(status=Session.Status.AUTHORIZED, user__isnull=False)
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+
+    ordered = sorted(user_ids)
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        macs = _authorized_macs(batch)
+        pipe = redis.pipeline()
+        for user_id in batch:
+            pipe.delete(_key(user_id))
+            pipe.sadd(_key(user_id), SEEDED, *macs.get(user_id, set()))
+        pipe.execute()
+
+    # Users without authorized sessions anymore
+    stale = []
+    for key in redis.scan_iter(match=f"{KEY_PREFIX}:*", count=1000):
+        user_id = key.decode().rsplit(':', 1)[1]
+        if int(user_id) not in user_ids:
+            stale.append(key)
+    if stale:
+        redis.delete(*stale)
+
+    logger.info(f"Reconciled active devices of {len(user_ids)} users")
+    return len(user_ids)
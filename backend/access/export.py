@@ -0,0 +1,86 @@
+"""
+Streaming export of voucher batches.
+
+Vouchers are read through a server-side cursor joined to their plan and
+written out as they arrive, so memory use does not depend on the size of
+the batch.
+"""
+import csv
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import Voucher
+
+CSV_HEADER = ['code', 'plan', 'data_quota_gb', 'time_quota_hours', 'max_uses', 'valid_from', 'valid_until', 'status']
+
+_COLUMNS = (
+    'code', 'plan__name', 'plan__data_quota_gb', 'plan__time_quota_hours',
+    'max_uses', 'valid_from', 'valid_until', 'status',
+)
+
+SHEET_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Vouchers</title>
+<style>
+body { font-family: sans-serif; margin: 0; }
+.page { display: grid; grid-template-columns: repeat(3, 1fr); gap: 4mm; padding: 8mm; page-break-after: always; }
+.voucher { border: 1px dashed #999; padding: 4mm; text-align: center; }
+.voucher .code { font: bold 18pt monospace; letter-spacing: 2px; margin: 2mm 0; }
+.voucher .plan, .voucher .validity { font-size: 9pt; color: #444; }
+</style></head><body>
+"""
+
+SHEET_TAIL = "</body></html>\n"
+
+
+def batch_rows(batch, chunk_size=2000):
+    """Yield voucher dicts of a batch, joined to their plan, in minting order."""
+    vouchers = (
+        Voucher.objects
+        .filter(batch=batch)
+        .order_by('id')
+        .values(*_COLUMNS)
+    )
+    return vouchers.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+    
+    def write(self, value):
+        return value
+
+
+def csv_lines(batch):
+    """Yield the CSV export of a batch line by line."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in batch_rows(batch):
+        yield writer.writerow([
+            row['code'],
+            row['plan__name'],
+            row['plan__data_quota_gb'],
+            row['plan__time_quota_hours'],
+            row['max_uses'],
+            row['valid_from'].isoformat(),
+            row['valid_until'].isoformat(),
+            row['status'],
+        ])
+
+
+def print_pages(batch, per_page=30):
+    """Yield a printable HTML sheet of a batch, one page at a time."""
+    yield SHEET_HEAD
+    page = []
+    for row in batch_rows(batch):
+        page.append({
+            'code': row['code'],
+            'plan': row['plan__name'],
+            'data_quota_gb': row['plan__data_quota_gb'],
+            'time_quota_hours': row['plan__time_quota_hours'],
+            'valid_until': timezone.localtime(row['valid_until']),
+        })
+        if len(page) >= per_page:
+            yield render_to_string('access/voucher_page.html', {'vouchers': page})
+            page = []
+    if page:
+        yield render_to_string('access/voucher_page.html', {'vouchers': page})
+    yield SHEET_TAIL
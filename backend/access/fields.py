@@ -0,0 +1,65 @@
+"""
+Custom model fields for access control.
+"""
+from django import forms
+from django.core import exceptions
+from django.db import models
+from .utils import int_to_mac, mac_to_int, normalize_mac
+
+
+class MACAddressField(models.BigIntegerField):
+    """
+    MAC address stored as a 48-bit integer.
+    
+    Values are exposed in the canonical AA:BB:CC:DD:EE:FF form and accept
+    any format ``normalize_mac`` understands, both on assignment and in
+    lookups, so equality and IN lookups compare 8-byte integers instead of
+    17-character strings.
+    """
+    
+    description = 'MAC address (48-bit integer)'
+    default_error_messages = {
+        'invalid': '“%(value)s” is not a valid MAC address.',
+    }
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return int_to_mac(value)
+    
+    def to_python(self, value):
+        if value is None:
+            return value
+        if isinstance(value, int):
+            return int_to_mac(value)
+        mac = normalize_mac(value)
+        if mac is None:
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'],
+                code='invalid',
+                params={'value': value},
+            )
+        return mac
+    
+    def pre_save(self, model_instance, add):
+        # Normalize on the instance too, so signal handlers see the canonical form
+        value = self.to_python(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+    
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        return mac_to_int(value)
+    
+    @property
+    def validators(self):
+        # The integer range validators do not apply to the string form
+        return [*self.default_validators, *self._validators]
+    
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.CharField,
+            'max_length': 17,
+            **kwargs,
+        })
@@ -0,0 +1,282 @@
+"""
+Device recognition across randomized MAC addresses.
+
+Phones pick a new MAC per network or per day, so a returning device
+shows up under an unknown MAC. A single Redis hash maps everything known
+about a device to ``<device id>|<user id>``:
+
+- ``mac:<MAC>``: its current MAC and its previous MACs (``DeviceAlias``)
+- ``tok:<sha256>``: the device cookie set by the portal at login
+- ``fp:<sha256>``: a hash of the DHCP traits a signed gateway observed
+  for the client before its login (parameter request list, vendor class
+  and host name)
+
+so recognizing a new MAC is one HMGET, whatever the number of devices.
+Only the cookie and a previous MAC identify a device well enough to log
+it back in; traits can be copied, so a fingerprint only suggests which
+account to log in with. Traits are not unique either: a field claimed by
+devices of two different users is marked ambiguous and never matches
+again. The hash can be rebuilt from the database; stale aliases are
+garbage collected.
+"""
+import hashlib
+import logging
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .models import Device, DeviceAlias
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'access:fingerprints'
+
+# Value of a field claimed by devices of several users
+AMBIGUOUS = '-'
+
+# DHCP traits of a client accepted in gateway payloads
+TRAITS = ('dhcp_options', 'dhcp_vendor', 'hostname')
+
+# ARGV: user id, "<device id>|<user id>", fields...
+_INDEX_SCRIPT = """
+for i = 3, #ARGV do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[2])
+    elseif current ~= '-' then
+        local sep = string.find(current, '|', 1, true)
+        if string.sub(current, sep + 1) == ARGV[1] then
+            redis.call('HSET', KEYS[1], ARGV[i], ARGV[2])
+        else
+            redis.call('HSET', KEYS[1], ARGV[i], '-')
+        end
+    end
+end
+return 0
+"""
+
+# ARGV: field1, device id1, field2, device id2, ...
+_UNINDEX_SCRIPT = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if current and string.sub(current, 1, string.len(ARGV[i + 1]) + 1) == ARGV[i + 1] .. '|' then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+
+def client_fingerprint(dhcp_options=None, dhcp_vendor=None, hostname=None):
+    """
+    Hash of the DHCP traits of a client, or '' without any.
+
+    ``dhcp_options`` is the DHCP parameter request list (option 55) as a
+    list or a comma-separated string; its order is kept, it tells
+    operating systems apart.
+    """
+    if isinstance(dhcp_options, (list, tuple)):
+        dhcp_options = ','.join(str(option) for option in dhcp_options)
+    traits = {
+        'dhcp': ''.join((dhcp_options or '').split()),
+        'vendor': (dhcp_vendor or '').strip().lower(),
+        'host': (hostname or '').strip().lower(),
+    }
+    if not any(traits.values()):
+        return ''
+    canonical = '\n'.join(f"{name}={value}" for name, value in traits.items())
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def fingerprint_from(data):
+    """``client_fingerprint`` of the traits found in a request payload."""
+    return client_fingerprint(**{trait: data.get(trait) for trait in TRAITS})
+
+
+def new_token():
+    """Random device cookie value."""
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest() if token else ''
+
+
+def _fields(macs=(), token_hash='', fingerprint=''):
+    fields = [f"mac:{mac}" for mac in macs if mac]
+    if token_hash:
+        fields.append(f"tok:{token_hash}")
+    if fingerprint:
+        fields.append(f"fp:{fingerprint}")
+    return fields
+
+
+def index(device, macs=None):
+    """
+    Index a device under its MACs (current one by default), cookie and
+    fingerprint. From request paths: failures are repaired by rebuild().
+    """
+    macs = macs if macs is not None else [device.mac_address]
+    fields = _fields(macs, device.token_hash, device.fingerprint)
+    if not fields:
+        return
+    try:
+        redis = get_redis_connection('default')
+        redis.register_script(_INDEX_SCRIPT)(
+            keys=[INDEX_KEY],
+            args=[device.user_id, f"{device.id}|{device.user_id}", *fields],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index device {device.id}: {e}")
+
+
+def recognize(clients):
+    """
+    Find the known device of each client with one HMGET.
+
+    Args:
+        clients: list of dicts with optional ``mac``, ``token_hash`` and
+            ``fingerprint``
+
+    Returns:
+        list of device ids (or None), in input order. The cookie wins
+        over a previous MAC, which wins over the fingerprint.
+    """
+    candidates = [
+        _fields([client.get('mac')], client.get('token_hash', ''), client.get('fingerprint', ''))
+        for client in clients
+    ]
+    # Most specific first: tok, mac, fp
+    order = {'tok': 0, 'mac': 1, 'fp': 2}
+    candidates = [sorted(fields, key=lambda field: order[field.split(':', 1)[0]]) for fields in candidates]
+    flat = [field for fields in candidates for field in fields]
+    if not flat:
+        return [None] * len(clients)
+
+    values = iter(get_redis_connection('default').hmget(INDEX_KEY, flat))
+    recognized = []
+    for fields in candidates:
+        device_id = None
+        for _ in fields:
+            value = next(values)
+            if device_id is None and value and value != AMBIGUOUS.encode():
+                device_id = int(value.split(b'|', 1)[0])
+        recognized.append(device_id)
+    return recognized
+
+
+def adopt(device, mac):
+    """
+    Make ``mac`` the current MAC of ``device``; the previous MAC becomes
+    an alias.
+
+    Returns:
+        Device: ``device``, or the user's existing device row for ``mac``
+    """
+    if device.mac_address == mac:
+        return device
+    previous = device.mac_address
+    now = timezone.now()
+    with transaction.atomic():
+        existing = Device.objects.filter(user_id=device.user_id, mac_address=mac).first()
+        DeviceAlias.objects.update_or_create(
+            device=device, mac_address=device.mac_address, defaults={'last_seen': now},
+        )
+        if existing is not None:
+            # The user already registered this MAC as its own device
+            existing.fingerprint = existing.fingerprint or device.fingerprint
+            existing.token_hash = existing.token_hash or device.token_hash
+            existing.save(update_fields=['fingerprint', 'token_hash', 'updated_at'])
+            device = existing
+        else:
+            DeviceAlias.objects.filter(device=device, mac_address=mac).delete()
+            device.mac_address = mac
+            device.save(update_fields=['mac_address', 'updated_at'])
+    index(device, [mac, previous])
+    return device
+
+
+def rebuild(batch_size=5000):
+    """
+    Rebuild the index from non-revoked devices and their aliases, then
+    swap it in at once.
+
+    Returns:
+        int: number of fields indexed
+    """
+    claims = {}
+
+    def claim(field, device_id, user_id):
+        current = claims.get(field)
+        if current is None or (current != AMBIGUOUS and current[1] == user_id):
+            claims[field] = (device_id, user_id)
+        elif current != AMBIGUOUS:
+            claims[field] = AMBIGUOUS
+
+    devices = (
+        Device.objects.filter(is_revoked=False).order_by('id')
+        .values_list('id', 'user_id', 'mac_address', 'token_hash', 'fingerprint')
+    )
+    for device_id, user_id, mac, token_hash, fingerprint in devices.iterator(chunk_size=batch_size):
+        for field in _fields([mac], token_hash, fingerprint):
+            claim(field, device_id, user_id)
+    aliases = (
+        DeviceAlias.objects.filter(device__is_revoked=False).order_by('id')
+        .values_list('device_id', 'device__user_id', 'mac_address')
+    )
+    for device_id, user_id, mac in aliases.iterator(chunk_size=batch_size):
+        claim(f"mac:{mac}", device_id, user_id)
+
+    items = [
+        (field, value if value == AMBIGUOUS else f"{value[0]}|{value[1]}")
+        for field, value in claims.items()
+    ]
+    redis = get_redis_connection('default')
+    building_key = f"{INDEX_KEY}:rebuild"
+    pipe = redis.pipeline()
+    pipe.delete(building_key)
+    for start in range(0, len(items), batch_size):
+        pipe.hset(building_key, mapping=dict(items[start:start + batch_size]))
+    if items:
+        pipe.rename(building_key, INDEX_KEY)
+    else:
+        pipe.delete(INDEX_KEY)
+    pipe.execute()
+    logger.info(f"Indexed {len(items)} device fingerprint fields")
+    return len(items)
+
+
+def collect_aliases(retention=None, batch_size=1000):
+    """
+    Delete MAC aliases not seen for ``DEVICE_ALIAS_RETENTION`` seconds
+    and drop them from the index.
+
+    Returns:
+        int: number of aliases deleted
+    """
+    if retention is None:
+        retention = settings.PORTAL_CONFIG['DEVICE_ALIAS_RETENTION']
+    cutoff = timezone.now() - timedelta(seconds=retention)
+    deleted = 0
+    while True:
+        stale = list(
+            DeviceAlias.objects.filter(last_seen__lt=cutoff)
+            .values_list('id', 'device_id', 'mac_address')[:batch_size]
+        )
+        if not stale:
+            return deleted
+        DeviceAlias.objects.filter(id__in=[alias_id for alias_id, _, _ in stale]).delete()
+        args = []
+        for _, device_id, mac in stale:
+            args.extend([f"mac:{mac}", device_id])
+        try:
+            redis = get_redis_connection('default')
+            redis.register_script(_UNINDEX_SCRIPT)(keys=[INDEX_KEY], args=args)
+        except Exception as e:
+            # Stale entries are dropped by the next rebuild()
+            logger.warning(f"Failed to unindex {len(stale)} device aliases: {e}")
+        deleted += len(stale)
@@ -0,0 +1,224 @@
+"""
+Session retention and history queries.
+
+Closed sessions older than ``SESSION_RETENTION_DAYS`` are moved in
+batches from ``access_session`` to ``access_session_archive``. The query
+helpers send current queries to the hot table only, bounded on
+``start_time`` so PostgreSQL prunes to the matching monthly partitions,
+and read historical ranges from the archive.
+
+Archived months older than ``SESSION_ARCHIVE_TABLE_DAYS`` are compressed
+into one gzipped JSON lines file per month under ``SESSION_ARCHIVE_DIR``
+and removed from the archive table; ``compressed_sessions`` reads them.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Session, SessionArchive, SessionSeries
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = [Session.Status.PENDING, Session.Status.AUTHORIZED]
+
+HISTORY_FIELDS = [
+    'user_id', 'mac_address', 'ip_address', 'status', 'start_time', 'end_time',
+    'bytes_uploaded', 'bytes_downloaded', 'duration_seconds',
+]
+
+ARCHIVE_FIELDS = ['original_id', 'device_id', *HISTORY_FIELDS]
+
+
+def retention_horizon(now=None):
+    """Sessions that ended before this instant belong to the archive."""
+    now = now or timezone.now()
+    return now - timedelta(days=settings.PORTAL_CONFIG['SESSION_RETENTION_DAYS'])
+
+
+def archive_sessions(batch_size=5000, horizon=None):
+    """
+    Move closed sessions past the retention period to the archive.
+
+    Each batch is copied and deleted in its own transaction, so the job
+    can be interrupted and resumed.
+
+    Returns:
+        int: number of archived sessions
+    """
+    horizon = horizon or retention_horizon()
+    closed = (
+        Session.objects
+        .exclude(status__in=OPEN_STATUSES)
+        .filter(end_time__lt=horizon)
+        .order_by('id')
+    )
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                closed.select_for_update(skip_locked=True)
+                .values('id', 'device_id', *HISTORY_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [row.pop('id') for row in rows]
+            SessionArchive.objects.bulk_create([
+                SessionArchive(original_id=session_id, **row)
+                for session_id, row in zip(ids, rows)
+            ])
+            Session.objects.filter(id__in=ids).delete()
+            # Graphs are kept for the hot period only
+            SessionSeries.objects.filter(session_id__in=ids).delete()
+        archived += len(rows)
+
+    if archived:
+        logger.info(f"Archived {archived} sessions ended before {horizon:%Y-%m-%d}")
+    return archived
+
+
+def _reaches_archive(start):
+    # Archived sessions ended, hence started, before the horizon
+    return start < retention_horizon()
+
+
+def hot_sessions(start, end=None):
+    """Sessions of the hot table started in [start, end)."""
+    sessions = Session.objects.filter(start_time__gte=start)
+    if end is not None:
+        sessions = sessions.filter(start_time__lt=end)
+    return sessions
+
+
+def archived_sessions(start, end=None):
+    """Archived sessions started in [start, end)."""
+    sessions = SessionArchive.objects.filter(start_time__gte=start)
+    if end is not None:
+        sessions = sessions.filter(start_time__lt=end)
+    return sessions
+
+
+def session_history(start, end=None, **filters):
+    """
+    Sessions started in [start, end) as dicts of ``HISTORY_FIELDS``.
+
+    Ranges after the retention horizon only touch the hot partitions.
+    Older ranges also read the archive; sessions still waiting to be
+    archived are found in the hot table.
+    """
+    hot = hot_sessions(start, end).filter(**filters).values(*HISTORY_FIELDS)
+    if not _reaches_archive(start):
+        return hot.order_by('start_time')
+    archive = archived_sessions(start, end).filter(**filters).values(*HISTORY_FIELDS)
+    return archive.union(hot, all=True).order_by('start_time')
+
+
+def usage_totals(start, end=None, **filters):
+    """Session count and usage totals of sessions started in [start, end)."""
+    aggregates = {
+        'sessions': Count('id'),
+        'bytes': Sum(F('bytes_uploaded') + F('bytes_downloaded')),
+        'seconds': Sum('duration_seconds'),
+    }
+    totals = hot_sessions(start, end).filter(**filters).aggregate(**aggregates)
+    if _reaches_archive(start):
+        archived = archived_sessions(start, end).filter(**filters).aggregate(**aggregates)
+        totals = {key: (totals[key] or 0) + (archived[key] or 0) for key in aggregates}
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def _month_start(when):
+    when = when.astimezone(dt_timezone.utc)
+    return datetime(when.year, when.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _month_files(month):
+    """Compressed files of a month: its first export and later parts."""
+    directory = Path(settings.PORTAL_CONFIG['SESSION_ARCHIVE_DIR'])
+    return sorted(directory.glob(f"access_session_{month:%Y%m}*.jsonl.gz"))
+
+
+def compress_archive(before=None, batch_size=5000):
+    """
+    Move archived sessions of the months ending before ``before`` to one
+    gzipped JSON lines file per month (UTC).
+
+    A file is complete before the rows are deleted. Rows archived into an
+    already compressed month go to a new part file; rows left behind by an
+    interrupted run are compressed again, so readers skip duplicate
+    ``original_id`` values.
+
+    Returns:
+        int: number of sessions compressed
+    """
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.PORTAL_CONFIG['SESSION_ARCHIVE_TABLE_DAYS'])
+    cutoff = _month_start(before)
+    directory = Path(settings.PORTAL_CONFIG['SESSION_ARCHIVE_DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+
+    compressed = 0
+    while True:
+        oldest = (
+            SessionArchive.objects.filter(start_time__lt=cutoff)
+            .order_by('start_time').values_list('start_time', flat=True).first()
+        )
+        if oldest is None:
+            break
+        month = _month_start(oldest)
+        rows = (
+            SessionArchive.objects
+            .filter(start_time__gte=month, start_time__lt=_next_month(month))
+            .order_by('id')
+            .values('id', *ARCHIVE_FIELDS)
+        )
+        part = len(_month_files(month))
+        path = directory / (f"access_session_{month:%Y%m}" + (f".{part}" if part else '') + '.jsonl.gz')
+        partial = path.with_name(f"{path.name}.tmp")
+        ids = []
+        with gzip.open(partial, 'wt', encoding='utf-8') as f:
+            for row in rows.iterator(chunk_size=batch_size):
+                ids.append(row.pop('id'))
+                f.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        os.replace(partial, path)
+
+        for start in range(0, len(ids), batch_size):
+            SessionArchive.objects.filter(id__in=ids[start:start + batch_size]).delete()
+        compressed += len(ids)
+        logger.info(f"Compressed {len(ids)} archived sessions of {month:%Y-%m} to {path}")
+    return compressed
+
+
+def compressed_sessions(start, end=None):
+    """
+    Sessions started in [start, end) from the compressed archive files, as
+    dicts of ``ARCHIVE_FIELDS``, month by month.
+    """
+    month = _month_start(start)
+    last = _month_start(end or timezone.now())
+    while month <= last:
+        seen = set()
+        for path in _month_files(month):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    if row['original_id'] in seen:
+                        continue
+                    seen.add(row['original_id'])
+                    row['start_time'] = parse_datetime(row['start_time'])
+                    row['end_time'] = parse_datetime(row['end_time']) if row['end_time'] else None
+                    if row['start_time'] >= start and (end is None or row['start_time'] < end):
+                        yield row
+        month = _next_month(month)
@@ -0,0 +1,157 @@
+"""
+Batch detection of idle sessions.
+
+The last ``IDLE_WINDOW_MINUTES`` slots of the one-minute bandwidth ring
+of every authorized session are fetched with pipelined GETRANGE calls
+and decoded into NumPy arrays, one row per session. Every counter report
+claims the minutes it covers, with zero traffic if nothing moved, so a
+slot holding its expected bucket is a minute the gateway reported for.
+Traffic rates are averaged over the reported minutes of the window, for
+the whole batch at once; sessions below ``IDLE_THRESHOLD_BYTES_PER_MIN``
+are closed, including sessions whose counters did not move at all.
+Sessions without any report in the window are not judged: their gateway
+may be down, and they are left to session expiry and reconciliation.
+
+A run that exhausts its time budget saves the last session id it checked
+and the next run resumes after it.
+"""
+import logging
+import time
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from . import series
+from .models import Session
+from .sessions import close_sessions
+
+logger = logging.getLogger(__name__)
+
+STEP = 60
+
+CURSOR_KEY = 'access:idle:cursor'
+
+SLOT_DTYPE = np.dtype([('ts', '>u4'), ('down', '>i8'), ('up', '>i8')])
+
+
+def window_buckets(window, now=None):
+    """Start times of the last ``window`` complete one-minute buckets."""
+    now = int(now or time.time())
+    current = now - now % STEP
+    return np.arange(current - window * STEP, current, STEP, dtype=np.uint32)
+
+
+def traffic_rates(raw, buckets):
+    """
+    Average traffic of each session over the window, in bytes per minute.
+
+    Args:
+        raw: concatenated ring slots, ``len(buckets)`` slots per session
+        buckets: expected bucket start of each slot
+
+    A slot still holding an older bucket was not reported and does not
+    count. Sessions with no reported minute get NaN, which compares below
+    no threshold.
+    """
+    slots = np.frombuffer(raw, dtype=SLOT_DTYPE).reshape(-1, len(buckets))
+    current = slots['ts'] == buckets
+    traffic = np.where(current, slots['down'] + slots['up'], 0).sum(axis=1)
+    reported = current.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(reported > 0, traffic / reported, np.nan)
+
+
+def _fetch_windows(redis, session_ids, buckets):
+    """Read the window slots of many sessions in one pipeline."""
+    ranges = series.slot_ranges(STEP, int(buckets[0]), len(buckets))
+    width = len(buckets) * SLOT_DTYPE.itemsize
+    pipe = redis.pipeline(transaction=False)
+    for session_id in session_ids:
+        key = series.ring_key(session_id)
+        for start, end in ranges:
+            pipe.getrange(key, start, end)
+    parts = pipe.execute()
+
+    rows = []
+    for i in range(len(session_ids)):
+        row = b''.join(parts[i * len(ranges):(i + 1) * len(ranges)])
+        # Rings only grow up to their last written slot; a missing ring
+        # reads as empty slots and has no report in the window
+        rows.append(row.ljust(width, b'\0'))
+    return b''.join(rows)
+
+
+def find_idle_sessions(window=None, threshold=None, batch_size=5000, budget=None, now=None):
+    """
+    Return the ids of authorized sessions idle over the window.
+
+    Sessions younger than the window are skipped. Scanning stops after
+    ``budget`` seconds; the remaining sessions are checked next run, which
+    resumes after the last session id checked.
+
+    Returns:
+        tuple: (idle session ids, number of sessions checked)
+    """
+    config = settings.PORTAL_CONFIG
+    window = window or config['IDLE_WINDOW_MINUTES']
+    threshold = config['IDLE_THRESHOLD_BYTES_PER_MIN'] if threshold is None else threshold
+    budget = budget or config['IDLE_CHECK_BUDGET']
+    now = now or time.time()
+    deadline = time.monotonic() + budget
+
+    buckets = window_buckets(window, now)
+    cutoff = timezone.now() - timedelta(minutes=window)
+    redis = get_redis_connection('default')
+    resume_after = int(redis.get(CURSOR_KEY) or 0)
+    session_ids = (
+        Session.objects
+        .filter(status=Session.Status.AUTHORIZED, start_time__lte=cutoff, id__gt=resume_after)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+    idle = []
+    checked = 0
+    batch = []
+    for session_id in session_ids.iterator(chunk_size=batch_size):
+        batch.append(session_id)
+        if len(batch) < batch_size:
+            continue
+        idle.extend(_idle_in_batch(redis, batch, buckets, threshold))
+        checked += len(batch)
+        batch = []
+        if time.monotonic() > deadline:
+            redis.set(CURSOR_KEY, session_id)
+            logger.warning(
+                f"Idle detection stopped after {checked} sessions (budget {budget}s), "
+                f"resuming after session {session_id}"
+            )
+            return idle, checked
+    if batch:
+        idle.extend(_idle_in_batch(redis, batch, buckets, threshold))
+        checked += len(batch)
+    # Full pass done: the next run starts over
+    redis.delete(CURSOR_KEY)
+    return idle, checked
+
+
+def _idle_in_batch(redis, session_ids, buckets, threshold):
+    rates = traffic_rates(_fetch_windows(redis, session_ids, buckets), buckets)
+    return np.asarray(session_ids)[rates < threshold].tolist()
+
+
+def close_idle_sessions(**options):
+    """
+    Close the sessions found idle.
+
+    Returns:
+        tuple: (number of sessions closed, number of sessions checked)
+    """
+    idle, checked = find_idle_sessions(**options)
+    closed = 0
+    for start in range(0, len(idle), 1000):
+        closed += len(close_sessions(idle[start:start + 1000], status=Session.Status.EXPIRED))
+    if closed:
+        logger.info(f"Closed {closed} idle sessions out of {checked}")
+    return closed, checked
@@ -0,0 +1,22 @@
+"""
+Move closed sessions past the retention period to the archive table, and
+old archive months to compressed files.
+"""
+from django.core.management.base import BaseCommand
+from access.history import archive_sessions, compress_archive, retention_horizon
+
+
+class Command(BaseCommand):
+    help = 'Archive closed sessions older than SESSION_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        horizon = retention_horizon()
+        archived = archive_sessions(batch_size=options['batch_size'], horizon=horizon)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} sessions ended before {horizon:%Y-%m-%d}"
+        ))
+        compressed = compress_archive(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Compressed {compressed} archived sessions to files"))
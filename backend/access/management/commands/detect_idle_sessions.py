@@ -0,0 +1,53 @@
+"""
+Find (and optionally close) idle sessions, or time the vectorized check.
+"""
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from access.idle import SLOT_DTYPE, close_idle_sessions, find_idle_sessions, traffic_rates, window_buckets
+
+
+class Command(BaseCommand):
+    help = 'Detect sessions below the idle traffic threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, help='Minutes (default IDLE_WINDOW_MINUTES)')
+        parser.add_argument('--threshold', type=int, help='Bytes per minute (default IDLE_THRESHOLD_BYTES_PER_MIN)')
+        parser.add_argument('--close', action='store_true', help='Close the idle sessions')
+        parser.add_argument('--benchmark', type=int, metavar='SESSIONS',
+                            help='Time the rate computation on synthetic rings instead')
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self._benchmark(options['benchmark'], options['window'] or 10, options['threshold'] or 2048)
+
+        params = {'window': options['window'], 'threshold': options['threshold']}
+        started = time.perf_counter()
+        if options['close']:
+            closed, checked = close_idle_sessions(**params)
+            summary = f"closed {closed} idle sessions"
+        else:
+            idle, checked = find_idle_sessions(**params)
+            summary = f"{len(idle)} idle sessions"
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} sessions in {elapsed:.2f}s: {summary}"))
+
+    def _benchmark(self, sessions, window, threshold):
+        rng = np.random.default_rng(1)
+        buckets = window_buckets(window)
+        slots = np.zeros((sessions, window), dtype=SLOT_DTYPE)
+        # Half the slots are current, a fifth of the sessions nearly silent
+        slots['ts'] = np.where(rng.random((sessions, window)) < 0.5, buckets, buckets - 3600)
+        slots['down'] = rng.integers(0, 10 * threshold, (sessions, window))
+        slots['up'] = rng.integers(0, threshold, (sessions, window))
+        quiet = rng.random(sessions) < 0.2
+        slots['down'][quiet] //= 100
+        slots['up'][quiet] //= 100
+        raw = slots.tobytes()
+
+        started = time.perf_counter()
+        idle = int((traffic_rates(raw, buckets) < threshold).sum())
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{sessions} sessions x {window} minutes in {elapsed * 1000:.1f} ms: {idle} idle"
+        ))
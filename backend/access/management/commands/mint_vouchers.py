@@ -0,0 +1,52 @@
+"""
+Mint a batch of vouchers for a plan.
+"""
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from access.vouchers import mint_vouchers
+from billing.models import Plan
+
+
+class Command(BaseCommand):
+    help = 'Mint vouchers in bulk and report the minting rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', help='Plan code')
+        parser.add_argument('count', type=int, help='Number of vouchers to mint')
+        parser.add_argument('--created-by', required=True, help='Email of the issuing admin')
+        parser.add_argument('--days', type=int, default=30, help='Validity in days')
+        parser.add_argument('--max-uses', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['count'] <= 0:
+            raise CommandError('count must be positive')
+        try:
+            plan = Plan.objects.get(code=options['plan'])
+        except Plan.DoesNotExist:
+            raise CommandError(f"Unknown plan: {options['plan']}")
+        try:
+            admin = get_user_model().objects.get(email=options['created_by'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user: {options['created_by']}")
+
+        now = timezone.now()
+        started = time.perf_counter()
+        batch, vouchers = mint_vouchers(
+            plan,
+            options['count'],
+            created_by=admin,
+            valid_from=now,
+            valid_until=now + timedelta(days=options['days']),
+            max_uses=options['max_uses'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Minted {len(vouchers)} vouchers in batch {batch} "
+            f"in {elapsed:.2f}s ({len(vouchers) / elapsed:.0f} vouchers/s)"
+        ))
@@ -0,0 +1,37 @@
+"""
+Manage the monthly partitions of access_session (PostgreSQL).
+"""
+from django.core.management.base import BaseCommand, CommandError
+from access import partitions
+from access.history import retention_horizon
+
+
+class Command(BaseCommand):
+    help = 'Convert access_session to monthly partitions and maintain them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the table to a partitioned table (locks it while copying)')
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Months of partitions to create in advance')
+        parser.add_argument('--drop-empty', action='store_true',
+                            help='Drop emptied partitions older than the retention horizon')
+
+    def handle(self, *args, **options):
+        try:
+            if options['convert']:
+                if partitions.convert(options['months_ahead']):
+                    self.stdout.write(self.style.SUCCESS('access_session converted to monthly partitions'))
+                else:
+                    self.stdout.write('access_session is already partitioned')
+            elif not partitions.is_partitioned():
+                raise CommandError('access_session is not partitioned, run with --convert first')
+
+            for name in partitions.ensure_partitions(options['months_ahead']):
+                self.stdout.write(f"Created {name}")
+
+            if options['drop_empty']:
+                for name in partitions.drop_empty_partitions(retention_horizon().date()):
+                    self.stdout.write(f"Dropped {name}")
+        except RuntimeError as e:
+            raise CommandError(str(e))
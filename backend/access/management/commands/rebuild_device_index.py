@@ -0,0 +1,23 @@
+"""
+Rebuild the device recognition index from the database.
+"""
+from django.core.management.base import BaseCommand
+from access import fingerprints
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the index recognizing devices across MAC addresses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collect',
+            action='store_true',
+            help='Delete stale MAC aliases first'
+        )
+
+    def handle(self, *args, **options):
+        if options['collect']:
+            deleted = fingerprints.collect_aliases()
+            self.stdout.write(f"Deleted {deleted} stale MAC aliases")
+        total = fingerprints.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Device index rebuilt with {total} fields"))
@@ -0,0 +1,19 @@
+"""
+Recompute the usage rollups from session history.
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from access.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and hourly usage rollups from access_session and its archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Days of history to rebuild')
+
+    def handle(self, *args, **options):
+        start = timezone.now() - timedelta(days=options['days'])
+        rows = rebuild(start)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} user-day rows since {start:%Y-%m-%d}"))
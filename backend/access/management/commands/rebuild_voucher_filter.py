@@ -0,0 +1,13 @@
+"""
+Rebuild the voucher code filter from the database.
+"""
+from django.core.management.base import BaseCommand
+from access import codefilter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the negative-lookup filter of redeemable voucher codes'
+
+    def handle(self, *args, **options):
+        total = codefilter.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Voucher filter rebuilt with {total} active codes"))
@@ -0,0 +1,13 @@
+"""
+Rebuild the active-device sets from the database.
+"""
+from django.core.management.base import BaseCommand
+from access.devices import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user sets of active devices from access_session'
+
+    def handle(self, *args, **options):
+        users = reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Active devices rebuilt for {users} users"))
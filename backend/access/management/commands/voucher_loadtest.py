@@ -0,0 +1,72 @@
+"""
+Redeem one voucher concurrently and check that it is never oversold.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from access.models import Voucher
+from access.vouchers import VoucherError, redeem_voucher
+from billing.models import Plan
+
+
+class Command(BaseCommand):
+    help = 'Load test voucher redemption: many concurrent redemptions of one multi-use voucher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', help='Plan code of the test voucher')
+        parser.add_argument('--created-by', required=True, help='Email of the issuing admin')
+        parser.add_argument('--max-uses', type=int, default=100)
+        parser.add_argument('--attempts', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=50)
+        parser.add_argument('--keep', action='store_true', help='Keep the test voucher')
+
+    def handle(self, *args, **options):
+        try:
+            plan = Plan.objects.get(code=options['plan'])
+            admin = get_user_model().objects.get(email=options['created_by'])
+        except (Plan.DoesNotExist, get_user_model().DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        now = timezone.now()
+        voucher = Voucher.objects.create(
+            plan=plan,
+            created_by=admin,
+            max_uses=options['max_uses'],
+            valid_from=now,
+            valid_until=now + timedelta(hours=1),
+        )
+
+        def attempt(_):
+            try:
+                redeem_voucher(voucher.code)
+                return 'ok'
+            except VoucherError as e:
+                return e.code
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            outcomes = list(pool.map(attempt, range(options['attempts'])))
+        elapsed = time.perf_counter() - started
+
+        voucher.refresh_from_db()
+        granted = outcomes.count('ok')
+        expected = min(options['max_uses'], options['attempts'])
+        self.stdout.write(
+            f"{options['attempts']} attempts in {elapsed:.2f}s "
+            f"({options['attempts'] / elapsed:.0f} redemptions/s): "
+            f"{granted} granted, {len(outcomes) - granted} refused; "
+            f"used_count={voucher.used_count}/{voucher.max_uses} status={voucher.status}"
+        )
+
+        if not options['keep']:
+            voucher.delete()
+
+        if granted != expected or voucher.used_count != expected:
+            raise CommandError(f"Oversell check failed: expected {expected} redemptions, got {granted}")
+        self.stdout.write(self.style.SUCCESS('No oversell'))
@@ -1,17 +1,22 @@
 from django.db import models
 from django.conf import settings
 import secrets
-import string
+from .fields import MACAddressField
+from .utils import random_voucher_code
 
 class Device(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    mac_address = models.CharField(max_length=17, db_index=True)  # Format: AA:BB:CC:DD:EE:FF
+    mac_address = MACAddressField(db_index=True)  # Exposed as AA:BB:CC:DD:EE:FF
     name = models.CharField(max_length=100)
     
     # Network info
     last_ip = models.GenericIPAddressField(null=True, blank=True)
     last_seen = models.DateTimeField(null=True, blank=True)
     
+    # Recognition across MAC randomization (see access.fingerprints)
+    fingerprint = models.CharField(max_length=64, blank=True, default='')  # hashed client traits
+    token_hash = models.CharField(max_length=64, blank=True, default='')  # hashed device cookie
+    
     # Status
     is_revoked = models.BooleanField(default=False)
     
@@ -29,6 +34,23 @@ class Device(models.Model):
     def __str__(self):
         return f"{self.name} ({self.mac_address})"
 
+class DeviceAlias(models.Model):
+    """Previous MAC address of a device that randomizes its MAC."""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='aliases')
+    mac_address = MACAddressField()
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        db_table = 'access_device_alias'
+        unique_together = ['device', 'mac_address']
+        indexes = [
+            models.Index(fields=['last_seen']),
+        ]
+
+    def __str__(self):
+        return f"{self.mac_address} -> {self.device_id}"
+
 class Session(models.Model):
     class Status(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
@@ -41,7 +63,7 @@ class Session(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True)
     
     # Network identifiers
-    mac_address = models.CharField(max_length=17)
+    mac_address = MACAddressField()
     ip_address = models.GenericIPAddressField()
     
     # Session data
@@ -76,6 +98,92 @@ class Session(models.Model):
     def __str__(self):
         return f"Session {self.mac_address} ({self.status})"
 
+class SessionArchive(models.Model):
+    """
+    Archive table for closed sessions past the retention period.
+    """
+    
+    # Same fields as Session, without foreign keys so users can be deleted
+    original_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    device_id = models.BigIntegerField(null=True, blank=True)
+    mac_address = MACAddressField()
+    ip_address = models.GenericIPAddressField()
+    status = models.CharField(max_length=20, choices=Session.Status.choices)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField(null=True, blank=True)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    duration_seconds = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'access_session_archive'
+        default_permissions = ('add', 'view')  # No change or delete
+        indexes = [
+            models.Index(fields=['start_time']),
+            models.Index(fields=['user_id', 'start_time']),
+            models.Index(fields=['mac_address', 'start_time']),
+        ]
+
+    def __str__(self):
+        return f"Archived session {self.original_id} ({self.status})"
+
+class SessionSeries(models.Model):
+    """
+    Bandwidth time series of a closed session, packed by access.series.
+    """
+    
+    session_id = models.BigIntegerField(unique=True)
+    samples = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'access_session_series'
+
+    def __str__(self):
+        return f"Series of session {self.session_id}"
+
+class UsageRollup(models.Model):
+    """
+    Usage totals of one bucket, advanced by the accounting flush.
+    """
+    
+    bytes_uploaded = models.BigIntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    duration_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class UserDailyUsage(UsageRollup):
+    user_id = models.BigIntegerField()
+    day = models.DateField()
+
+    class Meta:
+        db_table = 'access_usage_user_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day'], name='access_usage_user_day_uniq'),
+        ]
+        indexes = [models.Index(fields=['day'])]
+
+class PlanDailyUsage(UsageRollup):
+    plan_id = models.BigIntegerField()
+    day = models.DateField()
+
+    class Meta:
+        db_table = 'access_usage_plan_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['plan_id', 'day'], name='access_usage_plan_day_uniq'),
+        ]
+        indexes = [models.Index(fields=['day'])]
+
+class HourlyUsage(UsageRollup):
+    hour = models.DateTimeField(unique=True)
+
+    class Meta:
+        db_table = 'access_usage_hourly'
+
 class Voucher(models.Model):
     class Status(models.TextChoices):
         ACTIVE = 'ACTIVE', 'Active'
@@ -104,6 +212,7 @@ class Voucher(models.Model):
         blank=True,
         related_name='assigned_vouchers'
     )
+    batch = models.UUIDField(null=True, blank=True, db_index=True)  # Set by bulk minting
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -124,7 +233,7 @@ class Voucher(models.Model):
     def generate_code():
         """Generate unique 8-character alphanumeric code"""
         while True:
-            code = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+            code = random_voucher_code()
             if not Voucher.objects.filter(code=code).exists():
                 return code
 
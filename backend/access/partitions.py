@@ -0,0 +1,180 @@
+"""
+Monthly range partitioning of ``access_session`` on ``start_time``.
+
+PostgreSQL only. The table is converted once with ``convert()``; after
+that ``ensure_partitions()`` creates upcoming months ahead of time and
+``drop_empty_partitions()`` removes months the retention job emptied.
+
+Partitioned tables require the partition key in every unique
+constraint, so the primary key becomes (id, start_time) and foreign keys
+pointing at ``access_session`` are dropped; Django still enforces the
+CASCADE of ``CaptiveBinding.session`` itself.
+"""
+import logging
+from datetime import date
+from django.db import connection, transaction
+from .models import Session
+
+logger = logging.getLogger(__name__)
+
+TABLE = Session._meta.db_table
+LEGACY_TABLE = f"{TABLE}_unpartitioned"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_INDEXES = [
+    ('mac_address', 'status'),
+    ('session_token',),
+    ('start_time', 'end_time'),
+    ('user_id',),
+    ('device_id',),
+]
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_{month:%Y%m}"
+
+
+def _check_backend():
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Session partitioning requires PostgreSQL')
+
+
+def is_partitioned():
+    _check_backend()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions():
+    """Return the names of the monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s) AND c.relname <> %s
+            ORDER BY c.relname
+            """,
+            [TABLE, DEFAULT_PARTITION],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _create_partition(cursor, month):
+    qn = connection.ops.quote_name
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {qn(partition_name(month))} "
+        f"PARTITION OF {qn(TABLE)} FOR VALUES FROM (%s) TO (%s)",
+        [month, _next_month(month)],
+    )
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Create the partitions of the current and next ``months_ahead`` months."""
+    _check_backend()
+    month = _month_start(today or date.today())
+    created = []
+    existing = set(partitions())
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            if partition_name(month) not in existing:
+                _create_partition(cursor, month)
+                created.append(partition_name(month))
+            month = _next_month(month)
+    return created
+
+
+def convert(months_ahead=3):
+    """
+    Convert ``access_session`` into a table partitioned by month.
+
+    Rows are copied into the new table in the same transaction, under an
+    exclusive lock; run it in a maintenance window.
+    """
+    _check_backend()
+    if is_partitioned():
+        return False
+
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(TABLE)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} RENAME TO {qn(LEGACY_TABLE)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(TABLE)} (LIKE {qn(LEGACY_TABLE)} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (start_time)"
+        )
+        # A plain sequence: identity columns on partitioned tables need PostgreSQL 17.
+        # The legacy table keeps its own id sequence (and name) until it is dropped
+        sequence = f"{TABLE}_part_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(TABLE)}.id")
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence])
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} ADD PRIMARY KEY (id, start_time)")
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} ADD UNIQUE (session_token, start_time)")
+        for columns in _INDEXES:
+            name = f"{TABLE}_{'_'.join(columns)}_part_idx"
+            cursor.execute(
+                f"CREATE INDEX {qn(name)} ON {qn(TABLE)} ({', '.join(qn(c) for c in columns)})"
+            )
+
+        cursor.execute(f"SELECT min(start_time) FROM {qn(LEGACY_TABLE)}")
+        oldest = cursor.fetchone()[0]
+        month = _month_start(oldest.date() if oldest else date.today())
+        last = _month_start(date.today())
+        while month <= last:
+            _create_partition(cursor, month)
+            month = _next_month(month)
+        cursor.execute(f"CREATE TABLE {qn(DEFAULT_PARTITION)} PARTITION OF {qn(TABLE)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {qn(TABLE)} SELECT * FROM {qn(LEGACY_TABLE)}")
+        cursor.execute(
+            f"SELECT setval(%s, COALESCE((SELECT max(id) FROM {qn(TABLE)}), 0) + 1, false)",
+            [sequence],
+        )
+
+        # Foreign keys cannot reference (id) alone anymore
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = to_regclass(%s)
+            """,
+            [LEGACY_TABLE],
+        )
+        for table, constraint in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {qn(constraint)}")
+
+        cursor.execute(f"DROP TABLE {qn(LEGACY_TABLE)}")
+        cursor.execute(f"ALTER SEQUENCE {qn(sequence)} RENAME TO {qn(f'{TABLE}_id_seq')}")
+
+    ensure_partitions(months_ahead)
+    logger.info(f"Converted {TABLE} to monthly partitions")
+    return True
+
+
+def drop_empty_partitions(before):
+    """Drop monthly partitions that end before ``before`` and hold no rows."""
+    _check_backend()
+    qn = connection.ops.quote_name
+    cutoff = partition_name(_month_start(before))
+    dropped = []
+    with connection.cursor() as cursor:
+        for name in partitions():
+            if name >= cutoff:
+                break
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {qn(name)})")
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+                dropped.append(name)
+    return dropped
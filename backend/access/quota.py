@@ -0,0 +1,336 @@
+"""
+Incremental quota enforcement.
+
+Per-subscription usage totals live in a Redis hash and are advanced by
+the accounting deltas as they arrive, so enforcing a quota never sums
+``access_session``. Each threshold crossing is recorded in the same hash
+with HSETNX, which makes it fire exactly once per subscription period;
+only an admin clears it (``clear_crossings``) before the period ends.
+Callers must only pass deltas of trusted reports (signed gateway, matching
+session token or RADIUS accounting).
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+from django_redis import get_redis_connection
+from audit.utils import audit_quota_violation
+from billing.models import Subscription
+from notifications.models import Event
+from .accounting import FLUSHING_KEY, PENDING_KEY
+from .models import Session
+from .sessions import close_sessions
+
+logger = logging.getLogger(__name__)
+
+LIMITS_CACHE_PREFIX = 'access:quota:limits'
+USAGE_KEY_PREFIX = 'access:quota:usage'
+
+DATA = 'data'
+TIME = 'time'
+EXCEEDED = 100
+
+# Returns -1 when the totals were never seeded, otherwise the list of
+# "<quota>:<threshold>" crossings that fired for the first time.
+_APPLY_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'seeded') == 0 then
+    return -1
+end
+local bytes = redis.call('HINCRBY', KEYS[1], 'bytes', ARGV[1])
+local seconds = redis.call('HINCRBY', KEYS[1], 'seconds', ARGV[2])
+local usage = {data = bytes, time = seconds}
+local limits = {data = tonumber(ARGV[3]), time = tonumber(ARGV[4])}
+local crossed = {}
+for _, quota in ipairs({'data', 'time'}) do
+    local limit = limits[quota]
+    if limit > 0 then
+        for i = 5, #ARGV do
+            local threshold = tonumber(ARGV[i])
+            if usage[quota] * 100 >= limit * threshold then
+                local flag = 'fired:' .. quota .. ':' .. threshold
+                if redis.call('HSETNX', KEYS[1], flag, 1) == 1 then
+                    table.insert(crossed, quota .. ':' .. threshold)
+                end
+            end
+        end
+    end
+end
+return crossed
+"""
+
+
+def _usage_key(subscription_id):
+    return f"{USAGE_KEY_PREFIX}:{subscription_id}"
+
+
+def _thresholds():
+    return sorted({
+        settings.PORTAL_CONFIG['QUOTA_WARNING_THRESHOLD'],
+        settings.PORTAL_CONFIG['QUOTA_CRITICAL_THRESHOLD'],
+        EXCEEDED,
+    })
+
+
+def get_limits(user_ids):
+    """
+    Return quota limits of the active subscription of each user.
+
+    Users without an active subscription are left out. A quota of 0 in the
+    plan means unlimited.
+    """
+    keys = {f"{LIMITS_CACHE_PREFIX}:{user_id}": user_id for user_id in user_ids}
+    cached = cache.get_many(list(keys))
+    limits = {keys[key]: value for key, value in cached.items()}
+
+    missing = set(user_ids) - limits.keys()
+    if missing:
+        now = timezone.now()
+        subscriptions = (
+            Subscription.objects
+            .filter(
+                user_id__in=missing,
+                status=Subscription.Status.ACTIVE,
+                start_date__lte=now,
+                end_date__gt=now,
+            )
+            .select_related('plan')
+            .order_by('start_date')
+        )
+        fresh = {}
+        for subscription in subscriptions:
+            plan = subscription.plan
+            fresh[subscription.user_id] = {
+                'subscription_id': subscription.id,
+                'start': subscription.start_date.timestamp(),
+                'end': subscription.end_date.timestamp(),
+                'data_bytes': plan.data_quota_gb * 1024 ** 3,
+                'time_seconds': plan.time_quota_hours * 3600,
+                'max_devices': plan.max_devices,
+            }
+        # Remember users without subscription too, to avoid querying again
+        for user_id in missing:
+            cache.set(
+                f"{LIMITS_CACHE_PREFIX}:{user_id}",
+                fresh.get(user_id),
+                timeout=settings.PORTAL_CONFIG['QUOTA_LIMITS_CACHE_TTL'],
+            )
+        limits.update(fresh)
+
+    return {user_id: value for user_id, value in limits.items() if value}
+
+
+def invalidate_limits(user_ids):
+    """Forget cached limits, e.g. after a subscription change."""
+    cache.delete_many([f"{LIMITS_CACHE_PREFIX}:{user_id}" for user_id in user_ids])
+
+
+def _period_usage(redis, user_id, limits):
+    """
+    Usage of the current period: access_session plus the deltas still
+    waiting in Redis for the next accounting flush.
+    """
+    start = datetime.fromtimestamp(limits['start'], tz=dt_timezone.utc)
+    sessions = Session.objects.filter(user_id=user_id, start_time__gte=start)
+    totals = sessions.aggregate(
+        bytes=Sum(F('bytes_uploaded') + F('bytes_downloaded')),
+        seconds=Sum('duration_seconds'),
+    )
+    used_bytes = totals['bytes'] or 0
+    used_seconds = totals['seconds'] or 0
+
+    fields = [
+        f"{session_id}:{counter}"
+        for session_id in sessions.values_list('id', flat=True)
+        for counter in ('down', 'up', 'sec')
+    ]
+    if fields:
+        pipe = redis.pipeline()
+        pipe.hmget(PENDING_KEY, fields)
+        pipe.hmget(FLUSHING_KEY, fields)
+        for values in pipe.execute():
+            for field, value in zip(fields, values):
+                if value is None:
+                    continue
+                if field.endswith(':sec'):
+                    used_seconds += int(value)
+                else:
+                    used_bytes += int(value)
+    return used_bytes, used_seconds
+
+
+def _seed_usage(redis, user_id, limits, in_flight=(0, 0)):
+    """
+    Initialise the running totals (once per period).
+
+    ``in_flight`` is the delta being applied: it is already pending in
+    Redis, and is left out so the script does not count it twice.
+    """
+    used_bytes, used_seconds = _period_usage(redis, user_id, limits)
+    key = _usage_key(limits['subscription_id'])
+    pipe = redis.pipeline()
+    pipe.hsetnx(key, 'bytes', max(used_bytes - in_flight[0], 0))
+    pipe.hsetnx(key, 'seconds', max(used_seconds - in_flight[1], 0))
+    pipe.hset(key, 'seeded', 1)
+    pipe.expireat(key, int(limits['end']) + 86400)
+    pipe.execute()
+
+
+def apply_usage(deltas):
+    """
+    Advance running totals and enforce quotas.
+
+    Args:
+        deltas: iterable of (user_id, delta_bytes, delta_seconds)
+
+    Returns:
+        list of (user_id, quota, threshold) crossings that fired
+    """
+    per_user = {}
+    for user_id, delta_bytes, delta_seconds in deltas:
+        if user_id is None or (delta_bytes <= 0 and delta_seconds <= 0):
+            continue
+        totals = per_user.setdefault(user_id, [0, 0])
+        totals[0] += delta_bytes
+        totals[1] += delta_seconds
+    if not per_user:
+        return []
+
+    limits = get_limits(list(per_user))
+    redis = get_redis_connection('default')
+    script = redis.register_script(_APPLY_SCRIPT)
+    thresholds = _thresholds()
+
+    crossings = []
+    for user_id, (delta_bytes, delta_seconds) in per_user.items():
+        user_limits = limits.get(user_id)
+        if not user_limits:
+            continue
+        keys = [_usage_key(user_limits['subscription_id'])]
+        args = [delta_bytes, delta_seconds, user_limits['data_bytes'], user_limits['time_seconds'], *thresholds]
+
+        crossed = script(keys=keys, args=args)
+        if crossed == -1:
+            _seed_usage(redis, user_id, user_limits, in_flight=(delta_bytes, delta_seconds))
+            crossed = script(keys=keys, args=args)
+
+        for crossing in crossed:
+            quota, threshold = crossing.decode().split(':')
+            crossings.append((user_id, quota, int(threshold)))
+
+    if crossings:
+        _handle_crossings(crossings, limits)
+    return crossings
+
+
+def get_usage(user_id):
+    """Return running totals and limits for a user, None without subscription."""
+    user_limits = get_limits([user_id]).get(user_id)
+    if not user_limits:
+        return None
+    usage = get_redis_connection('default').hmget(
+        _usage_key(user_limits['subscription_id']), 'bytes', 'seconds'
+    )
+    return {
+        'bytes': int(usage[0] or 0),
+        'seconds': int(usage[1] or 0),
+        **user_limits,
+    }
+
+
+def is_exceeded(user_id):
+    """Check whether any quota of the user's current period is exhausted."""
+    user_limits = get_limits([user_id]).get(user_id)
+    if not user_limits:
+        return False
+    flags = get_redis_connection('default').hmget(
+        _usage_key(user_limits['subscription_id']),
+        f'fired:{DATA}:{EXCEEDED}',
+        f'fired:{TIME}:{EXCEEDED}',
+    )
+    return any(flags)
+
+
+def clear_crossings(user_id, reset=False):
+    """
+    Clear the threshold crossings of the user's current period.
+
+    By default the totals are recomputed from the accounting and only the
+    crossings they no longer reach are cleared, which undoes a crossing
+    caused by bad reports. With ``reset`` the totals restart from zero and
+    every crossing is cleared, granting a fresh allowance for the rest of
+    the period.
+
+    Returns:
+        the new usage (see ``get_usage``), None without subscription
+    """
+    user_limits = get_limits([user_id]).get(user_id)
+    if not user_limits:
+        return None
+    redis = get_redis_connection('default')
+    key = _usage_key(user_limits['subscription_id'])
+    used_bytes, used_seconds = (0, 0) if reset else _period_usage(redis, user_id, user_limits)
+
+    stale = []
+    for quota, used, limit in (
+        (DATA, used_bytes, user_limits['data_bytes']),
+        (TIME, used_seconds, user_limits['time_seconds']),
+    ):
+        for threshold in _thresholds():
+            if not limit or used * 100 < limit * threshold:
+                stale.append(f'fired:{quota}:{threshold}')
+
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping={'bytes': used_bytes, 'seconds': used_seconds, 'seeded': 1})
+    if stale:
+        pipe.hdel(key, *stale)
+    pipe.expireat(key, int(user_limits['end']) + 86400)
+    pipe.execute()
+    return get_usage(user_id)
+
+
+def _handle_crossings(crossings, limits):
+    """Notify on warnings; cut off sessions when a quota is exhausted."""
+    users = get_user_model().objects.in_bulk({user_id for user_id, _, _ in crossings})
+    events = []
+    exceeded = set()
+
+    for user_id, quota, threshold in crossings:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        usage = get_usage(user_id)
+        limit = limits[user_id]['data_bytes' if quota == DATA else 'time_seconds']
+        used = usage['bytes' if quota == DATA else 'seconds']
+        payload = {'quota_type': quota, 'threshold': threshold, 'usage': used, 'limit': limit}
+
+        if threshold >= EXCEEDED:
+            exceeded.add(user_id)
+            audit_quota_violation(user, quota, used, limit)
+            events.append(Event(
+                event_type=Event.EventType.QUOTA_EXCEEDED,
+                user=user,
+                title='Quota exceeded',
+                message=f"Your {quota} quota is exhausted; network access has been suspended.",
+                payload=payload,
+            ))
+        else:
+            events.append(Event(
+                event_type=Event.EventType.QUOTA_WARNING,
+                user=user,
+                title='Quota warning',
+                message=f"You have used {threshold}% of your {quota} quota.",
+                payload=payload,
+            ))
+
+    if events:
+        Event.objects.bulk_create(events)
+
+    if exceeded:
+        session_ids = Session.objects.filter(
+            user_id__in=exceeded, status=Session.Status.AUTHORIZED
+        ).values_list('id', flat=True)
+        closed = close_sessions(session_ids, status=Session.Status.QUOTA_EXCEEDED)
+        logger.info(f"Quota exceeded for {len(exceeded)} users, closed {len(closed)} sessions")
@@ -0,0 +1,233 @@
+"""
+Usage rollups for dashboards.
+
+The accounting flush adds each batch of deltas to three rollup tables
+(user per day, plan per day, hour) with INSERT ... ON CONFLICT, inside
+the transaction that updates ``access_session``. Deltas are attributed
+to the flush time. Dashboards read the rollups only; ``rebuild`` seeds
+them from session history once.
+"""
+import logging
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractHour, TruncDate, TruncHour
+from django.utils import timezone
+from billing.models import Plan, Subscription
+from .models import HourlyUsage, PlanDailyUsage, Session, SessionArchive, UserDailyUsage
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ['bytes_downloaded', 'bytes_uploaded', 'duration_seconds']
+
+_UPSERT_SQL = """
+INSERT INTO {table} ({keys}, bytes_downloaded, bytes_uploaded, duration_seconds)
+VALUES {values}
+ON CONFLICT ({keys}) DO UPDATE
+SET bytes_downloaded = {table}.bytes_downloaded + EXCLUDED.bytes_downloaded,
+    bytes_uploaded = {table}.bytes_uploaded + EXCLUDED.bytes_uploaded,
+    duration_seconds = {table}.duration_seconds + EXCLUDED.duration_seconds
+"""
+
+
+def _upsert(cursor, model, keys, rows):
+    """Add {key tuple: [down, up, sec]} to the rollup rows of ``model``."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    placeholders = '(' + ', '.join(['%s'] * (len(keys) + 3)) + ')'
+    fields = [model._meta.get_field(key) for key in keys]
+    params = []
+    for key, totals in rows.items():
+        params.extend(field.get_db_prep_save(value, connection) for field, value in zip(fields, key))
+        params.extend(totals)
+    cursor.execute(
+        _UPSERT_SQL.format(
+            table=qn(model._meta.db_table),
+            keys=', '.join(qn(key) for key in keys),
+            values=', '.join([placeholders] * len(rows)),
+        ),
+        params,
+    )
+
+
+def _add(rows, key, totals):
+    current = rows.setdefault(key, [0, 0, 0])
+    for i, value in enumerate(totals):
+        current[i] += value
+
+
+def _active_plans(user_ids, when):
+    """Plan of the active subscription of each user at ``when``."""
+    subscriptions = (
+        Subscription.objects
+        .filter(
+            user_id__in=user_ids,
+            status=Subscription.Status.ACTIVE,
+            start_date__lte=when,
+            end_date__gt=when,
+        )
+        .order_by('start_date')
+        .values_list('user_id', 'plan_id')
+    )
+    return dict(subscriptions)
+
+
+def record_usage(deltas, owners, now=None):
+    """
+    Add flushed usage deltas to the rollups.
+
+    Args:
+        deltas: {session_id: (down, up, sec)}
+        owners: {session_id: user_id} of the sessions that were updated;
+            sessions of anonymous (voucher) clients have no user
+        now: time the deltas are attributed to
+    """
+    now = timezone.localtime(now or timezone.now())
+    day = now.date()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+
+    per_user = {}
+    total = [0, 0, 0]
+    for session_id, user_id in owners.items():
+        totals = deltas[session_id]
+        total = [a + b for a, b in zip(total, totals)]
+        if user_id is not None:
+            _add(per_user, user_id, totals)
+    if not any(total):
+        return
+
+    plans = _active_plans(list(per_user), now)
+    per_plan = {}
+    for user_id, totals in per_user.items():
+        if user_id in plans:
+            _add(per_plan, (plans[user_id], day), totals)
+
+    with connection.cursor() as cursor:
+        _upsert(cursor, UserDailyUsage, ['user_id', 'day'], {
+            (user_id, day): totals for user_id, totals in per_user.items()
+        })
+        _upsert(cursor, PlanDailyUsage, ['plan_id', 'day'], per_plan)
+        _upsert(cursor, HourlyUsage, ['hour'], {(hour,): total})
+
+
+def _session_totals(model, start, group):
+    return (
+        model.objects
+        .filter(start_time__gte=start)
+        .annotate(bucket=group)
+        .values('user_id', 'bucket')
+        .annotate(**{counter: Sum(counter) for counter in COUNTERS})
+    )
+
+
+def rebuild(start):
+    """
+    Recompute the rollups from sessions started since ``start``.
+
+    Used to seed the tables from history: usage is attributed to the
+    start of each session, and to the plan subscribed to on that day.
+    Existing rollup rows from ``start`` on are replaced.
+
+    Returns:
+        int: number of user-day rows written
+    """
+    start = timezone.localtime(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = start.date()
+
+    per_user = {}
+    per_hour = {}
+    for model in (Session, SessionArchive):
+        for row in _session_totals(model, start, TruncDate('start_time')):
+            if row['user_id'] is not None:
+                _add(per_user, (row['user_id'], row['bucket']), [row[c] or 0 for c in COUNTERS])
+        for row in _session_totals(model, start, TruncHour('start_time')):
+            _add(per_hour, (row['bucket'],), [row[c] or 0 for c in COUNTERS])
+
+    subscriptions = {}
+    for user_id, plan_id, begins, ends in (
+        Subscription.objects
+        .filter(user_id__in={user_id for user_id, _ in per_user}, end_date__gt=start)
+        .exclude(status=Subscription.Status.PENDING)
+        .values_list('user_id', 'plan_id', 'start_date', 'end_date')
+    ):
+        subscriptions.setdefault(user_id, []).append(
+            (plan_id, timezone.localtime(begins).date(), timezone.localtime(ends).date())
+        )
+    per_plan = {}
+    for (user_id, day), totals in per_user.items():
+        for plan_id, begins, ends in subscriptions.get(user_id, []):
+            if begins <= day <= ends:
+                _add(per_plan, (plan_id, day), totals)
+                break
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        UserDailyUsage.objects.filter(day__gte=first_day).delete()
+        PlanDailyUsage.objects.filter(day__gte=first_day).delete()
+        HourlyUsage.objects.filter(hour__gte=start).delete()
+        _upsert(cursor, UserDailyUsage, ['user_id', 'day'], per_user)
+        _upsert(cursor, PlanDailyUsage, ['plan_id', 'day'], per_plan)
+        _upsert(cursor, HourlyUsage, ['hour'], per_hour)
+
+    logger.info(f"Rebuilt usage rollups since {first_day}: {len(per_user)} user-days")
+    return len(per_user)
+
+
+def _totals():
+    return {counter: Sum(counter) for counter in COUNTERS}
+
+
+def _row(row, **extra):
+    data = {**extra, **{counter: row[counter] or 0 for counter in COUNTERS}}
+    data['bytes_total'] = data['bytes_downloaded'] + data['bytes_uploaded']
+    return data
+
+
+def usage_by_day(start, end, user_id=None):
+    """Daily totals in [start, end], for one user or all users."""
+    rows = UserDailyUsage.objects.filter(day__gte=start, day__lte=end)
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    rows = rows.values('day').annotate(**_totals()).order_by('day')
+    return [_row(row, day=row['day']) for row in rows]
+
+
+def usage_by_user(start, end, limit=50):
+    """Top users by traffic in [start, end]."""
+    rows = (
+        UserDailyUsage.objects
+        .filter(day__gte=start, day__lte=end)
+        .values('user_id')
+        .annotate(traffic=Sum(F('bytes_downloaded') + F('bytes_uploaded')))
+        .annotate(**_totals())
+        .order_by('-traffic')[:limit]
+    )
+    return [_row(row, user_id=row['user_id']) for row in rows]
+
+
+def usage_by_plan(start, end):
+    """Totals per plan in [start, end]."""
+    rows = (
+        PlanDailyUsage.objects
+        .filter(day__gte=start, day__lte=end)
+        .values('plan_id')
+        .annotate(**_totals())
+        .order_by('plan_id')
+    )
+    names = dict(Plan.objects.filter(id__in=[row['plan_id'] for row in rows]).values_list('id', 'name'))
+    return [
+        _row(row, plan_id=row['plan_id'], plan_name=names.get(row['plan_id']))
+        for row in rows
+    ]
+
+
+def usage_by_hour_of_day(start, end):
+    """Totals per hour of the day (0-23, local time) in [start, end]."""
+    rows = (
+        HourlyUsage.objects
+        .filter(hour__date__gte=start, hour__date__lte=end)
+        .annotate(hour_of_day=ExtractHour('hour'))
+        .values('hour_of_day')
+        .annotate(**_totals())
+        .order_by('hour_of_day')
+    )
+    return [_row(row, hour=row['hour_of_day']) for row in rows]
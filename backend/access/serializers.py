@@ -0,0 +1,21 @@
+"""
+Serializers for access control.
+"""
+from rest_framework import serializers
+from .models import Session
+from .sessions import session_expiry
+
+
+class PortalSessionSerializer(serializers.ModelSerializer):
+    """Session returned to a client after portal login."""
+    
+    token = serializers.CharField(source='session_token', read_only=True)
+    expires_at = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Session
+        fields = ['id', 'token', 'status', 'start_time', 'expires_at']
+        read_only_fields = fields
+    
+    def get_expires_at(self, obj):
+        return serializers.DateTimeField().to_representation(session_expiry(obj.start_time))
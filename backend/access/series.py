@@ -0,0 +1,238 @@
+"""
+Per-session bandwidth time series.
+
+Each active session has one Redis string holding fixed-size ring buffers
+of 20-byte slots (bucket start as u32, downloaded and uploaded bytes as
+i64, big-endian), one ring per resolution. Every accounting delta is
+spread evenly over the buckets of the interval it covers and added to
+all rings with BITFIELD, so the coarser rings are the downsampled views
+of the finer ones and nothing needs compacting. A report without traffic
+still claims its buckets with zero counters, so a slot holding the
+expected bucket means the gateway reported for it.
+
+When a session closes its filled slots are packed into one
+``SessionSeries`` blob and the Redis string is dropped.
+"""
+import logging
+import struct
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from .models import SessionSeries
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'access:series'
+
+# (seconds per bucket, number of slots): 1 hour at 10 s, 4 hours at
+# 1 min, 24 hours at 15 min
+TIERS = [(10, 360), (60, 240), (900, 96)]
+
+SLOT = struct.Struct('>Iqq')
+TIER_HEADER = struct.Struct('>HH')
+
+# First slot of each ring in the string
+_OFFSETS = [sum(size for _, size in TIERS[:i]) for i in range(len(TIERS))]
+
+# ARGV: ttl, then (key index, timestamp, elapsed seconds, downloaded,
+# uploaded) per sample. The delta covers (timestamp - elapsed, timestamp]
+# and each bucket gets the share of the seconds it overlaps, possibly zero;
+# buckets older than a ring are left out of it. A slot still holding an
+# older bucket is overwritten; a bucket older than the one in its slot is
+# dropped.
+_RECORD_SCRIPT = """
+local tiers = {%s}
+-- Share of a delta over [start, start + elapsed] falling in [from, upto];
+-- the shares of consecutive buckets add up to the whole delta
+local function share(total, start, elapsed, from, upto)
+    if elapsed == 0 then return total end
+    return math.floor(total * (upto - start) / elapsed) - math.floor(total * (from - start) / elapsed)
+end
+for i = 2, #ARGV, 5 do
+    local key = KEYS[tonumber(ARGV[i])]
+    local ts = tonumber(ARGV[i + 1])
+    local elapsed = tonumber(ARGV[i + 2])
+    local down = tonumber(ARGV[i + 3])
+    local up = tonumber(ARGV[i + 4])
+    local start = ts - elapsed
+    for _, tier in ipairs(tiers) do
+        local step, size, first = tier[1], tier[2], tier[3]
+        local last = ts - ts %% step
+        local oldest = math.max(start - start %% step, last - (size - 1) * step)
+        for bucket = oldest, last, step do
+            local from = math.max(bucket, start)
+            local upto = math.min(bucket + step, ts)
+            local d_down = share(down, start, elapsed, from, upto)
+            local d_up = share(up, start, elapsed, from, upto)
+            local base = (first + (bucket / step) %% size) * %d
+            local current = redis.call('BITFIELD', key, 'GET', 'u32', base)[1]
+            d_down, d_up = string.format('%%.0f', d_down), string.format('%%.0f', d_up)
+            if current < bucket then
+                redis.call('BITFIELD', key, 'SET', 'u32', base, bucket, 'SET', 'i64', base + 32, d_down, 'SET', 'i64', base + 96, d_up)
+            elseif current == bucket and (d_down ~= '0' or d_up ~= '0') then
+                redis.call('BITFIELD', key, 'INCRBY', 'i64', base + 32, d_down, 'INCRBY', 'i64', base + 96, d_up)
+            end
+        end
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[1])
+end
+return #KEYS
+""" % (
+    ', '.join(f'{{{step}, {size}, {first}}}' for (step, size), first in zip(TIERS, _OFFSETS)),
+    SLOT.size * 8,
+)
+
+
+def ring_key(session_id):
+    return f"{KEY_PREFIX}:{session_id}"
+
+
+def slot_ranges(step, first_bucket, count):
+    """
+    Byte ranges of the ring slots holding ``count`` consecutive buckets.
+
+    Returns:
+        list of inclusive (start, end) offsets for GETRANGE, in bucket
+        order; two ranges when the buckets wrap around the ring
+    """
+    index = [tier_step for tier_step, _ in TIERS].index(step)
+    size, first = TIERS[index][1], _OFFSETS[index]
+    slot = (first_bucket // step) % size
+    ranges = []
+    while count > 0:
+        run = min(count, size - slot)
+        ranges.append(((first + slot) * SLOT.size, (first + slot + run) * SLOT.size - 1))
+        count -= run
+        slot = 0
+    return ranges
+
+
+def record_samples(samples):
+    """
+    Add usage deltas to the ring buffers of their sessions.
+
+    Args:
+        samples: iterable of (session_id, timestamp, delta_downloaded,
+            delta_uploaded, delta_seconds); the delta is spread over the
+            ``delta_seconds`` before ``timestamp``; a delta without
+            traffic marks its buckets as reported
+
+    Dropped reports (no traffic and no elapsed time) are ignored. Errors
+    are logged and swallowed: graphs must not fail a heartbeat.
+    """
+    keys = {}
+    args = [settings.PORTAL_CONFIG['SESSION_TIMEOUT'] + 3600]
+    for session_id, timestamp, downloaded, uploaded, seconds in samples:
+        if downloaded <= 0 and uploaded <= 0 and seconds <= 0:
+            continue
+        index = keys.setdefault(ring_key(session_id), len(keys) + 1)
+        args.extend([index, int(timestamp), max(int(seconds), 0), int(downloaded), int(uploaded)])
+    if not keys:
+        return
+
+    try:
+        redis = get_redis_connection('default')
+        redis.register_script(_RECORD_SCRIPT)(keys=list(keys), args=args)
+    except RedisError as e:
+        logger.warning(f"Could not record session bandwidth samples: {e}")
+
+
+def unpack_rings(raw):
+    """
+    Decode a Redis ring buffer string.
+
+    Returns:
+        dict: {step: [(timestamp, downloaded, uploaded), ...]} ordered by time
+    """
+    series = {}
+    for (step, size), first in zip(TIERS, _OFFSETS):
+        points = []
+        for slot in range(first, first + size):
+            start = slot * SLOT.size
+            if start + SLOT.size > len(raw):
+                break
+            point = SLOT.unpack_from(raw, start)
+            if point[0]:
+                points.append(point)
+        points.sort()
+        # Slots not overwritten since the ring last wrapped are stale
+        horizon = points[-1][0] - step * size if points else 0
+        series[step] = [point for point in points if point[0] > horizon]
+    return series
+
+
+def pack(series):
+    """Pack {step: points} as a header and the filled slots of each tier."""
+    chunks = []
+    for step, _ in TIERS:
+        points = series.get(step, [])
+        chunks.append(TIER_HEADER.pack(step, len(points)))
+        chunks.extend(SLOT.pack(*point) for point in points)
+    return b''.join(chunks)
+
+
+def unpack(blob):
+    """Inverse of ``pack``."""
+    blob = bytes(blob)
+    series = {}
+    offset = 0
+    while offset < len(blob):
+        step, count = TIER_HEADER.unpack_from(blob, offset)
+        offset += TIER_HEADER.size
+        series[step] = [SLOT.unpack_from(blob, offset + i * SLOT.size) for i in range(count)]
+        offset += count * SLOT.size
+    return series
+
+
+def persist(session_ids):
+    """
+    Store the ring buffers of closed sessions and drop them from Redis.
+
+    Returns:
+        int: number of series stored
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return 0
+
+    try:
+        redis = get_redis_connection('default')
+        raw = redis.mget([ring_key(session_id) for session_id in session_ids])
+    except RedisError as e:
+        logger.warning(f"Could not read session bandwidth series: {e}")
+        return 0
+
+    rows = [
+        SessionSeries(session_id=session_id, samples=pack(unpack_rings(data)))
+        for session_id, data in zip(session_ids, raw)
+        if data
+    ]
+    SessionSeries.objects.bulk_create(rows, ignore_conflicts=True)
+
+    try:
+        redis.delete(*[ring_key(session_id) for session_id in session_ids])
+    except RedisError as e:
+        logger.warning(f"Could not drop session bandwidth series: {e}")
+    return len(rows)
+
+
+def get_series(session_id):
+    """
+    Bandwidth series of a session, live from Redis or from its blob.
+
+    Returns:
+        dict: {step: [(timestamp, downloaded, uploaded), ...]}, empty
+        when nothing was recorded
+    """
+    try:
+        raw = get_redis_connection('default').get(ring_key(session_id))
+    except RedisError as e:
+        logger.warning(f"Could not read session bandwidth series: {e}")
+        raw = None
+    if raw:
+        return unpack_rings(raw)
+
+    stored = SessionSeries.objects.filter(session_id=session_id).values_list('samples', flat=True).first()
+    return unpack(stored) if stored is not None else {}
@@ -0,0 +1,71 @@
+"""
+Bulk session lifecycle helpers.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .accounting import forget_sessions
+from .models import Session
+from .series import persist as persist_series
+from .signals import sessions_closed
+
+
+def session_expiry(start_time):
+    """Deadline of a session started at ``start_time``."""
+    return start_time + timedelta(seconds=settings.PORTAL_CONFIG['SESSION_TIMEOUT'])
+
+
+def close_sessions(session_ids, status=Session.Status.EXPIRED):
+    """
+    Close authorized sessions in one UPDATE.
+
+    ``sessions_closed`` is sent with the sessions that were actually
+    closed so gateways, caches and counters can be updated in bulk.
+
+    Returns:
+        list of (id, mac_address, user_id) for the closed sessions
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return []
+
+    with transaction.atomic():
+        sessions = list(
+            Session.objects
+            .select_for_update()
+            .filter(id__in=session_ids, status=Session.Status.AUTHORIZED)
+            .values_list('id', 'mac_address', 'user_id')
+        )
+        if sessions:
+            Session.objects.filter(id__in=[s[0] for s in sessions]).update(
+                status=status,
+                end_time=timezone.now(),
+                updated_at=timezone.now(),
+            )
+
+    if sessions:
+        forget_sessions([s[0] for s in sessions])
+        persist_series([s[0] for s in sessions])
+        sessions_closed.send(sender=Session, sessions=sessions, status=status)
+    return sessions
+
+
+def open_session(mac, ip, user_id=None, device=None):
+    """
+    Start an authorized session for a client.
+
+    Sessions still open on the same MAC are closed first, so counters and
+    authorization decisions always refer to a single session.
+    """
+    stale = Session.objects.filter(
+        mac_address=mac, status=Session.Status.AUTHORIZED
+    ).values_list('id', flat=True)
+    close_sessions(stale, status=Session.Status.EXPIRED)
+    return Session.objects.create(
+        user_id=user_id,
+        device=device,
+        mac_address=mac,
+        ip_address=ip,
+        status=Session.Status.AUTHORIZED,
+    )
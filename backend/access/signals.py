@@ -0,0 +1,12 @@
+"""
+Signals sent by the access app.
+"""
+from django.dispatch import Signal
+
+# Sent after sessions were closed in bulk, bypassing post_save.
+# Arguments: sessions (list of (id, mac_address, user_id)), status
+sessions_closed = Signal()
+
+# Sent after vouchers were created with bulk_create, bypassing post_save.
+# Arguments: vouchers (list of (id, code, valid_until))
+vouchers_minted = Signal()
@@ -0,0 +1,48 @@
+"""
+Periodic access tasks.
+"""
+from celery import shared_task
+from django.conf import settings
+from django.db import connection
+from . import fingerprints, partitions
+from .accounting import flush_usage
+from .devices import reconcile
+from .history import archive_sessions, compress_archive, retention_horizon
+from .idle import close_idle_sessions
+
+
+@shared_task
+def flush_session_usage():
+    """Apply accumulated usage deltas to access_session."""
+    deltas = flush_usage(batch_size=settings.PORTAL_CONFIG['ACCOUNTING_FLUSH_BATCH'])
+    return len(deltas)
+
+
+@shared_task
+def reconcile_active_devices():
+    """Rebuild the active-device sets from access_session."""
+    return reconcile()
+
+
+@shared_task
+def expire_idle_sessions():
+    """Close authorized sessions without traffic over the idle window."""
+    closed, _ = close_idle_sessions()
+    return closed
+
+
+@shared_task
+def archive_old_sessions():
+    """Archive sessions past retention, compress old archive months and maintain the partitions."""
+    archived = archive_sessions()
+    compress_archive()
+    if connection.vendor == 'postgresql' and partitions.is_partitioned():
+        partitions.ensure_partitions()
+        partitions.drop_empty_partitions(retention_horizon().date())
+    return archived
+
+
+@shared_task
+def collect_device_aliases():
+    """Forget MAC aliases of devices not seen over the retention."""
+    return fingerprints.collect_aliases()
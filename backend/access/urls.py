@@ -1,5 +1,15 @@
 from django.urls import path
+from . import views
 
 urlpatterns = [
-    # Access control endpoints will be added here
+    path('vouchers/', views.voucher_create, name='access_voucher_create'),
+    path('vouchers/batches/<uuid:batch>/export.csv', views.voucher_batch_csv, name='access_voucher_batch_csv'),
+    path('vouchers/batches/<uuid:batch>/print/', views.voucher_batch_print, name='access_voucher_batch_print'),
+    path('sessions/<int:session_id>/series/', views.session_series, name='access_session_series'),
+    path('usage/daily/', views.usage_daily, name='access_usage_daily'),
+    path('usage/users/', views.usage_top_users, name='access_usage_users'),
+    path('usage/plans/', views.usage_plans, name='access_usage_plans'),
+    path('usage/hours/', views.usage_hours, name='access_usage_hours'),
+    path('usage/users/<int:user_id>/quota/reset/', views.quota_reset, name='access_quota_reset'),
+    path('vouchers/<str:code>/use/', views.voucher_use, name='access_voucher_use'),
 ]
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Helpers shared by the access control modules.
+"""
+import re
+import secrets
+import string
+
+VOUCHER_CODE_ALPHABET = string.ascii_uppercase + string.digits
+
+_MAC_HEX_RE = re.compile(r'[^0-9A-Fa-f]')
+
+
+def normalize_mac(value):
+    """
+    Normalize a MAC address to the canonical AA:BB:CC:DD:EE:FF form.
+
+    Accepts the formats gateways commonly send (colons, dashes, dots or
+    bare hex). Returns None when the value is not a valid 48-bit address.
+    """
+    if not value:
+        return None
+    digits = _MAC_HEX_RE.sub('', str(value))
+    if len(digits) != 12:
+        return None
+    digits = digits.upper()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def random_voucher_code(length=8):
+    """Draw a random voucher code; uniqueness is checked by the caller."""
+    return ''.join(secrets.choice(VOUCHER_CODE_ALPHABET) for _ in range(length))
+
+
+def mac_to_int(value):
+    """Convert a MAC address in any accepted format to its 48-bit integer."""
+    mac = normalize_mac(value)
+    if mac is None:
+        raise ValueError(f"Invalid MAC address: {value!r}")
+    return int(mac.replace(':', ''), 16)
+
+
+def int_to_mac(value):
+    """Convert a 48-bit integer to the canonical AA:BB:CC:DD:EE:FF form."""
+    digits = f"{value:012X}"
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
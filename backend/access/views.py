@@ -0,0 +1,287 @@
+"""
+Views for access control.
+"""
+from datetime import timedelta
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.contrib.auth import get_user_model
+from accounts.permissions import IsAdmin
+from audit.utils import audit_admin_action, get_client_ip
+from billing.models import Plan
+from . import quota, rollups, series
+from .export import csv_lines, print_pages
+from .models import Session, Voucher
+from .serializers import PortalSessionSerializer
+from .utils import normalize_mac
+from .vouchers import VoucherError, guess_limited, mint_vouchers, use_voucher
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def voucher_use(request, code):
+    """Redeem a voucher for a client (called by the portal)."""
+    mac = normalize_mac(request.data.get('mac'))
+    ip = request.data.get('ip')
+    
+    if not mac or not ip:
+        return Response({'error': 'MAC and IP required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if guess_limited(request):
+        return Response(
+            {'error': 'Too many invalid voucher codes, try again later'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+    
+    try:
+        session, redemption = use_voucher(code, mac, ip)
+    except VoucherError as e:
+        guess_limited(request, increment=True)
+        return Response(
+            {'error': {'code': e.code, 'message': str(e)}},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    return Response({
+        'status': 'success',
+        'session': PortalSessionSerializer(session).data,
+        'voucher': {
+            'used_count': redemption['used_count'],
+            'max_uses': redemption['max_uses'],
+            'valid_until': redemption['valid_until'],
+        },
+    })
+
+
+def _batch_exists(batch):
+    return Voucher.objects.filter(batch=batch).exists()
+
+
+def _voucher_datetime(value):
+    """Parse an ISO 8601 datetime, naive values being local time; None if invalid."""
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def voucher_create(request):
+    """Mint a batch of vouchers for a plan."""
+    plan_id = str(request.data.get('plan_id', ''))
+    plan = Plan.objects.filter(id=plan_id, is_active=True).first() if plan_id.isdigit() else None
+    if not plan:
+        return Response({'error': 'Unknown plan'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    limit = settings.PORTAL_CONFIG['VOUCHER_MINT_MAX']
+    quantity = request.data.get('quantity')
+    max_uses = request.data.get('max_uses', 1)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or not 0 < quantity <= limit:
+        return Response({'error': f'quantity must be between 1 and {limit}'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(max_uses, int) or isinstance(max_uses, bool) or max_uses < 1:
+        return Response({'error': 'max_uses must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    valid_from = _voucher_datetime(request.data['valid_from']) if request.data.get('valid_from') else timezone.now()
+    valid_until = _voucher_datetime(request.data.get('valid_until'))
+    if not valid_from or not valid_until or valid_until <= valid_from:
+        return Response(
+            {'error': 'valid_until is required and must follow valid_from (ISO 8601)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    batch, vouchers = mint_vouchers(plan, quantity, request.user, valid_from, valid_until, max_uses=max_uses)
+    return Response({
+        'batch': batch,
+        'count': len(vouchers),
+        'plan': plan.code,
+        'max_uses': max_uses,
+        'valid_from': valid_from,
+        'valid_until': valid_until,
+        'export_csv': request.build_absolute_uri(reverse('access_voucher_batch_csv', args=[batch])),
+        'print': request.build_absolute_uri(reverse('access_voucher_batch_print', args=[batch])),
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def voucher_batch_csv(request, batch):
+    """Stream a voucher batch as CSV."""
+    if not _batch_exists(batch):
+        return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    response = StreamingHttpResponse(csv_lines(batch), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="vouchers-{batch}.csv"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def voucher_batch_print(request, batch):
+    """Stream a printable sheet of a voucher batch."""
+    if not _batch_exists(batch):
+        return Response({'error': 'Batch not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        per_page = min(max(int(request.query_params.get('per_page', 30)), 1), 100)
+    except ValueError:
+        return Response({'error': 'per_page must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return StreamingHttpResponse(print_pages(batch, per_page), content_type='text/html; charset=utf-8')
+
+
+def _usage_range(request):
+    """Parse ``start``/``end`` (YYYY-MM-DD, inclusive); last 30 days by default."""
+    end = request.query_params.get('end')
+    start = request.query_params.get('start')
+    try:
+        # parse_date returns None for malformed input, raises for impossible dates
+        end = parse_date(end) if end else timezone.localdate()
+        if end is None:
+            return None
+        start = parse_date(start) if start else end - timedelta(days=29)
+    except ValueError:
+        return None
+    if not start or start > end:
+        return None
+    if (end - start).days > 366:
+        return None
+    return start, end
+
+
+def _range_error():
+    return Response(
+        {'error': 'Invalid date range (YYYY-MM-DD, at most 366 days)'},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def usage_daily(request):
+    """Daily usage from the rollups; admins may see everyone or one user."""
+    period = _usage_range(request)
+    if not period:
+        return _range_error()
+    
+    user_id = request.user.id
+    if request.user.is_admin:
+        user_id = request.query_params.get('user') or None
+        if user_id is not None and not user_id.isdigit():
+            return Response({'error': 'user must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'start': period[0],
+        'end': period[1],
+        'results': rollups.usage_by_day(*period, user_id=user_id),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def usage_top_users(request):
+    """Users with the most traffic over the period."""
+    period = _usage_range(request)
+    if not period:
+        return _range_error()
+    
+    return Response({
+        'start': period[0],
+        'end': period[1],
+        'results': rollups.usage_by_user(*period),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def usage_plans(request):
+    """Usage per plan over the period."""
+    period = _usage_range(request)
+    if not period:
+        return _range_error()
+    
+    return Response({
+        'start': period[0],
+        'end': period[1],
+        'results': rollups.usage_by_plan(*period),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def usage_hours(request):
+    """Usage per hour of the day over the period."""
+    period = _usage_range(request)
+    if not period:
+        return _range_error()
+    
+    return Response({
+        'start': period[0],
+        'end': period[1],
+        'results': rollups.usage_by_hour_of_day(*period),
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def quota_reset(request, user_id):
+    """Clear the quota crossings of a user's current period."""
+    user = get_user_model().objects.filter(id=user_id).first()
+    if not user:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    reset = request.data.get('reset', False)
+    if not isinstance(reset, bool):
+        return Response({'error': 'reset must be a boolean'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    usage = quota.clear_crossings(user.id, reset=reset)
+    if usage is None:
+        return Response({'error': 'No active subscription'}, status=status.HTTP_404_NOT_FOUND)
+    
+    audit_admin_action(
+        request.user,
+        'QUOTA_RESET',
+        user,
+        metadata={'reset': reset, 'bytes': usage['bytes'], 'seconds': usage['seconds']},
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+    )
+    return Response({
+        'user_id': user.id,
+        'bytes': usage['bytes'],
+        'seconds': usage['seconds'],
+        'data_bytes': usage['data_bytes'],
+        'time_seconds': usage['time_seconds'],
+        'exceeded': quota.is_exceeded(user.id),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def session_series(request, session_id):
+    """Bandwidth time series of a session (owner or admin)."""
+    session = Session.objects.filter(id=session_id).values('user_id').first()
+    if not session or (session['user_id'] != request.user.id and not request.user.is_admin):
+        return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    step = request.query_params.get('step')
+    tiers = series.get_series(session_id)
+    if step:
+        tiers = {key: points for key, points in tiers.items() if str(key) == step}
+    
+    return Response({
+        'session_id': session_id,
+        'tiers': [
+            {'step': key, 'points': [list(point) for point in points]}
+            for key, points in sorted(tiers.items())
+        ],
+    })
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+Bulk voucher minting and atomic redemption.
+
+Codes are drawn in batches; collisions with existing vouchers are found
+with one ``code__in`` query per batch and the survivors are inserted with
+``bulk_create``, instead of one existence query and one INSERT per code.
+
+Redemption is a single conditional UPDATE, so concurrent guests can never
+use a voucher more than ``max_uses`` times. Multi-use vouchers keep a
+remaining-uses counter in Redis that rejects redemptions of sold-out
+codes before they reach the database, and unknown codes are refused by
+the negative-lookup filter (see ``access.codefilter``).
+"""
+import logging
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from django_ratelimit.core import get_usage
+from audit.utils import create_audit_log
+from . import codefilter
+from .models import Voucher
+from .sessions import open_session
+from .signals import vouchers_minted
+from .utils import normalize_mac, random_voucher_code
+
+logger = logging.getLogger(__name__)
+
+CODE_LENGTH = Voucher._meta.get_field('code').max_length
+
+REMAINING_KEY_PREFIX = 'access:voucher:remaining'
+
+VOUCHER_INVALID = 'VOUCHER_INVALID'
+VOUCHER_EXPIRED = 'VOUCHER_EXPIRED'
+VOUCHER_EXHAUSTED = 'VOUCHER_EXHAUSTED'
+
+# In SET, used_count refers to the value before the update
+_REDEEM_SQL = """
+UPDATE {table}
+SET used_count = used_count + 1,
+    status = CASE WHEN used_count + 1 >= max_uses THEN %s ELSE status END,
+    updated_at = %s
+WHERE code = %s
+  AND status = %s
+  AND used_count < max_uses
+  AND valid_from <= %s
+  AND valid_until > %s
+RETURNING id, plan_id, assigned_to_id, used_count, max_uses, valid_until
+"""
+
+class VoucherError(Exception):
+    """Raised when a voucher cannot be redeemed; ``code`` is the API error code."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def _candidate_codes(count, exclude):
+    """Draw ``count`` distinct codes that are not in ``exclude``."""
+    codes = set()
+    while len(codes) < count:
+        code = random_voucher_code(CODE_LENGTH)
+        if code not in exclude:
+            codes.add(code)
+    return codes
+
+
+def _mint_batch(count, fields, taken):
+    """Insert ``count`` vouchers, redrawing codes that collide."""
+    vouchers = []
+    while len(vouchers) < count:
+        candidates = _candidate_codes(count - len(vouchers), taken)
+        existing = set(Voucher.objects.filter(code__in=candidates).values_list('code', flat=True))
+        taken |= candidates
+        fresh = [Voucher(code=code, **fields) for code in candidates - existing]
+        try:
+            with transaction.atomic():
+                vouchers.extend(Voucher.objects.bulk_create(fresh))
+        except IntegrityError:
+            # A concurrent mint took one of the codes; redraw the whole batch
+            logger.info("Voucher code collision during bulk insert, retrying batch")
+    return vouchers
+
+
+def mint_vouchers(plan, count, created_by, valid_from, valid_until, max_uses=1, batch_size=1000):
+    """
+    Create ``count`` vouchers for a plan.
+
+    All vouchers share a ``batch`` identifier so they can be exported or
+    revoked together.
+
+    Returns:
+        tuple: (batch id, list of created Voucher)
+    """
+    batch = uuid.uuid4()
+    fields = {
+        'plan': plan,
+        'max_uses': max_uses,
+        'valid_from': valid_from,
+        'valid_until': valid_until,
+        'status': Voucher.Status.ACTIVE,
+        'created_by': created_by,
+        'batch': batch,
+    }
+
+    vouchers = []
+    taken = set()
+    for start in range(0, count, batch_size):
+        vouchers.extend(_mint_batch(min(batch_size, count - start), fields, taken))
+
+    codefilter.add_codes(v.code for v in vouchers)
+    vouchers_minted.send(
+        sender=Voucher,
+        vouchers=[(v.id, v.code, v.valid_until) for v in vouchers],
+    )
+    create_audit_log(
+        actor=created_by,
+        action='VOUCHER_CREATE',
+        target_type='Voucher',
+        target_id=str(batch),
+        target_repr=f"{len(vouchers)} vouchers for {plan.code}",
+        metadata={'batch': str(batch), 'count': len(vouchers), 'plan': plan.code, 'max_uses': max_uses},
+    )
+    return batch, vouchers
+
+
+def _remaining_key(code):
+    return f"{REMAINING_KEY_PREFIX}:{code}"
+
+
+def _precheck(code):
+    """
+    Reject sold-out hot vouchers without touching the database. Read only:
+    the counter is written from the database once a redemption commits.
+    """
+    if not settings.PORTAL_CONFIG['VOUCHER_PRECHECK']:
+        return
+    try:
+        remaining = get_redis_connection('default').get(_remaining_key(code))
+    except Exception as e:
+        logger.warning(f"Voucher pre-check unavailable: {e}")
+        return
+    if remaining is not None and int(remaining) <= 0:
+        raise VoucherError(VOUCHER_EXHAUSTED, 'Voucher fully used')
+
+
+def _track_remaining(code, remaining, valid_until):
+    """Record the uses left on a multi-use voucher after a redemption."""
+    if not settings.PORTAL_CONFIG['VOUCHER_PRECHECK']:
+        return
+    try:
+        get_redis_connection('default').set(
+            _remaining_key(code),
+            remaining,
+            exat=int(valid_until.timestamp()) + 1,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to track voucher uses: {e}")
+
+
+def _failure_reason(code, now):
+    """Explain why the conditional UPDATE matched no row."""
+    voucher = (
+        Voucher.objects
+        .filter(code=code)
+        .values('status', 'used_count', 'max_uses', 'valid_from', 'valid_until')
+        .first()
+    )
+    if voucher is None or voucher['status'] == Voucher.Status.REVOKED:
+        return VoucherError(VOUCHER_INVALID, 'Invalid voucher code')
+    if voucher['status'] == Voucher.Status.USED or voucher['used_count'] >= voucher['max_uses']:
+        return VoucherError(VOUCHER_EXHAUSTED, 'Voucher fully used')
+    if voucher['status'] == Voucher.Status.EXPIRED or voucher['valid_until'] <= now:
+        return VoucherError(VOUCHER_EXPIRED, 'Voucher expired')
+    # Not valid yet
+    return VoucherError(VOUCHER_INVALID, 'Voucher not valid yet')
+
+
+def redeem_voucher(code):
+    """
+    Use a voucher once.
+
+    Returns:
+        dict: ``id``, ``plan_id``, ``assigned_to_id``, ``used_count``,
+        ``max_uses`` and ``valid_until`` of the voucher after redemption
+
+    Raises:
+        VoucherError: when the voucher is unknown, expired or used up
+    """
+    if not isinstance(code, str):
+        raise VoucherError(VOUCHER_INVALID, 'Invalid voucher code')
+    code = code.strip().upper()
+    if len(code) != CODE_LENGTH:
+        raise VoucherError(VOUCHER_INVALID, 'Invalid voucher code')
+
+    if not codefilter.might_exist(code):
+        raise VoucherError(VOUCHER_INVALID, 'Invalid voucher code')
+    _precheck(code)
+
+    now = timezone.now()
+    table = connection.ops.quote_name(Voucher._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _REDEEM_SQL.format(table=table),
+            [Voucher.Status.USED, now, code, Voucher.Status.ACTIVE, now, now],
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        error = _failure_reason(code, now)
+        if error.code == VOUCHER_EXHAUSTED:
+            _track_remaining(code, 0, now + timedelta(days=1))
+        raise error
+
+    columns = ('id', 'plan_id', 'assigned_to_id', 'used_count', 'max_uses', 'valid_until')
+    redemption = dict(zip(columns, row))
+    # Caches follow the database only once the redemption is committed
+    if redemption['used_count'] >= redemption['max_uses']:
+        transaction.on_commit(lambda: codefilter.remove_codes([code]))
+    if redemption['max_uses'] > 1:
+        remaining = redemption['max_uses'] - redemption['used_count']
+        transaction.on_commit(lambda: _track_remaining(code, remaining, redemption['valid_until']))
+    return redemption
+
+
+def use_voucher(code, mac, ip):
+    """
+    Redeem a voucher and open a session for the client.
+
+    Returns:
+        tuple: (Session, redemption dict)
+
+    Raises:
+        VoucherError: when the voucher cannot be redeemed
+    """
+    with transaction.atomic():
+        redemption = redeem_voucher(code)
+        session = open_session(mac, ip, user_id=redemption['assigned_to_id'])
+
+    create_audit_log(
+        action='VOUCHER_USE',
+        target_type='Voucher',
+        target_id=str(redemption['id']),
+        target_repr=code.strip().upper(),
+        metadata={
+            'mac_address': mac,
+            'session_id': session.id,
+            'used_count': redemption['used_count'],
+            'max_uses': redemption['max_uses'],
+        },
+        ip_address=ip,
+    )
+    return session, redemption
+
+
+def _guess_usage(request, key, increment, group='voucher_guess', rate='VOUCHER_GUESS_RATE'):
+    usage = get_usage(
+        request,
+        group=group,
+        key=key,
+        rate=settings.PORTAL_CONFIG[rate],
+        increment=increment,
+    )
+    return usage is not None and usage['count'] >= usage['limit']
+
+
+def guess_limited(request, increment=False):
+    """
+    Check whether the client used up its allowance of failed voucher codes.
+
+    Counted both per MAC (chosen by the client, shared with RADIUS) and
+    per source address, so changing the MAC in the request body does not
+    buy more guesses. Call with ``increment=True`` after a failed
+    redemption to count it.
+    """
+    mac = normalize_mac(request.data.get('mac'))
+    limited = _guess_usage(
+        request, 'ip', increment, group='voucher_guess_ip', rate='VOUCHER_GUESS_IP_RATE'
+    )
+    if mac:
+        limited = _guess_usage(request, lambda group, request: mac, increment) or limited
+    return limited
+
+
+def mac_guess_limited(mac, increment=False):
+    """
+    Same allowance as ``guess_limited`` for callers without an HTTP
+    request (RADIUS); counted per MAC, shared with the HTTP portal.
+    """
+    return _guess_usage(None, lambda group, request: mac, increment)
@@ -0,0 +1,12 @@
+"""
+Permission classes based on user roles.
+"""
+from rest_framework import permissions
+
+
+class IsAdmin(permissions.BasePermission):
+    """Allow ADMIN and SUPERADMIN users only."""
+    
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.is_admin)
@@ -9,6 +9,67 @@ from django.conf import settings
 from django.utils import timezone
 
 
+class AuditLogManager(models.Manager):
+    """Custom manager for audit logs with integrity checks."""
+    
+    def create_log(self, actor=None, action=None, target_type=None, target_id=None, 
+                   target_repr=None, metadata=None, changes=None, ip_address=None, 
+                   user_agent=None, request_id=None):
+        """Create audit log entry with proper data capture."""
+        
+        # Capture actor information
+        actor_email = ''
+        actor_role = ''
+        if actor:
+            actor_email = actor.email
+            actor_role = actor.role
+        
+        # Create audit log
+        audit_log = self.create(
+            actor=actor,
+            actor_email=actor_email,
+            actor_role=actor_role,
+            action=action,
+            target_type=target_type,
+            target_id=str(target_id) if target_id else '',
+            target_repr=str(target_repr) if target_repr else '',
+            metadata=metadata or {},
+            changes=changes or {},
+            ip_address=ip_address,
+            user_agent=user_agent or '',
+            request_id=request_id
+        )
+        
+        return audit_log
+    
+    def verify_integrity_batch(self, queryset=None):
+        """Verify integrity of multiple audit log entries."""
+        if queryset is None:
+            queryset = self.all()
+        
+        results = {
+            'total': 0,
+            'valid': 0,
+            'invalid': 0,
+            'invalid_entries': []
+        }
+        
+        for log in queryset:
+            results['total'] += 1
+            if log.verify_integrity():
+                results['valid'] += 1
+            else:
+                results['invalid'] += 1
+                results['invalid_entries'].append({
+                    'id': log.id,
+                    'timestamp': log.timestamp,
+                    'action': log.action,
+                    'actor': log.actor_email
+                })
+        
+        return results
+
+
 class AuditLog(models.Model):
     """
     Immutable audit log for tracking all sensitive actions.
@@ -48,6 +109,7 @@ class AuditLog(models.Model):
         PORTAL_LOGIN = 'PORTAL_LOGIN', 'Portal Login'
         PORTAL_LOGOUT = 'PORTAL_LOGOUT', 'Portal Logout'
         QUOTA_EXCEEDED = 'QUOTA_EXCEEDED', 'Quota Exceeded'
+        QUOTA_RESET = 'QUOTA_RESET', 'Quota Reset'
         
         # Voucher actions
         VOUCHER_CREATE = 'VOUCHER_CREATE', 'Voucher Create'
@@ -89,6 +151,8 @@ class AuditLog(models.Model):
     # Timestamp
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = AuditLogManager()
+
     class Meta:
         db_table = 'audit_auditlog'
         # Only allow add and view permissions - no change or delete
@@ -172,71 +236,6 @@ def prevent_audit_modifications():
         """)
 
 
-class AuditLogManager(models.Manager):
-    """Custom manager for audit logs with integrity checks."""
-    
-    def create_log(self, actor=None, action=None, target_type=None, target_id=None, 
-                   target_repr=None, metadata=None, changes=None, ip_address=None, 
-                   user_agent=None, request_id=None):
-        """Create audit log entry with proper data capture."""
-        
-        # Capture actor information
-        actor_email = ''
-        actor_role = ''
-        if actor:
-            actor_email = actor.email
-            actor_role = actor.role
-        
-        # Create audit log
-        audit_log = self.create(
-            actor=actor,
-            actor_email=actor_email,
-            actor_role=actor_role,
-            action=action,
-            target_type=target_type,
-            target_id=str(target_id) if target_id else '',
-            target_repr=str(target_repr) if target_repr else '',
-            metadata=metadata or {},
-            changes=changes or {},
-            ip_address=ip_address,
-            user_agent=user_agent or '',
-            request_id=request_id
-        )
-        
-        return audit_log
-    
-    def verify_integrity_batch(self, queryset=None):
-        """Verify integrity of multiple audit log entries."""
-        if queryset is None:
-            queryset = self.all()
-        
-        results = {
-            'total': 0,
-            'valid': 0,
-            'invalid': 0,
-            'invalid_entries': []
-        }
-        
-        for log in queryset:
-            results['total'] += 1
-            if log.verify_integrity():
-                results['valid'] += 1
-            else:
-                results['invalid'] += 1
-                results['invalid_entries'].append({
-                    'id': log.id,
-                    'timestamp': log.timestamp,
-                    'action': log.action,
-                    'actor': log.actor_email
-                })
-        
-        return results
-
-
-# Attach custom manager
-AuditLog.objects = AuditLogManager()
-
-
 class AuditLogArchive(models.Model):
     """
     Archive table for old audit logs (for performance).
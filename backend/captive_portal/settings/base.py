@@ -187,6 +187,7 @@ REST_FRAMEWORK = {
         'user': '1000/hour',
         'login': '5/5min',
         'register': '3/hour',
+        'gateway': '6000/min',  # per gateway, overridden by Gateway.rate_limit
     }
 }
 
@@ -217,6 +218,32 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'flush-session-usage': {
+        'task': 'access.tasks.flush_session_usage',
+        'schedule': 30.0,
+    },
+    'reconcile-active-devices': {
+        'task': 'access.tasks.reconcile_active_devices',
+        'schedule': 900.0,  # 15 minutes
+    },
+    'expire-idle-sessions': {
+        'task': 'access.tasks.expire_idle_sessions',
+        'schedule': 60.0,
+    },
+    'archive-old-sessions': {
+        'task': 'access.tasks.archive_old_sessions',
+        'schedule': 86400.0,  # daily
+    },
+    'collect-device-aliases': {
+        'task': 'access.tasks.collect_device_aliases',
+        'schedule': 86400.0,  # daily
+    },
+    'sync-gateway-health': {
+        'task': 'portal.tasks.sync_gateway_health',
+        'schedule': 60.0,
+    },
+}
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -289,8 +316,61 @@ PORTAL_CONFIG = {
     'QUOTA_WARNING_THRESHOLD': 80,  # %
     'QUOTA_CRITICAL_THRESHOLD': 90,  # %
     'VOUCHER_CODE_LENGTH': 8,
+    'VOUCHER_MINT_MAX': 10000,  # vouchers minted by one API request
     'PASSWORD_RESET_TIMEOUT': 3600,  # 1 hour
     'EMAIL_VERIFICATION_TIMEOUT': 86400,  # 24 hours
+    'AUTH_CACHE_TTL': 300,  # 5 minutes
+    'AUTH_CACHE_NEGATIVE_TTL': 10,  # seconds
+    'AUTHORIZE_BATCH_MAX': 1000,
+    'FEED_MAX_LENGTH': 10000,  # deltas kept per gateway feed
+    'FEED_LONG_POLL_TIMEOUT': 25,  # seconds
+    'FEED_POLL_INTERVAL': 0.5,  # seconds
+    'FEED_STREAM_DURATION': 300,  # 5 minutes
+    'FEED_MAX_STREAMS': 32,  # concurrent long-polls and streams, keep below the feed workers
+    'FEED_RETRY_AFTER': 30,  # seconds, Retry-After of a 503 when all feed slots are taken
+    'ACCOUNTING_FLUSH_BATCH': 1000,  # sessions per UPDATE
+    'QUOTA_LIMITS_CACHE_TTL': 300,  # 5 minutes
+    'VOUCHER_PRECHECK': True,  # reject sold-out multi-use vouchers in Redis
+    'VOUCHER_FILTER_REFRESH': 1,  # seconds the in-process filter refuses codes before checking for changes
+    'WALLED_GARDEN_REFRESH': 5,  # seconds between walled garden version checks
+    'SPLASH_REFRESH': 5,  # seconds between splash page version checks
+    'SPLASH_MAX_AGE': 31536000,  # 1 year, fingerprinted splash URLs
+    'VOUCHER_GUESS_RATE': '10/5m',  # failed voucher codes per MAC
+    'VOUCHER_GUESS_IP_RATE': '50/5m',  # failed voucher codes per source address (hotspot NAT)
+    'SESSION_RETENTION_DAYS': 90,  # closed sessions kept in access_session
+    'SESSION_ARCHIVE_TABLE_DAYS': 365,  # archived sessions kept queryable before compression to files
+    'SESSION_ARCHIVE_DIR': config('SESSION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive')),  # gzipped JSON lines, one file per month
+    'RECONCILE_GRACE': 60,  # seconds before a session missing on the gateway is closed
+    'IDLE_WINDOW_MINUTES': 10,  # longer than the gateway heartbeat interval
+    'IDLE_THRESHOLD_BYTES_PER_MIN': 2048,
+    'IDLE_CHECK_BUDGET': 20,  # seconds per idle detection run
+    'PROBE_RESPONDER': True,  # answer OS connectivity probes in the WSGI layer
+    'PROBE_LOGIN_URL': config('PORTAL_LOGIN_URL', default='/portal/login'),
+    'PROBE_MAC_HEADER': 'X-Client-MAC',  # set by the gateway or reverse proxy
+    'GATEWAY_AUTH_REQUIRED': config('GATEWAY_AUTH_REQUIRED', default=False, cast=bool),  # reject unsigned gateway calls
+    'GATEWAY_SIGNATURE_WINDOW': 300,  # seconds of clock skew accepted
+    'GATEWAY_CACHE_TTL': 30,  # seconds a gateway row is cached in process
+    'GATEWAY_STATS_RETENTION': 3600,  # seconds of per-minute gateway stats
+    'GATEWAY_HEALTH_TIMEOUT': 120,  # seconds without calls before a gateway is unhealthy
+    'RADIUS_AUTH_PORT': config('RADIUS_AUTH_PORT', default=1812, cast=int),
+    'RADIUS_ACCT_PORT': config('RADIUS_ACCT_PORT', default=1813, cast=int),
+    'RADIUS_DEFAULT_SECRET': config('RADIUS_DEFAULT_SECRET', default=''),  # NAS without a registered gateway, empty to refuse them
+    'RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR': config('RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR', default=True, cast=bool),  # False only for NAS that cannot send it
+    'RADIUS_INTERIM_INTERVAL': 300,  # seconds, Acct-Interim-Interval sent in Access-Accept
+    'RADIUS_WORKERS': 4,  # threads handling request batches
+    'RADIUS_BATCH_WINDOW': 0.005,  # seconds Access-Requests are collected into a batch
+    'RADIUS_ACCT_BATCH_WINDOW': 0.1,  # seconds accounting requests are collected into a batch
+    'RADIUS_BATCH_MAX': 500,  # requests per batch
+    'RADIUS_QUEUE_MAX': 20000,  # requests waiting to be handled before new ones are dropped
+    'RADIUS_DUPLICATE_WINDOW': 30,  # seconds replies are kept to answer retransmissions
+    'RADIUS_RECEIVE_BUFFER': 4194304,  # bytes of UDP socket buffer, capped by net.core.rmem_max
+    'DEVICE_AUTO_REAUTH': True,  # log known devices back in under a new MAC
+    'DEVICE_REAUTH_WINDOW': 604800,  # 7 days, seconds since a device was last seen
+    'DEVICE_REAUTH_BACKOFF': 300,  # seconds a refused MAC is not looked up again
+    'DEVICE_TRAITS_TTL': 900,  # seconds gateway-observed DHCP traits wait for the login
+    'DEVICE_ALIAS_RETENTION': 2592000,  # 30 days, seconds a previous MAC is kept
+    'DEVICE_COOKIE_NAME': 'portal_device',
+    'DEVICE_COOKIE_MAX_AGE': 31536000,  # 1 year
 }
 
 # Security Headers
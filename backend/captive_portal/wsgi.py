@@ -2,4 +2,8 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'captive_portal.settings')
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Imported once Django is set up; answers detection probes before the middleware
+from portal.probes import ProbeResponder  # noqa: E402
+application = ProbeResponder(application)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+MAC authorization decision cache.
+
+Gateways ask the portal about the same clients over and over, so the
+ALLOW/DENY decision for each MAC is kept in the default cache and only
+recomputed from ``access_session`` on a miss.
+
+Decisions are sharded per gateway: each gateway reads and fills its own
+keys, and the last gateway that looked a MAC up is remembered as its
+location. Invalidations only touch the shard of the MAC's gateway (and
+the default shard used by unidentified callers).
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+AUTH_CACHE_PREFIX = 'portal:auth'
+LOCATION_PREFIX = 'portal:auth:location'
+
+DEFAULT_GATEWAY = 'default'
+
+ALLOW = 'ALLOW'
+DENY = 'DENY'
+
+
+def auth_cache_key(mac, gateway=DEFAULT_GATEWAY):
+    """Cache key holding the decision for a normalized MAC."""
+    return f"{AUTH_CACHE_PREFIX}:{gateway}:{mac}"
+
+
+def location_key(mac):
+    return f"{LOCATION_PREFIX}:{mac}"
+
+
+def get_decisions(macs, gateway=DEFAULT_GATEWAY):
+    """
+    Fetch cached decisions for many MACs with a single multi-get.
+
+    Returns a dict of mac -> decision for the entries that are present
+    and not yet expired.
+    """
+    keys = {auth_cache_key(mac, gateway): mac for mac in macs}
+    found = cache.get_many(list(keys))
+    now = time.time()
+    return {
+        keys[key]: decision
+        for key, decision in found.items()
+        if decision.get('expires', 0) > now
+    }
+
+
+def set_decisions(decisions, gateway=DEFAULT_GATEWAY):
+    """
+    Store decisions computed from the database.
+
+    ALLOW entries live until the session expires (capped by
+    ``AUTH_CACHE_TTL``); DENY entries are kept only briefly so a fresh
+    login is picked up quickly even if an invalidation is missed. The
+    MACs are located on ``gateway``.
+    """
+    now = time.time()
+    by_timeout = {}
+    for mac, decision in decisions.items():
+        if decision['status'] == ALLOW:
+            timeout = min(
+                int(decision['expires'] - now),
+                settings.PORTAL_CONFIG['AUTH_CACHE_TTL'],
+            )
+        else:
+            timeout = settings.PORTAL_CONFIG['AUTH_CACHE_NEGATIVE_TTL']
+        if timeout <= 0:
+            continue
+        by_timeout.setdefault(timeout, {})[auth_cache_key(mac, gateway)] = decision
+    for timeout, entries in by_timeout.items():
+        cache.set_many(entries, timeout=timeout)
+    if decisions:
+        # A MAC that roamed leaves no decision behind on its old gateway
+        moved = [
+            auth_cache_key(mac, previous)
+            for mac, previous in locate(decisions).items()
+            if previous not in (gateway, DEFAULT_GATEWAY)
+        ]
+        if moved:
+            cache.delete_many(moved)
+        cache.set_many(
+            {location_key(mac): gateway for mac in decisions},
+            timeout=settings.PORTAL_CONFIG['SESSION_TIMEOUT'],
+        )
+
+
+def locate(macs):
+    """Return {mac: gateway} of the gateway that last looked each MAC up."""
+    macs = [mac for mac in macs if mac]
+    found = cache.get_many([location_key(mac) for mac in macs])
+    return {mac: found.get(location_key(mac), DEFAULT_GATEWAY) for mac in macs}
+
+
+def invalidate_decisions(macs):
+    """Drop cached decisions, e.g. after a login, logout or revocation."""
+    keys = []
+    for mac, gateway in locate(macs).items():
+        keys.append(auth_cache_key(mac))
+        if gateway != DEFAULT_GATEWAY:
+            keys.append(auth_cache_key(mac, gateway))
+    if keys:
+        cache.delete_many(keys)
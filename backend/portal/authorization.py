@@ -0,0 +1,149 @@
+"""
+Authorization decisions for gateway clients.
+
+Decisions are resolved for a whole batch of clients at once: one
+multi-get against the decision cache, then a single query against
+``access_session`` for the MACs that missed.
+"""
+import time
+from django.conf import settings
+from access.fingerprints import fingerprint_from
+from access.models import Session
+from access.utils import normalize_mac
+from .authcache import ALLOW, DEFAULT_GATEWAY, DENY, get_decisions, set_decisions
+from .logins import login_hints, observe_traits, reauthorize_clients
+
+
+def _session_decisions(macs, gateway=DEFAULT_GATEWAY):
+    """Compute decisions for uncached MACs with one bulk query."""
+    now = time.time()
+    timeout = settings.PORTAL_CONFIG['SESSION_TIMEOUT']
+    negative_ttl = settings.PORTAL_CONFIG['AUTH_CACHE_NEGATIVE_TTL']
+
+    decisions = {
+        mac: {'status': DENY, 'expires': now + negative_ttl}
+        for mac in macs
+    }
+
+    sessions = (
+        Session.objects
+        .filter(mac_address__in=macs, status=Session.Status.AUTHORIZED)
+        .exclude(device__is_revoked=True)
+        .order_by('start_time')
+        .values_list('id', 'mac_address', 'user_id', 'session_token', 'start_time')
+    )
+    # Ordered by start time so the most recent session wins for each MAC
+    for session_id, mac, user_id, token, start_time in sessions:
+        expires = start_time.timestamp() + timeout
+        if expires <= now:
+            continue
+        decisions[mac] = {
+            'status': ALLOW,
+            'expires': expires,
+            'session_id': session_id,
+            'user_id': user_id,
+            'token': token,
+        }
+
+    set_decisions(decisions, gateway)
+    return decisions
+
+
+def lookup_decisions(macs, gateway=DEFAULT_GATEWAY):
+    """
+    Return the current decision for each normalized MAC.
+
+    Cached decisions are read with one multi-get from the shard of
+    ``gateway``; the misses are computed with one query and written back
+    to that shard.
+    """
+    decisions = get_decisions(macs, gateway)
+    missing = set(macs) - decisions.keys()
+    if missing:
+        decisions.update(_session_decisions(missing, gateway))
+    return decisions
+
+
+def resolve_clients(clients, gateway=DEFAULT_GATEWAY, trusted=False):
+    """
+    Resolve ALLOW/DENY decisions for a batch of clients.
+
+    Args:
+        clients: iterable of dicts with ``mac``, ``ip`` and optional ``token``
+        gateway: name of the calling gateway
+        trusted: whether the gateway signed the call
+
+    Returns:
+        list of dicts with ``mac``, ``ip``, ``status`` and ``ttl``, in the
+        same order as the input. Allowed entries also carry the internal
+        ``session_id`` and ``user_id``. Entries with an invalid MAC or a
+        missing IP are denied with an ``error`` message.
+
+    On trusted calls, denied clients that come back under a MAC their
+    device used before (see ``access.fingerprints``) are re-authorized.
+    Their optional DHCP traits ``dhcp_options``, ``dhcp_vendor`` and
+    ``hostname`` are kept for the login that follows and, when they match
+    a known device, only add a masked ``login_hint`` to the result.
+    """
+    clients = list(clients)
+    macs = {normalize_mac(client.get('mac')) for client in clients}
+    macs.discard(None)
+
+    decisions = lookup_decisions(macs, gateway)
+
+    now = time.time()
+    results = []
+    unknown = []
+    for client in clients:
+        mac = normalize_mac(client.get('mac'))
+        ip = client.get('ip')
+        result = {'mac': mac or client.get('mac'), 'ip': ip, 'status': DENY, 'ttl': 0}
+
+        if not mac or not ip:
+            result['error'] = 'Valid MAC and IP required'
+            results.append(result)
+            continue
+
+        decision = decisions[mac]
+        token = client.get('token')
+        if decision['status'] == ALLOW and (not token or token == decision['token']):
+            result['status'] = ALLOW
+            result['ttl'] = max(int(decision['expires'] - now), 0)
+            result['session_id'] = decision['session_id']
+            result['user_id'] = decision['user_id']
+        elif decision['status'] == DENY and not token:
+            unknown.append((result, client))
+        results.append(result)
+
+    if trusted:
+        _recognize(unknown)
+    return results
+
+
+def _recognize(unknown):
+    """
+    Re-authorize denied clients back under a previous MAC; hint the
+    account of the others from their DHCP traits.
+    """
+    if not unknown:
+        return
+    sessions = reauthorize_clients([
+        {'mac': result['mac'], 'ip': result['ip']}
+        for result, _ in unknown
+    ])
+    timeout = settings.PORTAL_CONFIG['SESSION_TIMEOUT']
+    denied = []
+    for (result, client), session in zip(unknown, sessions):
+        if session is not None:
+            result['status'] = ALLOW
+            result['ttl'] = timeout
+            result['session_id'] = session.id
+            result['user_id'] = session.user_id
+        else:
+            denied.append((result, fingerprint_from(client)))
+
+    observe_traits({result['mac']: fingerprint for result, fingerprint in denied})
+    hints = login_hints([fingerprint for _, fingerprint in denied])
+    for (result, _), hint in zip(denied, hints):
+        if hint:
+            result['login_hint'] = hint
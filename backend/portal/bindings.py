@@ -0,0 +1,201 @@
+"""
+Index of the current captive bindings.
+
+Two Redis hashes hold only active bindings: MAC -> IP and IP -> MAC, each
+value tagged with the binding id. Answering "which client owns this IP
+right now" is a single HGET instead of a scan of ``portal_captivebinding``.
+
+Binds run in Lua so a rebind resolves its conflicts atomically: the MAC's
+previous IP is released, and a MAC that held the IP before (DHCP gave the
+address to someone else) loses it. Binding ids only grow, so a bind older
+than the current owner of the MAC or IP is ignored. Unbinds only remove
+entries still tagged with the expired binding.
+"""
+import logging
+from django.db.models import Q
+from django.utils import timezone
+from django_redis import get_redis_connection
+from access.models import Session
+from .models import CaptiveBinding
+
+logger = logging.getLogger(__name__)
+
+MAC_KEY = 'portal:bindings:mac'
+IP_KEY = 'portal:bindings:ip'
+
+# Values are "<binding id>|<ip or mac>"; IPv6 addresses contain colons.
+# Returns {status, displaced mac, released ip}: status 0 when the bind is
+# older than the current owner of the MAC or IP.
+_BIND_SCRIPT = """
+local mac, ip, id = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local function parse(value)
+    if not value then return nil, nil end
+    local sep = string.find(value, '|', 1, true)
+    return tonumber(string.sub(value, 1, sep - 1)), string.sub(value, sep + 1)
+end
+
+local mac_id, old_ip = parse(redis.call('HGET', KEYS[1], mac))
+local ip_id, old_mac = parse(redis.call('HGET', KEYS[2], ip))
+if (mac_id and mac_id > id) or (ip_id and ip_id > id) then
+    return {0, '', ''}
+end
+
+local released = ''
+if old_ip and old_ip ~= ip then
+    local _, owner = parse(redis.call('HGET', KEYS[2], old_ip))
+    if owner == mac then
+        redis.call('HDEL', KEYS[2], old_ip)
+    end
+    released = old_ip
+end
+
+local displaced = ''
+if old_mac and old_mac ~= mac then
+    local _, held = parse(redis.call('HGET', KEYS[1], old_mac))
+    if held == ip then
+        redis.call('HDEL', KEYS[1], old_mac)
+    end
+    displaced = old_mac
+end
+
+redis.call('HSET', KEYS[1], mac, id .. '|' .. ip)
+redis.call('HSET', KEYS[2], ip, id .. '|' .. mac)
+return {1, displaced, released}
+"""
+
+# ARGV: mac1, id1, mac2, id2, ...
+_UNBIND_SCRIPT = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+    local value = redis.call('HGET', KEYS[1], ARGV[i])
+    if value then
+        local sep = string.find(value, '|', 1, true)
+        if string.sub(value, 1, sep - 1) == ARGV[i + 1] then
+            local ip = string.sub(value, sep + 1)
+            redis.call('HDEL', KEYS[1], ARGV[i])
+            if redis.call('HGET', KEYS[2], ip) == ARGV[i + 1] .. '|' .. ARGV[i] then
+                redis.call('HDEL', KEYS[2], ip)
+            end
+            removed = removed + 1
+        end
+    end
+end
+return removed
+"""
+
+
+def _parse(value):
+    binding_id, _, address = value.decode().partition('|')
+    return address, int(binding_id)
+
+
+def bind(mac, ip, binding_id):
+    """
+    Make ``binding_id`` the current binding of ``mac`` and ``ip``.
+
+    Returns:
+        tuple: (applied, MAC that lost ``ip`` or None, previous IP of
+        ``mac`` or None)
+    """
+    redis = get_redis_connection('default')
+    script = redis.register_script(_BIND_SCRIPT)
+    applied, displaced, released = script(keys=[MAC_KEY, IP_KEY], args=[mac, ip, binding_id])
+    return bool(applied), displaced.decode() or None, released.decode() or None
+
+
+def bind_safely(mac, ip, binding_id):
+    """Bind from request paths; a missed bind is recovered by rebuild()."""
+    try:
+        return bind(mac, ip, binding_id)
+    except Exception as e:
+        logger.warning(f"Failed to index binding {binding_id}: {e}")
+        return False, None, None
+
+
+def unbind(bindings):
+    """
+    Remove expired bindings from the index.
+
+    Args:
+        bindings: iterable of (binding_id, mac); entries already taken
+            over by a newer binding are left alone
+    """
+    args = []
+    for binding_id, mac in bindings:
+        args.extend([mac, binding_id])
+    if not args:
+        return 0
+    try:
+        redis = get_redis_connection('default')
+        script = redis.register_script(_UNBIND_SCRIPT)
+        return script(keys=[MAC_KEY, IP_KEY], args=args)
+    except Exception as e:
+        # Stale entries are dropped by the next rebuild()
+        logger.warning(f"Failed to unindex bindings: {e}")
+        return 0
+
+
+def owners(ips):
+    """Return {ip: (mac, binding_id)} for the IPs currently bound."""
+    ips = list(ips)
+    if not ips:
+        return {}
+    values = get_redis_connection('default').hmget(IP_KEY, ips)
+    return {ip: _parse(value) for ip, value in zip(ips, values) if value}
+
+
+def addresses(macs):
+    """Return {mac: (ip, binding_id)} for the MACs currently bound."""
+    macs = list(macs)
+    if not macs:
+        return {}
+    values = get_redis_connection('default').hmget(MAC_KEY, macs)
+    return {mac: _parse(value) for mac, value in zip(macs, values) if value}
+
+
+def rebuild(batch_size=5000):
+    """
+    Rebuild the index from the bindings not yet expired whose session,
+    if any, is still authorized.
+
+    Bindings are replayed in id order so the latest one of each MAC and IP
+    wins, then both hashes are swapped in at once. Meant for startup and
+    repair: a bind made while it runs can be overwritten.
+
+    Returns:
+        int: number of bindings indexed
+    """
+    by_mac = {}
+    by_ip = {}
+    bindings = (
+        CaptiveBinding.objects
+        .filter(expires_at__gt=timezone.now())
+        .filter(Q(session__isnull=True) | Q(session__status=Session.Status.AUTHORIZED))
+        .order_by('id')
+        .values_list('id', 'mac_address', 'ip_address')
+    )
+    for binding_id, mac, ip in bindings.iterator(chunk_size=batch_size):
+        old_ip = by_mac.get(mac, (None, None))[1]
+        if old_ip and old_ip != ip and by_ip.get(old_ip, (None, None))[1] == mac:
+            del by_ip[old_ip]
+        old_mac = by_ip.get(ip, (None, None))[1]
+        if old_mac and old_mac != mac and by_mac.get(old_mac, (None, None))[1] == ip:
+            del by_mac[old_mac]
+        by_mac[mac] = (binding_id, ip)
+        by_ip[ip] = (binding_id, mac)
+
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline()
+    for key, entries in ((MAC_KEY, by_mac), (IP_KEY, by_ip)):
+        building_key = f"{key}:rebuild"
+        pipe.delete(building_key)
+        items = [(name, f"{binding_id}|{address}") for name, (binding_id, address) in entries.items()]
+        for start in range(0, len(items), batch_size):
+            pipe.hset(building_key, mapping=dict(items[start:start + batch_size]))
+        if items:
+            pipe.rename(building_key, key)
+        else:
+            pipe.delete(key)
+    pipe.execute()
+    logger.info(f"Indexed {len(by_mac)} current bindings")
+    return len(by_mac)
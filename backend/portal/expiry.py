@@ -0,0 +1,214 @@
+"""
+Expiry scheduler for sessions, captive bindings and vouchers.
+
+Expiry deadlines are kept in a Redis sorted set scored by epoch seconds.
+The runner pops everything that is due in one atomic step and expires it
+with one bulk UPDATE per kind, instead of polling ``expires_at < now()``
+across tables. The schedule can be rebuilt from the database at startup.
+"""
+import logging
+import time
+from datetime import timedelta
+from django.utils import timezone
+from django_redis import get_redis_connection
+from access import codefilter
+from access.models import Session, Voucher
+from access.sessions import close_sessions, session_expiry
+from .authcache import invalidate_decisions
+from .bindings import unbind
+from .feed import publish_deauthorize
+from .models import CaptiveBinding
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_KEY = 'portal:expiry:schedule'
+
+SESSION = 'session'
+BINDING = 'binding'
+VOUCHER = 'voucher'
+
+# Pop due members so concurrent runners never process the same entry
+_POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def _epoch(when):
+    return when.timestamp() if hasattr(when, 'timestamp') else float(when)
+
+
+def schedule(entries, key=SCHEDULE_KEY):
+    """
+    Schedule expiries.
+
+    Args:
+        entries: iterable of (kind, object_id, expires_at) where expires_at
+            is a datetime or epoch seconds
+    """
+    mapping = {f"{kind}:{object_id}": _epoch(when) for kind, object_id, when in entries}
+    if mapping:
+        get_redis_connection('default').zadd(key, mapping)
+
+
+def schedule_safely(entries):
+    """Schedule from request paths; a missed entry is recovered by rebuild()."""
+    try:
+        schedule(entries)
+    except Exception as e:
+        logger.warning(f"Failed to schedule expiries: {e}")
+
+
+def cancel(kind, object_ids):
+    """Remove scheduled expiries, e.g. for sessions closed early."""
+    members = [f"{kind}:{object_id}" for object_id in object_ids]
+    if not members:
+        return
+    try:
+        get_redis_connection('default').zrem(SCHEDULE_KEY, *members)
+    except Exception as e:
+        # A stale entry is harmless, expiry re-checks the object state
+        logger.warning(f"Failed to cancel expiries: {e}")
+
+
+def pop_due(now=None, limit=1000):
+    """Atomically take up to ``limit`` due entries, grouped by kind."""
+    now = time.time() if now is None else _epoch(now)
+    redis = get_redis_connection('default')
+    script = redis.register_script(_POP_DUE_SCRIPT)
+
+    due = {SESSION: [], BINDING: [], VOUCHER: []}
+    for member in script(keys=[SCHEDULE_KEY], args=[now, limit]):
+        kind, object_id = member.decode().split(':')
+        due[kind].append(int(object_id))
+    return due
+
+
+def _expire_sessions(session_ids, now):
+    """Expire authorized sessions past their deadline; reschedule early entries."""
+    sessions = list(
+        Session.objects
+        .filter(id__in=session_ids, status=Session.Status.AUTHORIZED)
+        .values_list('id', 'start_time')
+    )
+    due = [session_id for session_id, start_time in sessions if session_expiry(start_time) <= now]
+    schedule(
+        (SESSION, session_id, session_expiry(start_time))
+        for session_id, start_time in sessions
+        if session_expiry(start_time) > now
+    )
+    if not due:
+        return 0
+    return len(close_sessions(due, status=Session.Status.EXPIRED))
+
+
+def _expire_bindings(binding_ids, now):
+    """Deauthorize MACs whose binding expired and that have no live binding."""
+    expired = list(
+        CaptiveBinding.objects
+        .filter(id__in=binding_ids, expires_at__lte=now)
+        .values_list('id', 'mac_address')
+    )
+    if not expired:
+        return 0
+    unbind(expired)
+    macs = {mac for _, mac in expired}
+    live = set(
+        CaptiveBinding.objects
+        .filter(mac_address__in=macs, expires_at__gt=now)
+        .values_list('mac_address', flat=True)
+    )
+    macs -= live
+    invalidate_decisions(macs)
+    publish_deauthorize(sorted(macs))
+    return len(macs)
+
+
+def _expire_vouchers(voucher_ids, now):
+    """Expire vouchers past their validity and drop them from the code filter."""
+    vouchers = Voucher.objects.filter(
+        id__in=voucher_ids,
+        status=Voucher.Status.ACTIVE,
+        valid_until__lte=now,
+    )
+    codes = list(vouchers.values_list('code', flat=True))
+    if not codes:
+        return 0
+    count = vouchers.update(status=Voucher.Status.EXPIRED, updated_at=now)
+    codefilter.remove_codes(codes)
+    return count
+
+
+def run_once(now=None, limit=1000):
+    """
+    Expire everything that is due.
+
+    Returns:
+        dict: number of expired objects per kind
+    """
+    now = now or timezone.now()
+    due = pop_due(now, limit=limit)
+
+    expired = {SESSION: 0, BINDING: 0, VOUCHER: 0}
+    if due[SESSION]:
+        expired[SESSION] = _expire_sessions(due[SESSION], now)
+    if due[BINDING]:
+        expired[BINDING] = _expire_bindings(due[BINDING], now)
+    if due[VOUCHER]:
+        expired[VOUCHER] = _expire_vouchers(due[VOUCHER], now)
+
+    if any(expired.values()):
+        logger.info(f"Expired {expired}")
+    return expired
+
+
+def rebuild(batch_size=5000):
+    """
+    Rebuild the schedule from the database.
+
+    The schedule is built in a temporary key and merged into the live one,
+    so entries added by web workers meanwhile are kept. Stale entries are
+    harmless: expiry re-checks the state of each object.
+    """
+    redis = get_redis_connection('default')
+    building_key = f"{SCHEDULE_KEY}:rebuild"
+    redis.delete(building_key)
+    horizon = timezone.now() - timedelta(days=1)
+
+    sources = [
+        (
+            SESSION,
+            Session.objects.filter(status=Session.Status.AUTHORIZED).values_list('id', 'start_time'),
+            session_expiry,
+        ),
+        (
+            BINDING,
+            CaptiveBinding.objects.filter(expires_at__gt=horizon).values_list('id', 'expires_at'),
+            lambda expires_at: expires_at,
+        ),
+        (
+            VOUCHER,
+            Voucher.objects.filter(status=Voucher.Status.ACTIVE).values_list('id', 'valid_until'),
+            lambda valid_until: valid_until,
+        ),
+    ]
+
+    total = 0
+    for kind, queryset, deadline in sources:
+        batch = []
+        for object_id, value in queryset.iterator(chunk_size=batch_size):
+            batch.append((kind, object_id, deadline(value)))
+            if len(batch) >= batch_size:
+                schedule(batch, key=building_key)
+                total += len(batch)
+                batch = []
+        schedule(batch, key=building_key)
+        total += len(batch)
+
+    if total:
+        redis.zunionstore(SCHEDULE_KEY, [SCHEDULE_KEY, building_key], aggregate='MAX')
+        redis.delete(building_key)
+    return total
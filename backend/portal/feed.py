@@ -0,0 +1,201 @@
+"""
+Per-gateway change feed of authorize/deauthorize deltas.
+
+Deltas go to the feed of the gateway each MAC was last looked up from
+(see ``authcache.locate``). Each feed is a Redis sorted set scored by a
+monotonically increasing sequence number, so gateways can resume from
+the last sequence they applied. Feeds are capped at ``FEED_MAX_LENGTH``
+entries; a gateway that falls further behind is told to resynchronise.
+
+Long-polls and streams hold a worker for their whole duration, so at most
+``FEED_MAX_STREAMS`` run at once across the deployment; each takes a slot
+in a Redis sorted set scored by its deadline, so the slots of a crashed
+worker free themselves.
+"""
+import json
+import logging
+import time
+import uuid
+from django.conf import settings
+from django_redis import get_redis_connection
+from .authcache import locate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEED = 'default'
+
+SLOTS_KEY = 'portal:feed:slots'
+
+AUTHORIZE = 'authorize'
+DEAUTHORIZE = 'deauthorize'
+
+# Assign sequence numbers and append in one atomic step
+_PUBLISH_SCRIPT = """
+local seq = 0
+for i = 2, #ARGV do
+    local delta = cjson.decode(ARGV[i])
+    seq = redis.call('INCR', KEYS[2])
+    delta['seq'] = seq
+    redis.call('ZADD', KEYS[1], seq, cjson.encode(delta))
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+return seq
+"""
+
+
+# Drop expired slots, then take one if the cap allows
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+return 1
+"""
+
+
+def _feed_keys(gateway):
+    return f"portal:feed:{gateway}", f"portal:feed:{gateway}:seq"
+
+
+def publish(deltas, gateway=DEFAULT_FEED):
+    """
+    Append deltas to a gateway feed.
+
+    Args:
+        deltas: iterable of dicts with ``mac``, ``action`` and ``ttl``
+        gateway: feed identifier
+
+    Returns:
+        int: sequence number of the last appended delta, or None when
+        nothing was published
+    """
+    now = int(time.time())
+    payloads = [
+        json.dumps({'mac': d['mac'], 'action': d['action'], 'ttl': d.get('ttl', 0), 'ts': now})
+        for d in deltas
+    ]
+    if not payloads:
+        return None
+
+    try:
+        redis = get_redis_connection('default')
+        script = redis.register_script(_PUBLISH_SCRIPT)
+        return script(
+            keys=list(_feed_keys(gateway)),
+            args=[settings.PORTAL_CONFIG['FEED_MAX_LENGTH'], *payloads],
+        )
+    except Exception as e:
+        # Gateways still converge through authorize polling
+        logger.warning(f"Failed to publish {len(payloads)} feed deltas: {e}")
+        return None
+
+
+def _publish_routed(deltas, gateway):
+    """Publish to ``gateway``, or to the feed of the gateway each MAC is on."""
+    if gateway is not None:
+        return publish(deltas, gateway=gateway)
+    try:
+        locations = locate(delta['mac'] for delta in deltas)
+    except Exception as e:
+        logger.warning(f"Failed to locate MACs, publishing on the default feed: {e}")
+        locations = {}
+    by_gateway = {}
+    for delta in deltas:
+        by_gateway.setdefault(locations.get(delta['mac'], DEFAULT_FEED), []).append(delta)
+    seq = None
+    for feed_gateway, feed_deltas in by_gateway.items():
+        seq = publish(feed_deltas, gateway=feed_gateway)
+    return seq
+
+
+def publish_authorize(entries, gateway=None):
+    """
+    Publish authorize deltas for (mac, ttl) pairs, on the feed of each
+    MAC's gateway unless ``gateway`` is given.
+    """
+    return _publish_routed(
+        [{'mac': mac, 'action': AUTHORIZE, 'ttl': ttl} for mac, ttl in entries],
+        gateway,
+    )
+
+
+def publish_deauthorize(macs, gateway=None):
+    """
+    Publish deauthorize deltas for MACs, on the feed of each MAC's
+    gateway unless ``gateway`` is given.
+    """
+    return _publish_routed(
+        [{'mac': mac, 'action': DEAUTHORIZE} for mac in macs],
+        gateway,
+    )
+
+
+def read(since, gateway=DEFAULT_FEED, limit=500):
+    """
+    Read deltas with a sequence number greater than ``since``.
+
+    Returns:
+        tuple: (deltas, last_seq, reset). ``reset`` is True when deltas
+        after ``since`` were already trimmed and the gateway must
+        resynchronise its full client list.
+    """
+    feed_key, seq_key = _feed_keys(gateway)
+    redis = get_redis_connection('default')
+
+    pipe = redis.pipeline()
+    pipe.zrangebyscore(feed_key, f"({since}", '+inf', start=0, num=limit)
+    pipe.zrange(feed_key, 0, 0, withscores=True)
+    pipe.get(seq_key)
+    entries, oldest, current = pipe.execute()
+
+    deltas = [json.loads(entry) for entry in entries]
+    current = int(current or 0)
+    trimmed = bool(oldest) and since < int(oldest[0][1]) - 1
+    reset = trimmed or since > current
+    last_seq = deltas[-1]['seq'] if deltas else max(min(since, current), 0)
+    return deltas, last_seq, reset
+
+
+def acquire_slot(duration):
+    """
+    Take one of the ``FEED_MAX_STREAMS`` slots for ``duration`` seconds.
+
+    Returns:
+        str: slot id to pass to ``release_slot``, or None when all slots
+        are taken. Without Redis the slot is granted.
+    """
+    slot = uuid.uuid4().hex
+    now = time.time()
+    try:
+        redis = get_redis_connection('default')
+        taken = redis.register_script(_ACQUIRE_SCRIPT)(
+            keys=[SLOTS_KEY],
+            # A little slack past the deadline for the last read
+            args=[now, settings.PORTAL_CONFIG['FEED_MAX_STREAMS'], now + duration + 5, slot],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to count feed slots: {e}")
+        return slot
+    return slot if taken else None
+
+
+def release_slot(slot):
+    try:
+        get_redis_connection('default').zrem(SLOTS_KEY, slot)
+    except Exception as e:
+        logger.warning(f"Failed to release feed slot: {e}")
+
+
+def wait(since, gateway=DEFAULT_FEED, timeout=None):
+    """Long-poll until deltas after ``since`` are available or timeout."""
+    if timeout is None:
+        timeout = settings.PORTAL_CONFIG['FEED_LONG_POLL_TIMEOUT']
+    interval = settings.PORTAL_CONFIG['FEED_POLL_INTERVAL']
+    deadline = time.monotonic() + timeout
+
+    while True:
+        deltas, last_seq, reset = read(since, gateway=gateway)
+        if deltas or reset or time.monotonic() >= deadline:
+            return deltas, last_seq, reset
+        time.sleep(interval)
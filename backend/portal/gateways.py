@@ -0,0 +1,312 @@
+"""
+Gateway registry: authentication, rate limits and health.
+
+Gateways sign their API calls with the secret of their ``Gateway`` row:
+
+    X-Gateway-Id: <name>
+    X-Gateway-Timestamp: <epoch seconds>
+    X-Gateway-Signature: hex HMAC-SHA256 of "<timestamp>\\n<METHOD>\\n<path?query>\\n" + body
+
+A signed request is authenticated as its gateway (``request.auth``), which
+selects the gateway's authorization cache shard and change feed and its
+own rate limit. Each signature is accepted once. Unsigned requests are
+served as the ``default`` gateway unless ``GATEWAY_AUTH_REQUIRED`` is set.
+
+Request counts, errors and latencies are counted per gateway and per
+minute in Redis, including requests refused by authentication or rate
+limits; last-seen times are synced to the database by a periodic task.
+"""
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework import authentication, exceptions, permissions, renderers
+from rest_framework.throttling import SimpleRateThrottle
+from .authcache import DEFAULT_GATEWAY
+from .models import Gateway
+
+logger = logging.getLogger(__name__)
+
+STATS_PREFIX = 'portal:gateways:stats'
+SEEN_KEY = 'portal:gateways:seen'
+ADDRESS_KEY = 'portal:gateways:ip'
+REPLAY_PREFIX = 'portal:gateways:replay'
+
+# Latency histogram bounds in milliseconds
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+_registry = {}
+
+
+def get_gateway(name):
+    """
+    Active gateway by name, kept in process for ``GATEWAY_CACHE_TTL``
+    seconds so signed requests do not query the database.
+    """
+    now = time.monotonic()
+    entry = _registry.get(name)
+    if entry and now - entry[1] < settings.PORTAL_CONFIG['GATEWAY_CACHE_TTL']:
+        return entry[0]
+    gateway = Gateway.objects.filter(name=name, is_active=True).first()
+    _registry[name] = (gateway, now)
+    return gateway
+
+
+def sign(secret, timestamp, method, path, body):
+    message = f"{timestamp}\n{method}\n{path}\n".encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class GatewayAuthentication(authentication.BaseAuthentication):
+    """HMAC request signatures from registered gateways."""
+
+    def authenticate(self, request):
+        name = request.META.get('HTTP_X_GATEWAY_ID')
+        if not name:
+            return None
+
+        gateway = get_gateway(name)
+        if gateway is None:
+            raise exceptions.AuthenticationFailed('Unknown gateway')
+
+        try:
+            timestamp = int(request.META.get('HTTP_X_GATEWAY_TIMESTAMP', ''))
+        except ValueError:
+            raise exceptions.AuthenticationFailed('Invalid gateway timestamp')
+        window = settings.PORTAL_CONFIG['GATEWAY_SIGNATURE_WINDOW']
+        if abs(time.time() - timestamp) > window:
+            raise exceptions.AuthenticationFailed('Gateway timestamp out of window')
+
+        expected = sign(gateway.secret, timestamp, request.method, request.get_full_path(), request.body)
+        if not hmac.compare_digest(expected, request.META.get('HTTP_X_GATEWAY_SIGNATURE', '')):
+            raise exceptions.AuthenticationFailed('Invalid gateway signature')
+
+        # A timestamp is accepted up to ``window`` seconds either side of now
+        if not cache.add(f"{REPLAY_PREFIX}:{expected}", 1, timeout=2 * window):
+            raise exceptions.AuthenticationFailed('Replayed gateway signature')
+
+        return (AnonymousUser(), gateway)
+
+    def authenticate_header(self, request):
+        return 'X-Gateway-Signature'
+
+
+class IsGateway(permissions.BasePermission):
+    """Signed gateways, or anyone while ``GATEWAY_AUTH_REQUIRED`` is off."""
+
+    def has_permission(self, request, view):
+        if isinstance(request.auth, Gateway):
+            return True
+        return not settings.PORTAL_CONFIG['GATEWAY_AUTH_REQUIRED']
+
+
+class GatewayRateThrottle(SimpleRateThrottle):
+    """
+    Rate limit per gateway, from ``Gateway.rate_limit`` or the ``gateway``
+    throttle rate. Unsigned callers are limited per client IP.
+    """
+    scope = 'gateway'
+
+    def allow_request(self, request, view):
+        if isinstance(request.auth, Gateway) and request.auth.rate_limit:
+            self.rate = request.auth.rate_limit
+            self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if isinstance(request.auth, Gateway):
+            ident = f"gw:{request.auth.name}"
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets ``Accept: text/event-stream`` (EventSource) clients through
+    content negotiation; only error bodies are rendered, as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode()
+
+
+def gateway_name(request):
+    """Name of the calling gateway, ``default`` when unsigned."""
+    return request.auth.name if isinstance(request.auth, Gateway) else DEFAULT_GATEWAY
+
+
+def _stats_key(name, minute):
+    return f"{STATS_PREFIX}:{name}:{minute}"
+
+
+def record_request(name, endpoint, elapsed, status_code, ip=None, count=1):
+    """
+    Count requests of a gateway in the current minute; ``count``
+    requests of ``elapsed`` seconds each when recorded as a batch.
+    """
+    now = time.time()
+    ms = elapsed * 1000
+    bucket = next((bound for bound in LATENCY_BUCKETS if ms <= bound), 'inf')
+    key = _stats_key(name, int(now // 60))
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.hincrby(key, f"{endpoint}:count", count)
+        if status_code >= 400:
+            pipe.hincrby(key, f"{endpoint}:errors", count)
+        pipe.hincrbyfloat(key, f"{endpoint}:ms", ms * count)
+        pipe.hincrby(key, f"{endpoint}:le:{bucket}", count)
+        pipe.expire(key, settings.PORTAL_CONFIG['GATEWAY_STATS_RETENTION'])
+        pipe.hset(SEEN_KEY, name, int(now))
+        if ip:
+            pipe.hset(ADDRESS_KEY, name, ip)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record gateway stats: {e}")
+
+
+def _tracked_name(request):
+    """
+    Gateway to count a request against: the authenticated one, else the
+    registered gateway it claims to be (failed signatures), else ``default``.
+    """
+    auth = getattr(request, 'auth', None)
+    if isinstance(auth, Gateway):
+        return auth.name
+    claimed = request.META.get('HTTP_X_GATEWAY_ID')
+    if claimed and get_gateway(claimed) is not None:
+        return claimed
+    return DEFAULT_GATEWAY
+
+
+def tracked(view):
+    """
+    Record the latency and status of a gateway API view.
+
+    Applied on top of ``api_view``, so requests refused by authentication,
+    permissions or throttling are counted with their 4xx status, and
+    views that raise are counted as 500.
+    """
+    # api_view returns APIView.as_view(), named after the view function
+    endpoint = view.cls.__name__
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = view(request, *args, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            record_request(
+                _tracked_name(request),
+                endpoint,
+                time.perf_counter() - started,
+                status_code,
+                ip=request.META.get('REMOTE_ADDR'),
+            )
+    return wrapper
+
+
+def _percentile(buckets, count, p):
+    threshold = count * p / 100
+    seen = 0
+    for bound in LATENCY_BUCKETS + ['inf']:
+        seen += buckets.get(str(bound), 0)
+        if seen >= threshold:
+            return bound
+    return 'inf'
+
+
+def gateway_stats(name, minutes=5):
+    """
+    Per-endpoint request rate, error count and latency of a gateway over
+    the last ``minutes`` minutes. Percentiles are histogram bucket bounds.
+    """
+    current = int(time.time() // 60)
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for minute in range(current - minutes + 1, current + 1):
+        pipe.hgetall(_stats_key(name, minute))
+
+    totals = {}
+    for fields in pipe.execute():
+        for field, value in fields.items():
+            endpoint, _, metric = field.decode().partition(':')
+            entry = totals.setdefault(endpoint, {'count': 0, 'errors': 0, 'ms': 0.0, 'buckets': {}})
+            if metric.startswith('le:'):
+                bound = metric[3:]
+                entry['buckets'][bound] = entry['buckets'].get(bound, 0) + int(value)
+            elif metric == 'ms':
+                entry['ms'] += float(value)
+            else:
+                entry[metric] += int(value)
+
+    stats = {}
+    for endpoint, entry in sorted(totals.items()):
+        count = entry['count']
+        stats[endpoint] = {
+            'requests': count,
+            'errors': entry['errors'],
+            'rate_per_second': round(count / (minutes * 60), 2),
+            'avg_ms': round(entry['ms'] / count, 1) if count else 0,
+            'p95_ms': _percentile(entry['buckets'], count, 95) if count else 0,
+        }
+    return stats
+
+
+def last_seen(names):
+    """Return {name: (epoch seconds, ip)} recorded in Redis."""
+    names = list(names)
+    if not names:
+        return {}
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    pipe.hmget(SEEN_KEY, names)
+    pipe.hmget(ADDRESS_KEY, names)
+    seen, addresses = pipe.execute()
+    return {
+        name: (int(ts), ip.decode() if ip else None)
+        for name, ts, ip in zip(names, seen, addresses)
+        if ts
+    }
+
+
+def is_healthy(seen_at, now=None):
+    """A gateway is healthy when it called within ``GATEWAY_HEALTH_TIMEOUT``."""
+    if seen_at is None:
+        return False
+    now = now or timezone.now()
+    return (now - seen_at).total_seconds() <= settings.PORTAL_CONFIG['GATEWAY_HEALTH_TIMEOUT']
+
+
+def sync_health():
+    """
+    Copy last-seen times and addresses from Redis to the database.
+
+    Returns:
+        int: number of gateways updated
+    """
+    gateways = list(Gateway.objects.all())
+    seen = last_seen(gateway.name for gateway in gateways)
+    updated = []
+    for gateway in gateways:
+        if gateway.name not in seen:
+            continue
+        ts, ip = seen[gateway.name]
+        seen_at = datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+        if gateway.last_seen_at != seen_at or gateway.last_ip != ip:
+            gateway.last_seen_at = seen_at
+            gateway.last_ip = ip
+            updated.append(gateway)
+    Gateway.objects.bulk_update(updated, ['last_seen_at', 'last_ip'])
+    return len(updated)
@@ -0,0 +1,267 @@
+"""
+Load generator simulating gateways and their clients.
+
+Each client goes through the gateway flow against a running portal:
+``authorize`` (unknown client, redirected), ``login`` with a voucher or
+credentials, periodic counter reports batched per gateway on
+``heartbeat``, and ``session-end`` when it leaves (binauth
+``client_deauth``). Arrival times follow a pattern:
+
+- ``steady``: uniform arrivals over the run
+- ``storm``: most clients arrive in the first tenth of the run (opening
+  hours)
+- ``reboot``: everyone arrives at once, then half-way through every
+  gateway reboots and all its clients reconnect together
+
+Only depends on httpx; the Django command sets up credentials.
+"""
+import asyncio
+import random
+import time
+import httpx
+
+PATTERNS = ('steady', 'storm', 'reboot')
+
+# Latency histogram bounds in milliseconds
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class EndpointStats:
+    """Latencies and errors of one endpoint."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+
+    def record(self, elapsed, error=None):
+        self.latencies.append(elapsed * 1000)
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    def percentile(self, p):
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if ordered else 0
+
+    def histogram(self):
+        counts = [0] * (len(BUCKETS) + 1)
+        for latency in self.latencies:
+            for i, bound in enumerate(BUCKETS):
+                if latency <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+
+class Client:
+    """A simulated client: identity, schedule and cumulative counters."""
+
+    def __init__(self, mac, ip, login, arrival, stay):
+        self.mac = mac
+        self.ip = ip
+        self.login = login
+        self.arrival = arrival
+        self.stay = stay
+        self.downloaded = 0
+        self.uploaded = 0
+        self.connected = False
+        self.token = None
+
+
+class Gateway:
+    """One gateway: its clients and the HTTP connections it holds."""
+
+    def __init__(self, run, clients):
+        self.run = run
+        self.clients = clients
+        self.http = None
+
+    def open(self):
+        self.http = httpx.AsyncClient(
+            base_url=self.run.base_url,
+            timeout=self.run.timeout,
+            limits=httpx.Limits(max_connections=self.run.connections),
+        )
+
+    async def post(self, name, path, payload):
+        """POST and record latency; returns the JSON body or None on error."""
+        started = time.perf_counter()
+        try:
+            response = await self.http.post(path, json=payload)
+        except httpx.HTTPError as e:
+            self.run.stats[name].record(time.perf_counter() - started, type(e).__name__)
+            return None
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            self.run.stats[name].record(elapsed, str(response.status_code))
+            return None
+        self.run.stats[name].record(elapsed)
+        return response.json()
+
+    async def connect(self, client):
+        """Ask the portal about the client, and log it in unless already allowed."""
+        body = await self.post('authorize', '/api/v1/portal/authorize/', {'mac': client.mac, 'ip': client.ip})
+        if body and body.get('status') == 'ALLOW':
+            client.connected = True
+            return
+        body = await self.post('login', '/api/v1/portal/login/', {'mac': client.mac, 'ip': client.ip, **client.login})
+        client.connected = body is not None
+        if body is not None:
+            # Unsigned usage reports must carry the session token
+            client.token = body['session']['token']
+
+    async def disconnect(self, client):
+        if not client.connected:
+            return
+        client.connected = False
+        await self.post('session_end', '/api/v1/portal/session-end/', {
+            'mac': client.mac,
+            'incoming': client.downloaded,
+            'outgoing': client.uploaded,
+            'timestamp': int(time.time()),
+            'session_token': client.token,
+        })
+
+    async def client_life(self, client, start):
+        await asyncio.sleep(max(start + client.arrival - time.monotonic(), 0))
+        await self.connect(client)
+        await asyncio.sleep(client.stay)
+        await self.disconnect(client)
+
+    async def heartbeats(self, until):
+        """Report the counters of all connected clients in one request."""
+        interval = self.run.heartbeat_interval
+        while time.monotonic() < until:
+            await asyncio.sleep(interval)
+            reports = []
+            for client in self.clients:
+                if not client.connected:
+                    continue
+                client.downloaded += random.randint(0, 2_000_000)
+                client.uploaded += random.randint(0, 200_000)
+                reports.append({
+                    'mac': client.mac,
+                    'incoming': client.downloaded,
+                    'outgoing': client.uploaded,
+                    'timestamp': int(time.time()),
+                    'session_token': client.token,
+                })
+            for i in range(0, len(reports), self.run.batch_size):
+                await self.post('heartbeat', '/api/v1/portal/heartbeat/', {'reports': reports[i:i + self.run.batch_size]})
+
+    async def reboot(self, at):
+        """
+        Lose all client state at ``at``: every client reconnects at once
+        and the gateway counters start again from zero.
+        """
+        await asyncio.sleep(max(at - time.monotonic(), 0))
+        connected = [client for client in self.clients if client.connected]
+        for client in connected:
+            client.connected = False
+            client.downloaded = client.uploaded = 0
+        await asyncio.gather(*(self.connect(client) for client in connected))
+
+
+class LoadRun:
+    """
+    Simulate ``gateways`` gateways sharing ``logins`` between their clients.
+
+    Args:
+        logins: list of login payloads ({'code': ...} or {'email',
+            'password'}), one client per entry
+    """
+
+    def __init__(self, base_url, logins, gateways=10, pattern='steady', duration=60,
+                 stay=30, heartbeat_interval=10, batch_size=500, connections=20, timeout=10):
+        self.base_url = base_url
+        self.pattern = pattern
+        self.duration = duration
+        self.heartbeat_interval = heartbeat_interval
+        self.batch_size = batch_size
+        self.connections = connections
+        self.timeout = timeout
+        self.stats = {name: EndpointStats() for name in ('authorize', 'login', 'heartbeat', 'session_end')}
+
+        clients = [[] for _ in range(gateways)]
+        for i, login in enumerate(logins):
+            g, c = i % gateways, i // gateways
+            arrival = self._arrival()
+            clients[g].append(Client(
+                mac=f"02:4c:47:{g:02x}:{c >> 8 & 0xff:02x}:{c & 0xff:02x}",
+                ip=f"10.{g & 0xff}.{c >> 8 & 0xff}.{c & 0xff}",
+                login=login,
+                arrival=arrival,
+                stay=min(random.expovariate(1 / stay), max(duration - arrival, 0)),
+            ))
+        self.gateways = [Gateway(self, group) for group in clients if group]
+
+    def _arrival(self):
+        if self.pattern == 'reboot':
+            return 0.0
+        if self.pattern == 'storm' and random.random() < 0.8:
+            return random.uniform(0, self.duration / 10)
+        return random.uniform(0, self.duration)
+
+    async def _run(self):
+        for gateway in self.gateways:
+            gateway.open()
+        start = time.monotonic()
+        until = start + self.duration
+        tasks = []
+        for gateway in self.gateways:
+            tasks.extend(gateway.client_life(client, start) for client in gateway.clients)
+            tasks.append(gateway.heartbeats(until))
+            if self.pattern == 'reboot':
+                tasks.append(gateway.reboot(start + self.duration / 2))
+        await asyncio.gather(*tasks)
+        # Clients still connected leave at the end
+        await asyncio.gather(*(
+            gateway.disconnect(client) for gateway in self.gateways for client in gateway.clients
+        ))
+        for gateway in self.gateways:
+            await gateway.http.aclose()
+
+    def run(self):
+        """Run the simulation and return the elapsed time in seconds."""
+        started = time.perf_counter()
+        asyncio.run(self._run())
+        return time.perf_counter() - started
+
+    def report(self, elapsed):
+        """Lines of text summarising throughput, latencies and errors."""
+        total = sum(stats.count for stats in self.stats.values())
+        errors = sum(sum(stats.errors.values()) for stats in self.stats.values())
+        lines = [
+            f"{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s, "
+            f"{errors} errors ({errors / total * 100 if total else 0:.2f}%)",
+            '',
+            f"{'endpoint':<12} {'count':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+        ]
+        for name, stats in self.stats.items():
+            if not stats.count:
+                continue
+            lines.append(
+                f"{name:<12} {stats.count:>7} {stats.count / elapsed:>8.1f} {sum(stats.errors.values()):>7} "
+                f"{stats.percentile(50):>8.1f} {stats.percentile(95):>8.1f} {stats.percentile(99):>8.1f} "
+                f"{max(stats.latencies):>8.1f}"
+            )
+
+        labels = [f"<={bound}" for bound in BUCKETS] + [f">{BUCKETS[-1]}"]
+        for name, stats in self.stats.items():
+            if not stats.count:
+                continue
+            lines.append('')
+            lines.append(f"{name} latency (ms)")
+            counts = stats.histogram()
+            peak = max(counts)
+            for label, count in zip(labels, counts):
+                if count:
+                    lines.append(f"  {label:>7} {count:>7} {'#' * max(int(count / peak * 40), 1)}")
+            if stats.errors:
+                lines.append('  errors: ' + ', '.join(f"{error} x{n}" for error, n in sorted(stats.errors.items())))
+        return lines
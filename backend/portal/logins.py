@@ -0,0 +1,227 @@
+"""
+Client logins shared by the HTTP portal, the gateway API and the RADIUS
+server, including the automatic re-authorization of known devices that
+come back under a new MAC: by their device cookie on the portal, by a
+MAC they used before on gateway calls. DHCP traits observed by signed
+gateways never log a device in; they only hint at the account to use.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from access import fingerprints
+from access.devices import admit as admit_device
+from access.models import Device, Session
+from access.quota import get_limits, is_exceeded
+from access.sessions import close_sessions, open_session, session_expiry
+from accounts.models import User
+from audit.utils import audit_login_attempt
+from .models import CaptiveBinding
+
+logger = logging.getLogger(__name__)
+
+
+class LoginRefused(Exception):
+    """Raised when a client may not log in; ``code`` is the API error code."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def admit_user(user, mac, ip):
+    """
+    Open a session for an authenticated user on the device ``mac``.
+
+    Checks the subscription, quota, device revocation and device limit.
+
+    Raises:
+        LoginRefused: when the user may not connect this device
+    """
+    limits = get_limits([user.id]).get(user.id)
+    if not limits:
+        raise LoginRefused('SUBSCRIPTION_EXPIRED', 'No active subscription')
+    if is_exceeded(user.id):
+        raise LoginRefused('QUOTA_EXCEEDED', 'Quota exceeded')
+
+    device, _ = Device.objects.get_or_create(
+        user=user, mac_address=mac, defaults={'name': mac}
+    )
+    if device.is_revoked:
+        raise LoginRefused('DEVICE_REVOKED', 'Device has been revoked')
+    if not admit_device(user.id, mac, limits['max_devices']):
+        raise LoginRefused('DEVICE_LIMIT_REACHED', 'Device limit reached')
+
+    session = open_session(mac, ip, user_id=user.id, device=device)
+    Device.objects.filter(id=device.id).update(last_ip=ip, last_seen=timezone.now())
+    audit_login_attempt(user, True, ip_address=ip, metadata={'mac_address': mac, 'session_id': session.id})
+    return session
+
+
+def bind_session(session, redirect_url=''):
+    """Bind the client to its new session."""
+    return CaptiveBinding.objects.create(
+        mac_address=session.mac_address,
+        ip_address=session.ip_address,
+        user_id=session.user_id,
+        session=session,
+        authorized_at=session.start_time,
+        expires_at=session_expiry(session.start_time),
+        redirect_url=redirect_url,
+    )
+
+
+def remember_device(device, token_hash='', fingerprint=''):
+    """Record the cookie and traits a device logged in with, and index it."""
+    changed = []
+    if token_hash and device.token_hash != token_hash:
+        device.token_hash = token_hash
+        changed.append('token_hash')
+    if fingerprint and device.fingerprint != fingerprint:
+        device.fingerprint = fingerprint
+        changed.append('fingerprint')
+    if changed:
+        device.save(update_fields=changed + ['updated_at'])
+    fingerprints.index(device)
+
+
+def _refused_key(mac):
+    return f"portal:reauth:refused:{mac}"
+
+
+def _traits_key(mac):
+    return f"portal:reauth:traits:{mac}"
+
+
+def observe_traits(fingerprints_by_mac):
+    """
+    Remember the fingerprints of DHCP traits a signed gateway reported for
+    denied clients, for ``DEVICE_TRAITS_TTL`` seconds, so that the login
+    that follows records gateway-observed traits rather than the client's.
+    """
+    entries = {_traits_key(mac): fingerprint for mac, fingerprint in fingerprints_by_mac.items() if fingerprint}
+    if entries:
+        cache.set_many(entries, timeout=settings.PORTAL_CONFIG['DEVICE_TRAITS_TTL'])
+
+
+def observed_fingerprint(mac):
+    """Fingerprint a signed gateway last reported for ``mac``, or ''."""
+    return cache.get(_traits_key(mac), '')
+
+
+def _email_hint(email):
+    name, _, domain = email.partition('@')
+    return f"{name[:1]}***@{domain}"
+
+
+def login_hints(hashes):
+    """
+    Masked email of the account whose device has each fingerprint, to
+    pre-fill the portal login form. Never logs anyone in.
+
+    Returns:
+        list of str or None, in input order
+    """
+    hints = [None] * len(hashes)
+    if not settings.PORTAL_CONFIG['DEVICE_AUTO_REAUTH'] or not any(hashes):
+        return hints
+    try:
+        device_ids = fingerprints.recognize([{'fingerprint': fingerprint} for fingerprint in hashes])
+    except Exception as e:
+        logger.warning(f"Device fingerprint lookup failed: {e}")
+        return hints
+    emails = dict(
+        Device.objects
+        .filter(id__in=[device_id for device_id in device_ids if device_id],
+                is_revoked=False, user__status=User.Status.ACTIVE)
+        .values_list('id', 'user__email')
+    )
+    return [
+        _email_hint(emails[device_id]) if device_id in emails else None
+        for device_id in device_ids
+    ]
+
+
+def reauthorize(device_id, mac, ip):
+    """
+    Log a recognized device back in under its new MAC.
+
+    Only a device of an active user, not revoked, seen within
+    ``DEVICE_REAUTH_WINDOW`` and whose last session was not revoked is
+    re-authorized; the same subscription, quota and device limit checks
+    as a login apply. Sessions still open on its previous MAC are closed,
+    so the device is counted once.
+
+    Raises:
+        LoginRefused: when the device must log in again
+    """
+    device = Device.objects.select_related('user').filter(id=device_id).first()
+    if device is None or device.mac_address == mac:
+        # Same MAC as its last login: a regular login is required
+        raise LoginRefused('NOT_AUTHORIZED', 'Login required')
+    if device.is_revoked:
+        raise LoginRefused('DEVICE_REVOKED', 'Device has been revoked')
+    user = device.user
+    if user.status != User.Status.ACTIVE or user.is_locked:
+        raise LoginRefused('NOT_AUTHORIZED', 'Login required')
+    window = timedelta(seconds=settings.PORTAL_CONFIG['DEVICE_REAUTH_WINDOW'])
+    if device.last_seen is None or device.last_seen < timezone.now() - window:
+        raise LoginRefused('NOT_AUTHORIZED', 'Login required')
+    last_status = (
+        Session.objects.filter(device=device).order_by('-start_time')
+        .values_list('status', flat=True).first()
+    )
+    if last_status == Session.Status.REVOKED:
+        raise LoginRefused('NOT_AUTHORIZED', 'Login required')
+
+    stale = Session.objects.filter(
+        device=device, status=Session.Status.AUTHORIZED
+    ).exclude(mac_address=mac).values_list('id', flat=True)
+    close_sessions(stale)
+    fingerprints.adopt(device, mac)
+    session = admit_user(user, mac, ip)
+    bind_session(session)
+    return session
+
+
+def reauthorize_clients(clients):
+    """
+    Recognize and re-authorize a batch of denied clients with one index
+    lookup.
+
+    A client with a device cookie is recognized by the cookie alone (the
+    portal, where the MAC is only what the client claims); the others by
+    a MAC their device used before (gateways, which observe the MAC).
+
+    Args:
+        clients: list of dicts with ``mac`` and ``ip``, and optional
+            ``token_hash``
+
+    Returns:
+        list of Session or None, in input order
+    """
+    sessions = [None] * len(clients)
+    if not settings.PORTAL_CONFIG['DEVICE_AUTO_REAUTH'] or not clients:
+        return sessions
+    try:
+        # MACs refused recently are not looked up again on every poll
+        refused = cache.get_many([_refused_key(client['mac']) for client in clients])
+        pending = [i for i, client in enumerate(clients) if _refused_key(client['mac']) not in refused]
+        device_ids = fingerprints.recognize([
+            {'token_hash': clients[i]['token_hash']} if clients[i].get('token_hash') else {'mac': clients[i]['mac']}
+            for i in pending
+        ])
+    except Exception as e:
+        logger.warning(f"Device recognition failed: {e}")
+        return sessions
+
+    for i, device_id in zip(pending, device_ids):
+        if device_id is None:
+            continue
+        client = clients[i]
+        try:
+            sessions[i] = reauthorize(device_id, client['mac'], client['ip'])
+        except LoginRefused:
+            cache.set(_refused_key(client['mac']), True, settings.PORTAL_CONFIG['DEVICE_REAUTH_BACKOFF'])
+    return sessions
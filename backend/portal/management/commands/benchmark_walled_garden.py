@@ -0,0 +1,73 @@
+"""
+Measure walled garden lookups per second on a synthetic rule set.
+"""
+import ipaddress
+import random
+import time
+from django.core.management.base import BaseCommand
+from portal.walledgarden import WalledGarden, compile_garden
+
+TLDS = ['com', 'net', 'org', 'fr', 'io']
+
+
+def _domain(rng):
+    labels = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 10))) for _ in range(rng.randint(1, 2))]
+    return '.'.join(labels + [rng.choice(TLDS)])
+
+
+def _network(rng):
+    prefix = rng.choice([8, 12, 16, 20, 24, 28, 32])
+    return str(ipaddress.ip_network((rng.getrandbits(32), prefix), strict=False))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark walled garden lookups (synthetic rules, or the stored ones with --stored)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', type=int, default=5000)
+        parser.add_argument('--networks', type=int, default=2000)
+        parser.add_argument('--lookups', type=int, default=200000)
+        parser.add_argument('--hit-ratio', type=float, default=0.2)
+        parser.add_argument('--stored', action='store_true', help='Use the rules in SystemConfig')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        started = time.perf_counter()
+        if options['stored']:
+            garden = compile_garden()
+        else:
+            rules = [_domain(rng) for _ in range(options['domains'])]
+            rules += [_network(rng) for _ in range(options['networks'])]
+            garden = WalledGarden('\n'.join(rules))
+        compiled = time.perf_counter() - started
+        self.stdout.write(
+            f"Compiled {len(garden.domains)} domains and {len(garden.networks)} networks "
+            f"in {compiled * 1000:.1f} ms"
+        )
+
+        known = [domain for domain, _ in garden.domains]
+        hosts = []
+        for _ in range(min(options['lookups'], 50000)):
+            if rng.random() < 0.5:
+                if known and rng.random() < options['hit_ratio']:
+                    hosts.append(f"www.{rng.choice(known)}")
+                else:
+                    hosts.append(_domain(rng))
+            else:
+                hosts.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+
+        match = garden.match
+        lookups = options['lookups']
+        hits = 0
+        started = time.perf_counter()
+        for i in range(lookups):
+            if match(hosts[i % len(hosts)]) is not None:
+                hits += 1
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{lookups} lookups in {elapsed:.2f}s: {lookups / elapsed:,.0f} lookups/s "
+            f"({elapsed / lookups * 1e6:.2f} µs each, {hits} allowed)"
+        ))
@@ -0,0 +1,63 @@
+"""
+Convert varchar MAC address columns to 48-bit integers.
+
+Data migration for ``MACAddressField``: rewrites ``mac_address`` of
+devices, sessions and captive bindings in place. Indexes on the columns
+are rebuilt by PostgreSQL as part of the type change.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from access.models import Device, Session
+from portal.models import CaptiveBinding
+
+_HEX = "regexp_replace({column}, '[^0-9A-Fa-f]', '', 'g')"
+
+_INVALID_SQL = f"SELECT count(*) FROM {{table}} WHERE length({_HEX}) <> 12"
+
+_CONVERT_SQL = (
+    f"ALTER TABLE {{table}} ALTER COLUMN {{column}} TYPE bigint "
+    f"USING ('x' || lpad({_HEX}, 16, '0'))::bit(64)::bigint"
+)
+
+_TYPE_SQL = """
+SELECT data_type FROM information_schema.columns
+WHERE table_name = %s AND column_name = %s
+"""
+
+
+class Command(BaseCommand):
+    help = 'Convert mac_address columns from varchar to 48-bit integers (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Print the statements only')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This conversion requires PostgreSQL')
+
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor, transaction.atomic():
+            for model in (Device, Session, CaptiveBinding):
+                db_table = model._meta.db_table
+                column = model._meta.get_field('mac_address').column
+                table = qn(db_table)
+
+                cursor.execute(_TYPE_SQL, [db_table, column])
+                row = cursor.fetchone()
+                if row is None or row[0] == 'bigint':
+                    self.stdout.write(f"{db_table}.{column}: already converted")
+                    continue
+
+                cursor.execute(_INVALID_SQL.format(table=table, column=qn(column)))
+                invalid = cursor.fetchone()[0]
+                if invalid:
+                    raise CommandError(
+                        f"{db_table} has {invalid} rows with an invalid MAC address; fix them first"
+                    )
+
+                sql = _CONVERT_SQL.format(table=table, column=qn(column))
+                if options['dry_run']:
+                    self.stdout.write(sql)
+                    continue
+                cursor.execute(sql)
+                self.stdout.write(self.style.SUCCESS(f"{db_table}.{column}: converted"))
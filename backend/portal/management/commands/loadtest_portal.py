@@ -0,0 +1,94 @@
+"""
+Simulate gateways and clients against a running portal.
+"""
+import csv
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from access.models import Voucher
+from access.vouchers import mint_vouchers
+from billing.models import Plan
+from portal.loadgen import PATTERNS, LoadRun
+
+
+class Command(BaseCommand):
+    help = 'Load test the gateway flow (authorize, login, heartbeats, session end) over HTTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the portal')
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--gateways', type=int, default=10)
+        parser.add_argument('--pattern', choices=PATTERNS, default='steady')
+        parser.add_argument('--duration', type=int, default=60, help='Seconds')
+        parser.add_argument('--stay', type=int, default=30, help='Mean seconds a client stays')
+        parser.add_argument('--heartbeat-interval', type=int, default=10, help='Seconds')
+        parser.add_argument('--batch-size', type=int, default=500, help='Reports per heartbeat request')
+        parser.add_argument('--connections', type=int, default=20, help='HTTP connections per gateway')
+        parser.add_argument('--voucher-plan', help='Mint one test voucher per client for this plan code')
+        parser.add_argument('--created-by', help='Email of the admin issuing the test vouchers')
+        parser.add_argument('--credentials', help='CSV of email,password used in turn by the other clients')
+        parser.add_argument('--keep', action='store_true', help='Keep the test vouchers')
+
+    def handle(self, *args, **options):
+        if not options['voucher_plan'] and not options['credentials']:
+            raise CommandError('Give --voucher-plan and/or --credentials')
+
+        batch = None
+        clients = options['clients']
+        logins = []
+        if options['voucher_plan']:
+            voucher_clients = clients if not options['credentials'] else clients // 2
+            batch, codes = self._mint(options['voucher_plan'], options['created_by'], voucher_clients)
+            logins.extend({'code': code} for code in codes)
+        if options['credentials']:
+            accounts = self._credentials(options['credentials'])
+            for i in range(clients - len(logins)):
+                logins.append(accounts[i % len(accounts)])
+
+        run = LoadRun(
+            options['url'],
+            logins,
+            gateways=options['gateways'],
+            pattern=options['pattern'],
+            duration=options['duration'],
+            stay=options['stay'],
+            heartbeat_interval=options['heartbeat_interval'],
+            batch_size=options['batch_size'],
+            connections=options['connections'],
+        )
+        self.stdout.write(
+            f"{len(logins)} clients on {len(run.gateways)} gateways, "
+            f"{options['pattern']} arrivals over {options['duration']}s against {options['url']}"
+        )
+        try:
+            elapsed = run.run()
+        finally:
+            if batch and not options['keep']:
+                Voucher.objects.filter(batch=batch).delete()
+
+        for line in run.report(elapsed):
+            self.stdout.write(line)
+
+    def _mint(self, plan_code, created_by, count):
+        try:
+            plan = Plan.objects.get(code=plan_code)
+            admin = get_user_model().objects.get(email=created_by)
+        except (Plan.DoesNotExist, get_user_model().DoesNotExist) as e:
+            raise CommandError(str(e))
+        now = timezone.now()
+        batch, vouchers = mint_vouchers(plan, count, admin, now, now + timedelta(days=1))
+        return batch, [voucher.code for voucher in vouchers]
+
+    def _credentials(self, path):
+        try:
+            with open(path, newline='') as f:
+                accounts = [
+                    {'email': row[0], 'password': row[1]}
+                    for row in csv.reader(f) if len(row) >= 2
+                ]
+        except OSError as e:
+            raise CommandError(f"Cannot read credentials: {e}")
+        if not accounts:
+            raise CommandError('No credentials found')
+        return accounts
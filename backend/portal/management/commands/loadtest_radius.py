@@ -0,0 +1,83 @@
+"""
+Simulate RADIUS controllers and clients against a running RADIUS server.
+"""
+import secrets
+from django.core.management.base import CommandError
+from access.models import Voucher
+from portal.loadgen import PATTERNS
+from portal.models import Gateway
+from portal.radius.loadgen import RadiusLoadRun
+from .loadtest_portal import Command as PortalLoadTestCommand
+
+
+class Command(PortalLoadTestCommand):
+    help = 'Load test the RADIUS flow (access, login, accounting start/interim/stop) with a local client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address of the RADIUS server')
+        parser.add_argument('--auth-port', type=int, default=1812)
+        parser.add_argument('--acct-port', type=int, default=1813)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--gateways', type=int, default=10,
+                            help='Controllers, registered as radius-loadtest-<n> gateways')
+        parser.add_argument('--pattern', choices=PATTERNS, default='steady')
+        parser.add_argument('--duration', type=int, default=60, help='Seconds')
+        parser.add_argument('--stay', type=int, default=30, help='Mean seconds a client stays')
+        parser.add_argument('--interim-interval', type=int, default=10, help='Seconds')
+        parser.add_argument('--sockets', type=int, default=4, help='UDP sockets per controller and port')
+        parser.add_argument('--voucher-plan', help='Mint one test voucher per client for this plan code')
+        parser.add_argument('--created-by', help='Email of the admin issuing the test vouchers')
+        parser.add_argument('--credentials', help='CSV of email,password used in turn by the other clients')
+        parser.add_argument('--keep', action='store_true', help='Keep the test vouchers and gateways')
+
+    def handle(self, *args, **options):
+        if not options['voucher_plan'] and not options['credentials']:
+            raise CommandError('Give --voucher-plan and/or --credentials')
+
+        batch = None
+        clients = options['clients']
+        logins = []
+        if options['voucher_plan']:
+            voucher_clients = clients if not options['credentials'] else clients // 2
+            batch, codes = self._mint(options['voucher_plan'], options['created_by'], voucher_clients)
+            logins.extend({'code': code} for code in codes)
+        if options['credentials']:
+            accounts = self._credentials(options['credentials'])
+            for i in range(clients - len(logins)):
+                logins.append(accounts[i % len(accounts)])
+
+        gateways = []
+        for n in range(options['gateways']):
+            gateway, _ = Gateway.objects.get_or_create(
+                name=f"radius-loadtest-{n}",
+                defaults={'secret': secrets.token_urlsafe(32), 'site': 'loadtest'},
+            )
+            gateways.append((gateway.name, gateway.secret))
+
+        run = RadiusLoadRun(
+            options['host'],
+            gateways,
+            logins,
+            auth_port=options['auth_port'],
+            acct_port=options['acct_port'],
+            sockets=options['sockets'],
+            pattern=options['pattern'],
+            duration=options['duration'],
+            stay=options['stay'],
+            interim_interval=options['interim_interval'],
+        )
+        self.stdout.write(
+            f"{len(logins)} clients on {len(run.gateways)} controllers, "
+            f"{options['pattern']} arrivals over {options['duration']}s against "
+            f"{options['host']}:{options['auth_port']}/{options['acct_port']}"
+        )
+        try:
+            elapsed = run.run()
+        finally:
+            if not options['keep']:
+                if batch:
+                    Voucher.objects.filter(batch=batch).delete()
+                Gateway.objects.filter(name__in=[name for name, _ in gateways]).delete()
+
+        for line in run.report(elapsed):
+            self.stdout.write(line)
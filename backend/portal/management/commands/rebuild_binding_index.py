@@ -0,0 +1,13 @@
+"""
+Rebuild the current-binding index from the database.
+"""
+from django.core.management.base import BaseCommand
+from portal.bindings import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the MAC/IP index of current captive bindings from portal_captivebinding'
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} current bindings"))
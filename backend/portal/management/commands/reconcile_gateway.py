@@ -0,0 +1,46 @@
+"""
+Reconcile the sessions with a gateway client list dump.
+"""
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from portal.gateways import get_gateway
+from portal.reconcile import parse_clients, reconcile_clients
+
+
+class Command(BaseCommand):
+    help = 'Reconcile authorized sessions with a client list (JSON list or ndsctl json output)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('gateway', help='Name of the registered gateway the list comes from')
+        parser.add_argument('path', help='JSON file, - for stdin')
+
+    def handle(self, *args, **options):
+        gateway = get_gateway(options['gateway'])
+        if gateway is None:
+            raise CommandError(f"Unknown gateway {options['gateway']}")
+
+        try:
+            if options['path'] == '-':
+                data = json.load(sys.stdin)
+            else:
+                with open(options['path']) as f:
+                    data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read client list: {e}")
+
+        if isinstance(data, dict) and 'clients' in data:
+            data = data['clients']
+        clients = parse_clients(data)
+        if clients is None:
+            raise CommandError('Malformed client list')
+        if not clients:
+            raise CommandError('Empty client list')
+
+        result = reconcile_clients(clients, gateway.name)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['active']} active, {result['closed']} orphaned sessions closed, "
+            f"{len(result['deauthorize'])} clients to deauthorize"
+        ))
+        for mac in result['deauthorize']:
+            self.stdout.write(mac)
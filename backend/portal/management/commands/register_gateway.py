@@ -0,0 +1,38 @@
+"""
+Register a gateway or rotate its shared secret.
+"""
+import re
+import secrets
+from django.core.management.base import BaseCommand, CommandError
+from portal.models import Gateway
+
+
+class Command(BaseCommand):
+    help = 'Register a gateway (or rotate its secret) and print the secret to configure on it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Gateway identifier (slug), sent as X-Gateway-Id')
+        parser.add_argument('--site', default='', help='Site the gateway belongs to')
+        parser.add_argument('--rate-limit', default='', help="Request rate such as '1200/min'")
+        parser.add_argument('--rotate', action='store_true', help='Generate a new secret for an existing gateway')
+
+    def handle(self, *args, **options):
+        if options['rate_limit'] and not re.fullmatch(r'\d+/[smhd]\w*', options['rate_limit']):
+            raise CommandError("--rate-limit must look like '1200/min'")
+
+        gateway, created = Gateway.objects.get_or_create(
+            name=options['name'],
+            defaults={'secret': secrets.token_urlsafe(32)},
+        )
+        if options['rotate'] and not created:
+            gateway.secret = secrets.token_urlsafe(32)
+        if options['site']:
+            gateway.site = options['site']
+        if options['rate_limit']:
+            gateway.rate_limit = options['rate_limit']
+        gateway.save()
+
+        action = 'Registered' if created else 'Updated'
+        self.stdout.write(self.style.SUCCESS(f"{action} gateway {gateway}"))
+        if created or options['rotate']:
+            self.stdout.write(f"Secret: {gateway.secret}")
@@ -0,0 +1,43 @@
+"""
+Run the RADIUS authentication and accounting server.
+"""
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from portal.radius.server import RadiusServer
+
+
+class Command(BaseCommand):
+    help = 'Serve RADIUS Access-Requests and accounting from the portal authorization cache'
+
+    def add_arguments(self, parser):
+        config = settings.PORTAL_CONFIG
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--auth-port', type=int, default=config['RADIUS_AUTH_PORT'])
+        parser.add_argument('--acct-port', type=int, default=config['RADIUS_ACCT_PORT'])
+        parser.add_argument('--workers', type=int, default=config['RADIUS_WORKERS'],
+                            help='Threads handling request batches')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between packet counter lines, 0 to disable')
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self._serve(options))
+        except KeyboardInterrupt:
+            pass
+
+    async def _serve(self, options):
+        server = RadiusServer(workers=options['workers'])
+        await server.start(options['host'], options['auth_port'], options['acct_port'])
+        addresses = server.addresses()
+        self.stdout.write(self.style.SUCCESS(
+            f"RADIUS server on {addresses['auth'][0]} auth {addresses['auth'][1]}, acct {addresses['acct'][1]}"
+        ))
+        try:
+            while True:
+                if not options['stats_interval']:
+                    await asyncio.Event().wait()
+                await asyncio.sleep(options['stats_interval'])
+                self.stdout.write(' '.join(f"{name}={count}" for name, count in server.stats.items()))
+        finally:
+            server.close()
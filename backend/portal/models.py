@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from access.fields import MACAddressField
 
 class SystemConfig(models.Model):
     key = models.CharField(max_length=100, unique=True)
@@ -24,7 +25,7 @@ class CaptiveBinding(models.Model):
         COOVACHILLI = 'COOVACHILLI', 'CoovaChilli'
         MANUAL = 'MANUAL', 'Manual'
 
-    mac_address = models.CharField(max_length=17)
+    mac_address = MACAddressField()
     ip_address = models.GenericIPAddressField()
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
@@ -48,4 +49,28 @@ class CaptiveBinding(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.mac_address} -> {self.ip_address}"
\ No newline at end of file
+        return f"{self.mac_address} -> {self.ip_address}"
+
+class Gateway(models.Model):
+    """An access point or site controller allowed to call the gateway API."""
+    name = models.SlugField(max_length=64, unique=True)
+    site = models.CharField(max_length=100, blank=True)
+    secret = models.CharField(max_length=128)  # HMAC key shared with the gateway
+    is_active = models.BooleanField(default=True)
+    rate_limit = models.CharField(max_length=32, blank=True)  # e.g. '1200/min', blank for the default
+    
+    # Health, synced from Redis by portal.tasks.sync_gateway_health
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    last_ip = models.GenericIPAddressField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'portal_gateway'
+        indexes = [
+            models.Index(fields=['site']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.site})" if self.site else self.name
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Responder for OS captive-portal detection probes.
+
+Phones and laptops fetch their connectivity-check URLs every few seconds.
+``ProbeResponder`` wraps the WSGI application and answers these requests
+before the Django middleware stack runs: the client MAC, set by the
+gateway in a header or the query string, is looked up in the
+authorization decision cache only. No session, CSRF token or database
+connection is involved.
+
+An authorized client gets the response its OS expects, so it considers
+the network online. Anyone else, or a cache miss, is redirected to the
+portal login page, which makes the OS open its captive-portal browser.
+"""
+import logging
+from urllib.parse import parse_qs, urlencode
+from django.conf import settings
+from access.utils import normalize_mac
+from .authcache import ALLOW, get_decisions, locate
+
+logger = logging.getLogger(__name__)
+
+_APPLE_SUCCESS = b'<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>'
+
+# Probe path -> (status, content type, body) expected by the OS
+PROBES = {
+    '/generate_204': ('204 No Content', None, b''),  # Android, ChromeOS
+    '/gen_204': ('204 No Content', None, b''),
+    '/hotspot-detect.html': ('200 OK', 'text/html', _APPLE_SUCCESS),  # iOS, macOS
+    '/library/test/success.html': ('200 OK', 'text/html', _APPLE_SUCCESS),
+    '/connecttest.txt': ('200 OK', 'text/plain', b'Microsoft Connect Test'),  # Windows 10+
+    '/ncsi.txt': ('200 OK', 'text/plain', b'Microsoft NCSI'),  # older Windows
+    '/success.txt': ('200 OK', 'text/plain', b'success\n'),  # Firefox
+}
+
+_NO_CACHE = [('Cache-Control', 'no-cache, no-store, must-revalidate')]
+
+
+class ProbeResponder:
+    """WSGI middleware answering detection probes with pre-built responses."""
+
+    def __init__(self, application):
+        self.application = application
+        config = settings.PORTAL_CONFIG
+        self.enabled = config['PROBE_RESPONDER']
+        self.login_url = config['PROBE_LOGIN_URL']
+        self.mac_header = 'HTTP_' + config['PROBE_MAC_HEADER'].upper().replace('-', '_')
+        self.success = {}
+        for path, (status, content_type, body) in PROBES.items():
+            headers = _NO_CACHE + [('Content-Length', str(len(body)))]
+            if content_type:
+                headers.append(('Content-Type', f'{content_type}; charset=utf-8'))
+            self.success[path] = (status, headers, [body])
+        self.redirect_headers = _NO_CACHE + [('Content-Length', '0')]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not self.enabled or path not in self.success or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        mac = normalize_mac(environ.get(self.mac_header) or _first(query, 'mac') or _first(query, 'clientmac'))
+        if mac and self._allowed(mac):
+            status, headers, body = self.success[path]
+            start_response(status, headers)
+            return body
+
+        target = f"http://{environ.get('HTTP_HOST', '')}{path}"
+        params = {'url': target}
+        if mac:
+            params['mac'] = mac
+            params['ip'] = _first(query, 'ip') or environ.get('REMOTE_ADDR', '')
+        start_response('302 Found', self.redirect_headers + [
+            ('Location', f"{self.login_url}?{urlencode(params)}"),
+        ])
+        return [b'']
+
+    def _allowed(self, mac):
+        try:
+            decision = get_decisions([mac], locate([mac])[mac]).get(mac)
+        except Exception as e:
+            # Cache unreachable: send the client to the portal
+            logger.warning(f"Probe decision lookup failed: {e}")
+            return False
+        return bool(decision) and decision['status'] == ALLOW
+
+
+def _first(query, name):
+    values = query.get(name)
+    return values[0] if values else None
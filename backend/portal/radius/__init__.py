@@ -0,0 +1 @@
+# RADIUS authentication and accounting
\ No newline at end of file
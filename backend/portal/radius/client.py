@@ -0,0 +1,144 @@
+"""
+Asyncio RADIUS client playing the NAS side, for tests and load runs.
+
+Requests are spread over several UDP sockets, each with its own 256
+identifiers; replies are matched by identifier and checked against the
+Response Authenticator. Unanswered requests are retransmitted as is.
+"""
+import asyncio
+import ipaddress
+import socket
+import time
+from . import packet as rad
+
+
+class RadiusTimeout(Exception):
+    """Raised when a request got no valid reply after its retransmissions."""
+
+
+class _Channel(asyncio.DatagramProtocol):
+    """One client socket and its outstanding requests by identifier."""
+
+    def __init__(self, secret):
+        self.secret = secret
+        self.transport = None
+        self.pending = {}
+        self.free = asyncio.Queue()
+        for identifier in range(256):
+            self.free.put_nowait(identifier)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < rad.MIN_LENGTH:
+            return
+        entry = self.pending.get(data[1])
+        if entry is None:
+            return
+        future, authenticator = entry
+        if not future.done() and rad.verify_response(data, authenticator, self.secret):
+            future.set_result(rad.decode(data))
+
+
+class RadiusClient:
+    """
+    Sends Access- and Accounting-Requests as the NAS ``nas_identifier``.
+
+    Each call returns the decoded reply packet, or raises
+    ``RadiusTimeout``.
+    """
+
+    def __init__(self, host, secret, nas_identifier, auth_port=1812, acct_port=1813,
+                 sockets=4, timeout=2.0, retries=2, receive_buffer=1 << 22):
+        self.host = host
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.nas_identifier = nas_identifier
+        self.ports = {rad.ACCESS_REQUEST: auth_port, rad.ACCOUNTING_REQUEST: acct_port}
+        self.sockets = sockets
+        self.timeout = timeout
+        self.retries = retries
+        self.receive_buffer = receive_buffer
+        self.channels = {}
+        self.next_channel = 0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        for code, port in self.ports.items():
+            self.channels[code] = []
+            for _ in range(self.sockets):
+                transport, channel = await loop.create_datagram_endpoint(
+                    lambda: _Channel(self.secret),
+                    remote_addr=(self.host, port),
+                )
+                transport.get_extra_info('socket').setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer,
+                )
+                self.channels[code].append(channel)
+
+    def close(self):
+        for channels in self.channels.values():
+            for channel in channels:
+                channel.transport.close()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def send(self, code, attributes, password=None):
+        channels = self.channels[code]
+        channel = channels[self.next_channel % len(channels)]
+        self.next_channel += 1
+        identifier = await channel.free.get()
+        try:
+            datagram, authenticator = rad.encode_request(
+                code, identifier, attributes, self.secret, password=password,
+            )
+            future = asyncio.get_running_loop().create_future()
+            channel.pending[identifier] = (future, authenticator)
+            for _ in range(self.retries + 1):
+                channel.transport.sendto(datagram)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                except asyncio.TimeoutError:
+                    continue
+            raise RadiusTimeout(f"No reply from {self.host}:{self.ports[code]}")
+        finally:
+            channel.pending.pop(identifier, None)
+            channel.free.put_nowait(identifier)
+
+    def _client_attributes(self, mac, ip):
+        attributes = [
+            (rad.NAS_IDENTIFIER, self.nas_identifier.encode()),
+            (rad.CALLING_STATION_ID, mac.replace(':', '-').encode()),
+        ]
+        if ip:
+            attributes.append((rad.FRAMED_IP_ADDRESS, ipaddress.IPv4Address(ip).packed))
+        return attributes
+
+    async def access(self, mac, ip, username=None, password=None):
+        """Access-Request for a client, with a login when ``username`` is given."""
+        attributes = self._client_attributes(mac, ip)
+        attributes.append((rad.USER_NAME, (username or mac).encode()))
+        return await self.send(
+            rad.ACCESS_REQUEST, attributes,
+            password=(password or '').encode() if username else None,
+        )
+
+    async def accounting(self, status_type, mac, ip, session_id, uploaded=0, downloaded=0, session_time=0):
+        """Accounting-Request with cumulative counters of a client."""
+        attributes = self._client_attributes(mac, ip)
+        attributes.extend([
+            (rad.ACCT_STATUS_TYPE, status_type.to_bytes(4, 'big')),
+            (rad.ACCT_SESSION_ID, session_id.encode()),
+            (rad.ACCT_INPUT_OCTETS, (uploaded % (1 << 32)).to_bytes(4, 'big')),
+            (rad.ACCT_INPUT_GIGAWORDS, (uploaded >> 32).to_bytes(4, 'big')),
+            (rad.ACCT_OUTPUT_OCTETS, (downloaded % (1 << 32)).to_bytes(4, 'big')),
+            (rad.ACCT_OUTPUT_GIGAWORDS, (downloaded >> 32).to_bytes(4, 'big')),
+            (rad.ACCT_SESSION_TIME, session_time.to_bytes(4, 'big')),
+            (rad.EVENT_TIMESTAMP, int(time.time()).to_bytes(4, 'big')),
+        ])
+        return await self.send(rad.ACCOUNTING_REQUEST, attributes)
@@ -0,0 +1,260 @@
+"""
+Batch handlers answering RADIUS requests from the portal's state.
+
+They run in worker threads of the server, one batch of datagrams at a
+time, and return the reply datagrams; a request that gets no reply
+(unknown NAS, bad authenticator, or a failure while recording) is
+retransmitted by the NAS.
+"""
+import logging
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import ValidationError
+from access.sessions import close_sessions
+from access.utils import normalize_mac
+from access.vouchers import VoucherError, mac_guess_limited, use_voucher
+from accounts.serializers import LoginSerializer
+from audit.utils import audit_login_attempt
+from ..authcache import ALLOW, DEFAULT_GATEWAY
+from ..authorization import lookup_decisions
+from ..gateways import get_gateway, record_request
+from ..logins import LoginRefused, admit_user, bind_session, reauthorize_clients, remember_device
+from ..usage import record_usage, usage_reports
+from . import packet as rad
+
+logger = logging.getLogger(__name__)
+
+GIGAWORD = 1 << 32
+
+
+def gateway_secret(request):
+    """
+    Return (gateway name, secret bytes) of the NAS that sent ``request``.
+
+    The NAS-Identifier names the registered gateway; without one, or
+    for an unknown name, ``RADIUS_DEFAULT_SECRET`` (when set) admits the
+    NAS as the ``default`` gateway.
+    """
+    name = request.string(rad.NAS_IDENTIFIER)
+    gateway = get_gateway(name) if name else None
+    if gateway is not None:
+        return gateway.name, gateway.secret.encode()
+    default_secret = settings.PORTAL_CONFIG['RADIUS_DEFAULT_SECRET']
+    if default_secret:
+        return DEFAULT_GATEWAY, default_secret.encode()
+    return None, None
+
+
+def _authenticated(requests, verify):
+    """Group requests by gateway, dropping those that fail ``verify``."""
+    by_gateway = {}
+    for addr, request in requests:
+        name, secret = gateway_secret(request)
+        if name is None:
+            logger.warning(f"Dropped RADIUS request from unknown NAS {addr[0]} ({request.string(rad.NAS_IDENTIFIER)})")
+            continue
+        if not verify(request, secret):
+            logger.warning(f"Dropped RADIUS request from {addr[0]} with an invalid authenticator ({name})")
+            continue
+        by_gateway.setdefault(name, []).append((addr, request, secret))
+    return by_gateway
+
+
+def _verify_access(request, secret):
+    valid = rad.verify_message_authenticator(request, secret)
+    if valid is None:
+        return not settings.PORTAL_CONFIG['RADIUS_REQUIRE_MESSAGE_AUTHENTICATOR']
+    return valid
+
+
+def _accept(request, secret, ttl):
+    return rad.encode_reply(request, rad.ACCESS_ACCEPT, [
+        (rad.SESSION_TIMEOUT, ttl.to_bytes(4, 'big')),
+        (rad.ACCT_INTERIM_INTERVAL, settings.PORTAL_CONFIG['RADIUS_INTERIM_INTERVAL'].to_bytes(4, 'big')),
+    ], secret)
+
+
+def _reject(request, secret, message):
+    return rad.encode_reply(request, rad.ACCESS_REJECT, [
+        (rad.REPLY_MESSAGE, message.encode()[:253]),
+    ], secret)
+
+
+def _login(request, secret, mac, ip):
+    """
+    Log a client in with the User-Name/User-Password of its request:
+    an email address and password, or a voucher code as User-Name.
+
+    Returns:
+        Session
+
+    Raises:
+        LoginRefused: when the client may not log in
+    """
+    username = request.string(rad.USER_NAME)
+    hidden = request.get(rad.USER_PASSWORD)
+    if not username or hidden is None or normalize_mac(username):
+        # MAC authentication of a client that has not logged in yet
+        raise LoginRefused('NOT_AUTHORIZED', 'Login required')
+    if not ip:
+        raise LoginRefused('INVALID_REQUEST', 'MAC and IP required')
+    try:
+        password = rad.decrypt_password(hidden, secret, request.authenticator).decode('utf-8')
+    except (rad.PacketError, UnicodeDecodeError):
+        raise LoginRefused('INVALID_REQUEST', 'Invalid password')
+
+    if '@' not in username:
+        if mac_guess_limited(mac):
+            raise LoginRefused('TOO_MANY_ATTEMPTS', 'Too many invalid voucher codes, try again later')
+        try:
+            session, _ = use_voucher(username, mac, ip)
+        except VoucherError as e:
+            mac_guess_limited(mac, increment=True)
+            raise LoginRefused(e.code, str(e))
+        return session
+
+    serializer = LoginSerializer(data={'email': username, 'password': password})
+    try:
+        serializer.is_valid(raise_exception=True)
+    except ValidationError:
+        audit_login_attempt(
+            None, False, ip_address=ip,
+            metadata={'attempted_email': username, 'mac_address': mac}
+        )
+        raise LoginRefused('INVALID_CREDENTIALS', 'Invalid credentials')
+    session = admit_user(serializer.validated_data['user'], mac, ip)
+    remember_device(session.device)
+    return session
+
+
+def handle_access(requests):
+    """
+    Answer a batch of Access-Requests.
+
+    Clients the authorization cache already allows are accepted at once
+    (one multi-get per gateway); the others may log in with their
+    User-Name and User-Password like on the HTTP portal. A device
+    authenticating by MAC alone under a MAC it used before is recognized
+    and re-authorized (one index lookup per gateway). A login that fails
+    unexpectedly rejects only its own request.
+
+    Args:
+        requests: list of (addr, Packet)
+
+    Returns:
+        list of (addr, Packet, reply datagram)
+    """
+    close_old_connections()
+    replies = []
+    for name, entries in _authenticated(requests, _verify_access).items():
+        started = time.perf_counter()
+        macs = {normalize_mac(request.string(rad.CALLING_STATION_ID)) for _, request, _ in entries}
+        macs.discard(None)
+        decisions = lookup_decisions(macs, name)
+
+        # Denied clients without a login may be known devices
+        unknown = {}
+        for i, (_, request, _) in enumerate(entries):
+            mac = normalize_mac(request.string(rad.CALLING_STATION_ID))
+            ip = request.address(rad.FRAMED_IP_ADDRESS)
+            if mac and ip and decisions[mac]['status'] != ALLOW and request.get(rad.USER_PASSWORD) is None:
+                unknown[i] = {'mac': mac, 'ip': ip}
+        recognized = dict(zip(unknown, reauthorize_clients(list(unknown.values()))))
+
+        now = time.time()
+        failed = 0
+        for i, (addr, request, secret) in enumerate(entries):
+            mac = normalize_mac(request.string(rad.CALLING_STATION_ID))
+            if not mac:
+                replies.append((addr, request, _reject(request, secret, 'Valid MAC required')))
+                continue
+            decision = decisions[mac]
+            if decision['status'] == ALLOW:
+                ttl = max(int(decision['expires'] - now), 1)
+                replies.append((addr, request, _accept(request, secret, ttl)))
+                continue
+            if recognized.get(i) is not None:
+                replies.append((addr, request, _accept(request, secret, settings.PORTAL_CONFIG['SESSION_TIMEOUT'])))
+                continue
+            try:
+                session = _login(request, secret, mac, request.address(rad.FRAMED_IP_ADDRESS))
+                bind_session(session)
+            except LoginRefused as e:
+                replies.append((addr, request, _reject(request, secret, str(e))))
+                continue
+            except Exception as e:
+                logger.warning(f"RADIUS login of {mac} on {name} failed: {e}")
+                failed += 1
+                replies.append((addr, request, _reject(request, secret, 'Login failed')))
+                continue
+            ttl = settings.PORTAL_CONFIG['SESSION_TIMEOUT']
+            replies.append((addr, request, _accept(request, secret, ttl)))
+
+        elapsed = (time.perf_counter() - started) / len(entries)
+        if len(entries) > failed:
+            record_request(name, 'radius_access', elapsed, 200, ip=entries[0][0][0], count=len(entries) - failed)
+        if failed:
+            record_request(name, 'radius_access', elapsed, 500, ip=entries[0][0][0], count=failed)
+    return replies
+
+
+def _counters(request):
+    """
+    Usage entry of an accounting request. Input octets are what the NAS
+    received from the client, i.e. the client's upload.
+    """
+    return {
+        'mac': request.string(rad.CALLING_STATION_ID),
+        'bytes_uploaded': request.integer(rad.ACCT_INPUT_GIGAWORDS, 0) * GIGAWORD
+        + request.integer(rad.ACCT_INPUT_OCTETS, 0),
+        'bytes_downloaded': request.integer(rad.ACCT_OUTPUT_GIGAWORDS, 0) * GIGAWORD
+        + request.integer(rad.ACCT_OUTPUT_OCTETS, 0),
+        'timestamp': request.integer(rad.EVENT_TIMESTAMP),
+    }
+
+
+def handle_accounting(requests):
+    """
+    Record a batch of Accounting-Requests through the gateway usage
+    pipeline, then acknowledge all of them.
+
+    Start and Interim-Update are heartbeats; Stop is a session end and
+    closes the session. Accounting-On/Off only need the acknowledgement.
+
+    Args:
+        requests: list of (addr, Packet)
+
+    Returns:
+        list of (addr, Packet, reply datagram)
+    """
+    close_old_connections()
+    replies = []
+    reports = []
+    ended = []
+    for name, entries in _authenticated(requests, rad.verify_accounting).items():
+        started = time.perf_counter()
+        updates = []
+        stops = []
+        for _, request, _ in entries:
+            status_type = request.integer(rad.ACCT_STATUS_TYPE)
+            if status_type in (rad.ACCT_START, rad.ACCT_INTERIM_UPDATE):
+                updates.append(_counters(request))
+            elif status_type == rad.ACCT_STOP:
+                stops.append(_counters(request))
+
+        gateway_reports, _ = usage_reports(updates, name)
+        reports.extend(gateway_reports)
+        gateway_reports, _ = usage_reports(stops, name, final=True)
+        reports.extend(gateway_reports)
+        ended.extend(report['session_id'] for report in gateway_reports)
+
+        for addr, request, secret in entries:
+            replies.append((addr, request, rad.encode_reply(request, rad.ACCOUNTING_RESPONSE, [], secret)))
+        record_request(name, 'radius_accounting', (time.perf_counter() - started) / len(entries), 200,
+                       ip=entries[0][0][0], count=len(entries))
+
+    # Acknowledged only once recorded: on failure the NAS retransmits
+    record_usage(reports)
+    close_sessions(ended)
+    return replies
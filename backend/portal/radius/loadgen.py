@@ -0,0 +1,149 @@
+"""
+Load generator for the RADIUS server, playing the controllers.
+
+Same arrival patterns and report as the HTTP load generator
+(``portal.loadgen``), with the RADIUS flow of a client: an Access-Request
+by MAC, an Access-Request with its login when that is rejected,
+Accounting-Start, an Interim-Update every interval and Accounting-Stop
+when it leaves. A rebooting controller sends Accounting-On and all its
+clients authenticate again.
+"""
+import asyncio
+import random
+import time
+import uuid
+from ..loadgen import EndpointStats, Gateway, LoadRun
+from . import packet as rad
+from .client import RadiusClient, RadiusTimeout
+
+
+class RadiusGateway(Gateway):
+    """One controller: its clients and its RADIUS client sockets."""
+
+    def __init__(self, run, clients, name, secret):
+        super().__init__(run, clients)
+        self.name = name
+        self.radius = RadiusClient(
+            run.host, secret, name,
+            auth_port=run.auth_port, acct_port=run.acct_port,
+            sockets=run.sockets, timeout=run.timeout,
+        )
+
+    async def request(self, name, call, expected=None):
+        """Send and record latency; returns the reply or None on error."""
+        started = time.perf_counter()
+        try:
+            reply = await call
+        except RadiusTimeout:
+            self.run.stats[name].record(time.perf_counter() - started, 'timeout')
+            return None
+        elapsed = time.perf_counter() - started
+        if expected is not None and reply.code != expected:
+            self.run.stats[name].record(elapsed, 'reject')
+            return None
+        self.run.stats[name].record(elapsed)
+        return reply
+
+    async def accounting(self, name, status_type, client):
+        await self.request(name, self.radius.accounting(
+            status_type, client.mac, client.ip, client.session_id,
+            uploaded=client.uploaded, downloaded=client.downloaded,
+            session_time=int(time.monotonic() - client.started),
+        ))
+
+    async def connect(self, client):
+        """Authenticate the client by MAC, and log it in unless already allowed."""
+        reply = await self.request('access', self.radius.access(client.mac, client.ip))
+        if reply is None:
+            return
+        if reply.code != rad.ACCESS_ACCEPT:
+            login = client.login
+            username = login.get('code') or login.get('email')
+            password = login.get('code') or login.get('password')
+            reply = await self.request(
+                'login', self.radius.access(client.mac, client.ip, username, password),
+                expected=rad.ACCESS_ACCEPT,
+            )
+            if reply is None:
+                return
+        client.connected = True
+        client.session_id = uuid.uuid4().hex[:16]
+        client.started = time.monotonic()
+        await self.accounting('acct_start', rad.ACCT_START, client)
+
+    async def disconnect(self, client):
+        if not client.connected:
+            return
+        client.connected = False
+        await self.accounting('acct_stop', rad.ACCT_STOP, client)
+
+    async def heartbeats(self, until):
+        """Interim-Update of every connected client each interval."""
+        interval = self.run.heartbeat_interval
+        while time.monotonic() < until:
+            await asyncio.sleep(interval)
+            updates = []
+            for client in self.clients:
+                if not client.connected:
+                    continue
+                client.downloaded += random.randint(0, 2_000_000)
+                client.uploaded += random.randint(0, 200_000)
+                updates.append(self.accounting('acct_interim', rad.ACCT_INTERIM_UPDATE, client))
+            await asyncio.gather(*updates)
+
+    async def reboot(self, at):
+        await asyncio.sleep(max(at - time.monotonic(), 0))
+        await self.request('acct_on', self.radius.send(rad.ACCOUNTING_REQUEST, [
+            (rad.NAS_IDENTIFIER, self.name.encode()),
+            (rad.ACCT_STATUS_TYPE, rad.ACCT_ON.to_bytes(4, 'big')),
+        ]))
+        await super().reboot(at)
+
+
+class RadiusLoadRun(LoadRun):
+    """
+    Simulate controllers sharing ``logins`` between their clients.
+
+    Args:
+        gateways: list of (NAS-Identifier, secret), one per controller
+        logins: list of login payloads ({'code': ...} or {'email',
+            'password'}), one client per entry
+    """
+
+    def __init__(self, host, gateways, logins, auth_port=1812, acct_port=1813, sockets=4,
+                 pattern='steady', duration=60, stay=30, interim_interval=10, timeout=2):
+        self.host = host
+        self.auth_port = auth_port
+        self.acct_port = acct_port
+        self.sockets = sockets
+        super().__init__(
+            None, logins, gateways=len(gateways), pattern=pattern, duration=duration,
+            stay=stay, heartbeat_interval=interim_interval, timeout=timeout,
+        )
+        self.stats = {
+            name: EndpointStats()
+            for name in ('access', 'login', 'acct_start', 'acct_interim', 'acct_stop', 'acct_on')
+        }
+        self.gateways = [
+            RadiusGateway(self, gateway.clients, name, secret)
+            for gateway, (name, secret) in zip(self.gateways, gateways)
+        ]
+
+    async def _run(self):
+        for gateway in self.gateways:
+            await gateway.radius.open()
+        start = time.monotonic()
+        until = start + self.duration
+        tasks = []
+        for gateway in self.gateways:
+            tasks.extend(gateway.client_life(client, start) for client in gateway.clients)
+            tasks.append(gateway.heartbeats(until))
+            if self.pattern == 'reboot':
+                tasks.append(gateway.reboot(start + self.duration / 2))
+        await asyncio.gather(*tasks)
+        # Clients still connected leave at the end
+        await asyncio.gather(*(
+            gateway.disconnect(client) for gateway in self.gateways for client in gateway.clients
+        ))
+        for gateway in self.gateways:
+            gateway.radius.close()
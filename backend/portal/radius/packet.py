@@ -0,0 +1,257 @@
+"""
+RADIUS packet codec (RFC 2865, RFC 2866, RFC 3579 Message-Authenticator).
+
+Only what the portal needs: the packet header, a flat list of
+attributes, User-Password hiding, and the request, response and
+Message-Authenticator checks. Vendor-specific attributes are kept as
+raw values.
+"""
+import hashlib
+import hmac
+import ipaddress
+import os
+import struct
+
+ACCESS_REQUEST = 1
+ACCESS_ACCEPT = 2
+ACCESS_REJECT = 3
+ACCOUNTING_REQUEST = 4
+ACCOUNTING_RESPONSE = 5
+
+# Attribute types
+USER_NAME = 1
+USER_PASSWORD = 2
+NAS_IP_ADDRESS = 4
+FRAMED_IP_ADDRESS = 8
+REPLY_MESSAGE = 18
+SESSION_TIMEOUT = 27
+CALLED_STATION_ID = 30
+CALLING_STATION_ID = 31
+NAS_IDENTIFIER = 32
+ACCT_STATUS_TYPE = 40
+ACCT_INPUT_OCTETS = 42
+ACCT_OUTPUT_OCTETS = 43
+ACCT_SESSION_ID = 44
+ACCT_SESSION_TIME = 46
+ACCT_INPUT_GIGAWORDS = 52
+ACCT_OUTPUT_GIGAWORDS = 53
+EVENT_TIMESTAMP = 55
+MESSAGE_AUTHENTICATOR = 80
+ACCT_INTERIM_INTERVAL = 85
+
+# Acct-Status-Type values
+ACCT_START = 1
+ACCT_STOP = 2
+ACCT_INTERIM_UPDATE = 3
+ACCT_ON = 7
+ACCT_OFF = 8
+
+HEADER = struct.Struct('!BBH16s')
+MIN_LENGTH = 20
+MAX_LENGTH = 4096
+
+_ZERO_AUTHENTICATOR = bytes(16)
+_ZERO_MESSAGE_AUTHENTICATOR = bytes(16)
+
+
+class PacketError(Exception):
+    """Raised for a malformed packet; such packets are silently dropped."""
+
+
+class Packet:
+    """A decoded RADIUS packet; ``raw`` keeps the bytes for verification."""
+
+    def __init__(self, code, identifier, authenticator, attributes=None, raw=None):
+        self.code = code
+        self.identifier = identifier
+        self.authenticator = authenticator
+        self.attributes = attributes if attributes is not None else []
+        self.raw = raw
+
+    def get(self, attribute):
+        for kind, value in self.attributes:
+            if kind == attribute:
+                return value
+        return None
+
+    def string(self, attribute):
+        value = self.get(attribute)
+        return value.decode('utf-8', 'replace') if value is not None else None
+
+    def integer(self, attribute, default=None):
+        value = self.get(attribute)
+        if value is None or len(value) != 4:
+            return default
+        return struct.unpack('!I', value)[0]
+
+    def address(self, attribute):
+        value = self.get(attribute)
+        if value is None or len(value) != 4:
+            return None
+        return str(ipaddress.IPv4Address(value))
+
+    def add(self, attribute, value):
+        """Append an attribute; ints are 32-bit integers, strs UTF-8."""
+        if isinstance(value, int):
+            value = struct.pack('!I', value)
+        elif isinstance(value, str):
+            value = value.encode()
+        self.attributes.append((attribute, value))
+
+
+def decode(data):
+    """
+    Parse a datagram.
+
+    Raises:
+        PacketError: when the header or an attribute is malformed
+    """
+    if len(data) < MIN_LENGTH:
+        raise PacketError('Packet too short')
+    code, identifier, length, authenticator = HEADER.unpack_from(data)
+    if length < MIN_LENGTH or length > MAX_LENGTH or length > len(data):
+        raise PacketError('Invalid packet length')
+
+    # Octets past the Length field are padding (RFC 2865 section 3)
+    data = data[:length]
+    attributes = []
+    offset = MIN_LENGTH
+    while offset < length:
+        if offset + 2 > length:
+            raise PacketError('Truncated attribute')
+        kind, size = data[offset], data[offset + 1]
+        if size < 2 or offset + size > length:
+            raise PacketError('Invalid attribute length')
+        attributes.append((kind, data[offset + 2:offset + size]))
+        offset += size
+    return Packet(code, identifier, authenticator, attributes, raw=data)
+
+
+def _encode_attributes(attributes):
+    parts = []
+    for kind, value in attributes:
+        if len(value) > 253:
+            raise PacketError(f'Attribute {kind} too long')
+        parts.append(struct.pack('!BB', kind, len(value) + 2) + value)
+    return b''.join(parts)
+
+
+def _sign_message(header, body, secret):
+    """Fill the zeroed Message-Authenticator in ``body`` (RFC 3579 3.2)."""
+    digest = hmac.new(secret, header + body, hashlib.md5).digest()
+    offset = _message_authenticator_offset(body)
+    return body[:offset] + digest + body[offset + 16:]
+
+
+def _message_authenticator_offset(body):
+    offset = 0
+    while offset < len(body):
+        kind, size = body[offset], body[offset + 1]
+        if kind == MESSAGE_AUTHENTICATOR:
+            return offset + 2
+        offset += size
+    raise PacketError('No Message-Authenticator')
+
+
+def verify_message_authenticator(packet, secret, request_authenticator=None):
+    """
+    Check the Message-Authenticator of a received packet.
+
+    Returns:
+        bool: True when valid, False when wrong, None when absent
+    """
+    if packet.get(MESSAGE_AUTHENTICATOR) is None:
+        return None
+    raw = packet.raw
+    offset = MIN_LENGTH + _message_authenticator_offset(raw[MIN_LENGTH:])
+    received = raw[offset:offset + 16]
+    header = raw[:4] + (request_authenticator or packet.authenticator)
+    body = raw[MIN_LENGTH:offset] + _ZERO_MESSAGE_AUTHENTICATOR + raw[offset + 16:]
+    expected = hmac.new(secret, header + body, hashlib.md5).digest()
+    return hmac.compare_digest(expected, received)
+
+
+def verify_accounting(packet, secret):
+    """Check the Request Authenticator of an Accounting-Request."""
+    raw = packet.raw
+    expected = hashlib.md5(raw[:4] + _ZERO_AUTHENTICATOR + raw[MIN_LENGTH:] + secret).digest()
+    return hmac.compare_digest(expected, packet.authenticator)
+
+
+def verify_response(data, request_authenticator, secret):
+    """Check the Response Authenticator of a reply to a request we sent."""
+    if len(data) < MIN_LENGTH:
+        return False
+    length = HEADER.unpack_from(data)[2]
+    expected = hashlib.md5(data[:4] + request_authenticator + data[MIN_LENGTH:length] + secret).digest()
+    return hmac.compare_digest(expected, data[4:MIN_LENGTH])
+
+
+def _hide(value, secret, authenticator, decrypt):
+    """User-Password hiding (RFC 2865 section 5.2), both directions."""
+    output = []
+    previous = authenticator
+    for start in range(0, len(value), 16):
+        chunk = value[start:start + 16]
+        key = hashlib.md5(secret + previous).digest()
+        plain = bytes(a ^ b for a, b in zip(chunk, key))
+        output.append(plain)
+        previous = chunk if decrypt else plain
+    return b''.join(output)
+
+
+def decrypt_password(value, secret, authenticator):
+    if not value or len(value) % 16:
+        raise PacketError('Invalid User-Password length')
+    return _hide(value, secret, authenticator, decrypt=True).rstrip(b'\x00')
+
+
+def encrypt_password(password, secret, authenticator):
+    padded = password.ljust(max(16, -(-len(password) // 16) * 16), b'\x00')
+    return _hide(padded, secret, authenticator, decrypt=False)
+
+
+def encode_reply(request, code, attributes, secret):
+    """
+    Build the reply to ``request``.
+
+    Access replies carry a Message-Authenticator as their first
+    attribute (BlastRADIUS mitigation); the Response Authenticator is
+    computed last, over the final attributes.
+    """
+    if code in (ACCESS_ACCEPT, ACCESS_REJECT):
+        attributes = [(MESSAGE_AUTHENTICATOR, _ZERO_MESSAGE_AUTHENTICATOR)] + list(attributes)
+    body = _encode_attributes(attributes)
+    header = struct.pack('!BBH', code, request.identifier, MIN_LENGTH + len(body))
+    if code in (ACCESS_ACCEPT, ACCESS_REJECT):
+        body = _sign_message(header + request.authenticator, body, secret)
+    authenticator = hashlib.md5(header + request.authenticator + body + secret).digest()
+    return header + authenticator + body
+
+
+def encode_request(code, identifier, attributes, secret, password=None):
+    """
+    Build a request as a NAS would.
+
+    Access-Requests get a random Request Authenticator, the hidden
+    ``password`` and a Message-Authenticator; Accounting-Requests get
+    the computed Request Authenticator.
+
+    Returns:
+        tuple: (datagram, request authenticator)
+    """
+    attributes = list(attributes)
+    if code == ACCESS_REQUEST:
+        authenticator = os.urandom(16)
+        if password is not None:
+            attributes.append((USER_PASSWORD, encrypt_password(password, secret, authenticator)))
+        attributes.insert(0, (MESSAGE_AUTHENTICATOR, _ZERO_MESSAGE_AUTHENTICATOR))
+        body = _encode_attributes(attributes)
+        header = struct.pack('!BBH', code, identifier, MIN_LENGTH + len(body))
+        body = _sign_message(header + authenticator, body, secret)
+        return header + authenticator + body, authenticator
+
+    body = _encode_attributes(attributes)
+    header = struct.pack('!BBH', code, identifier, MIN_LENGTH + len(body))
+    authenticator = hashlib.md5(header + _ZERO_AUTHENTICATOR + body + secret).digest()
+    return header + authenticator + body, authenticator
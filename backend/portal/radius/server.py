@@ -0,0 +1,181 @@
+"""
+Asyncio RADIUS server for controllers that authenticate clients over
+RADIUS instead of the gateway HTTP API.
+
+The event loop only reads datagrams, parses headers and answers
+retransmissions; requests are collected for ``RADIUS_BATCH_WINDOW``
+seconds (or ``RADIUS_BATCH_MAX`` requests) and each batch is handled in
+a worker thread with one cache lookup and one accounting write for the
+whole batch.
+"""
+import asyncio
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from . import packet as rad
+from .handlers import handle_access, handle_accounting
+
+logger = logging.getLogger(__name__)
+
+AUTH = 'auth'
+ACCT = 'acct'
+
+
+class RadiusProtocol(asyncio.DatagramProtocol):
+    """One UDP socket (authentication or accounting) of the server."""
+
+    def __init__(self, server, kind):
+        self.server = server
+        self.kind = kind
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.receive(self, data, addr)
+
+    def error_received(self, exc):
+        logger.warning(f"RADIUS {self.kind} socket error: {exc}")
+
+
+class Listener:
+    """Pending batch and handler of one socket."""
+
+    def __init__(self, kind, code, handler, window):
+        self.kind = kind
+        self.code = code
+        self.handler = handler
+        self.window = window
+        self.pending = []
+        self.timer = None
+
+
+class RadiusServer:
+    """
+    Authentication and accounting sockets sharing one worker pool.
+
+    Replies are remembered for ``RADIUS_DUPLICATE_WINDOW`` seconds by
+    (NAS address, identifier, authenticator), so a retransmitted request
+    gets the same reply without being handled twice; a retransmission of
+    a request still being handled is dropped.
+    """
+
+    def __init__(self, workers=None):
+        config = settings.PORTAL_CONFIG
+        self.batch_max = config['RADIUS_BATCH_MAX']
+        self.queue_max = config['RADIUS_QUEUE_MAX']
+        self.duplicate_window = config['RADIUS_DUPLICATE_WINDOW']
+        self.receive_buffer = config['RADIUS_RECEIVE_BUFFER']
+        self.executor = ThreadPoolExecutor(max_workers=workers or config['RADIUS_WORKERS'])
+        self.listeners = {
+            AUTH: Listener(AUTH, rad.ACCESS_REQUEST, handle_access, config['RADIUS_BATCH_WINDOW']),
+            ACCT: Listener(ACCT, rad.ACCOUNTING_REQUEST, handle_accounting, config['RADIUS_ACCT_BATCH_WINDOW']),
+        }
+        self.protocols = {}
+        self.replies = {}
+        self.queued = 0
+        self.stats = {'received': 0, 'replied': 0, 'duplicates': 0, 'dropped': 0, 'unanswered': 0}
+        self.loop = None
+
+    async def start(self, host, auth_port, acct_port):
+        self.loop = asyncio.get_running_loop()
+        for kind, port in ((AUTH, auth_port), (ACCT, acct_port)):
+            transport, protocol = await self.loop.create_datagram_endpoint(
+                lambda kind=kind: RadiusProtocol(self, kind),
+                local_addr=(host, port),
+            )
+            # NAS bursts (a controller reboot) overflow the default buffer;
+            # the kernel caps this at net.core.rmem_max
+            transport.get_extra_info('socket').setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer,
+            )
+            self.protocols[kind] = protocol
+        self.loop.call_later(1, self._expire_replies)
+
+    def addresses(self):
+        return {kind: protocol.transport.get_extra_info('sockname') for kind, protocol in self.protocols.items()}
+
+    def close(self):
+        for protocol in self.protocols.values():
+            protocol.transport.close()
+        self.executor.shutdown(wait=True)
+
+    def receive(self, protocol, data, addr):
+        self.stats['received'] += 1
+        listener = self.listeners[protocol.kind]
+        try:
+            request = rad.decode(data)
+        except rad.PacketError:
+            self.stats['dropped'] += 1
+            return
+        if request.code != listener.code:
+            self.stats['dropped'] += 1
+            return
+
+        key = (addr, request.identifier, request.authenticator)
+        if key in self.replies:
+            self.stats['duplicates'] += 1
+            reply = self.replies[key][0]
+            if reply is not None:
+                protocol.transport.sendto(reply, addr)
+            return
+        if self.queued >= self.queue_max:
+            # Overloaded: the NAS retransmits or fails over
+            self.stats['dropped'] += 1
+            return
+
+        self.replies[key] = (None, time.monotonic())
+        self.queued += 1
+        listener.pending.append((addr, request))
+        if len(listener.pending) >= self.batch_max:
+            self._flush(listener)
+        elif listener.timer is None:
+            listener.timer = self.loop.call_later(listener.window, self._flush, listener)
+
+    def _flush(self, listener):
+        if listener.timer is not None:
+            listener.timer.cancel()
+            listener.timer = None
+        batch, listener.pending = listener.pending, []
+        if not batch:
+            return
+        future = self.loop.run_in_executor(self.executor, listener.handler, batch)
+        future.add_done_callback(lambda done: self._send(listener, batch, done))
+
+    def _send(self, listener, batch, future):
+        self.queued -= len(batch)
+        transport = self.protocols[listener.kind].transport
+        try:
+            replies = future.result()
+        except Exception:
+            logger.exception(f"Failed to handle {len(batch)} RADIUS {listener.kind} requests")
+            replies = []
+        now = time.monotonic()
+        for addr, request, reply in replies:
+            transport.sendto(reply, addr)
+            # Reinserted so the entries stay ordered by age
+            key = (addr, request.identifier, request.authenticator)
+            self.replies.pop(key, None)
+            self.replies[key] = (reply, now)
+        self.stats['replied'] += len(replies)
+        unanswered = len(batch) - len(replies)
+        if unanswered:
+            self.stats['unanswered'] += unanswered
+            # Let the retransmissions be handled again
+            answered = {(addr, request.identifier, request.authenticator) for addr, request, _ in replies}
+            for addr, request in batch:
+                key = (addr, request.identifier, request.authenticator)
+                if key not in answered:
+                    self.replies.pop(key, None)
+
+    def _expire_replies(self):
+        deadline = time.monotonic() - self.duplicate_window
+        while self.replies:
+            key = next(iter(self.replies))
+            if self.replies[key][1] > deadline:
+                break
+            del self.replies[key]
+        self.loop.call_later(1, self._expire_replies)
@@ -0,0 +1,145 @@
+"""
+Reconciliation of gateway client lists against the database.
+
+A gateway uploads its full list of connected clients. The server loads
+the authorized sessions with one query and computes both differences in
+memory: sessions located on that gateway (the last gateway that looked
+their MAC up, see ``authcache``) that it no longer knows about are closed
+in bulk, and clients the gateway lets through without a valid session
+are returned for deauthorization. Counters of the remaining clients are
+recorded like heartbeat reports.
+"""
+import logging
+import time
+from django.conf import settings
+from django.utils import timezone
+from access.accounting import record_counters
+from access.models import Session
+from access.quota import apply_usage
+from access.sessions import close_sessions
+from access.utils import normalize_mac
+from .authcache import DEFAULT_GATEWAY, locate
+from .models import CaptiveBinding
+
+logger = logging.getLogger(__name__)
+
+
+def parse_clients(data):
+    """
+    Normalize an uploaded client list.
+
+    Accepts a list of client objects or an ``ndsctl json`` style mapping
+    of MAC to client. Counters may be named ``incoming``/``outgoing`` or
+    ``downloaded``/``uploaded``.
+
+    Returns:
+        dict: {mac: {'ip', 'downloaded', 'uploaded'}}, None if malformed
+    """
+    if isinstance(data, dict):
+        data = list(data.values())
+    if not isinstance(data, list):
+        return None
+
+    clients = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            return None
+        mac = normalize_mac(entry.get('mac'))
+        if not mac:
+            continue
+        try:
+            downloaded = int(entry.get('incoming', entry.get('downloaded', 0)) or 0)
+            uploaded = int(entry.get('outgoing', entry.get('uploaded', 0)) or 0)
+        except (TypeError, ValueError):
+            downloaded = uploaded = 0
+        clients[mac] = {'ip': entry.get('ip'), 'downloaded': downloaded, 'uploaded': uploaded}
+    return clients
+
+
+def reconcile_clients(clients, gateway, snapshot_time=None):
+    """
+    Reconcile a gateway client list with the authorized sessions.
+
+    Args:
+        clients: {mac: {'ip', 'downloaded', 'uploaded'}} as returned by
+            ``parse_clients``
+        gateway: name of the registered gateway that took the list; only
+            sessions located on it are closed
+        snapshot_time: epoch seconds at which the gateway took the list
+
+    Returns:
+        dict: ``deauthorize`` (MACs to drop on the gateway), ``closed``
+        (number of orphaned sessions closed) and ``active`` (number of
+        clients with a valid session)
+
+    Raises:
+        ValueError: for the ``default`` gateway, whose clients are not
+            located
+    """
+    if gateway == DEFAULT_GATEWAY:
+        raise ValueError('Only a registered gateway can be reconciled')
+    now = time.time()
+    snapshot_time = snapshot_time or now
+    timeout = settings.PORTAL_CONFIG['SESSION_TIMEOUT']
+    # Sessions started just before the snapshot may not be on the gateway yet
+    cutoff = snapshot_time - settings.PORTAL_CONFIG['RECONCILE_GRACE']
+
+    sessions = (
+        Session.objects
+        .filter(status=Session.Status.AUTHORIZED)
+        .values_list('id', 'mac_address', 'user_id', 'start_time', 'device__is_revoked')
+    )
+
+    valid = {}
+    missing = []
+    for session_id, mac, user_id, start_time, revoked in sessions.iterator(chunk_size=5000):
+        started = start_time.timestamp()
+        if mac not in clients:
+            if started < cutoff:
+                missing.append((session_id, mac))
+            continue
+        if not revoked and started + timeout > now:
+            valid[mac] = (session_id, user_id)
+
+    # Sessions of other gateways are absent from this list too
+    orphaned = []
+    for start in range(0, len(missing), 1000):
+        batch = missing[start:start + 1000]
+        located = locate([mac for _, mac in batch])
+        orphaned.extend(entry for entry in batch if located[entry[1]] == gateway)
+
+    deauthorize = sorted(clients.keys() - valid.keys())
+
+    closed = []
+    if orphaned:
+        closed = close_sessions([session_id for session_id, _ in orphaned])
+        CaptiveBinding.objects.filter(
+            session_id__in=[session_id for session_id, _, _ in closed],
+            expires_at__gt=timezone.now(),
+        ).update(expires_at=timezone.now())
+
+    reports = [
+        {
+            'session_id': session_id,
+            'user_id': user_id,
+            'bytes_downloaded': clients[mac]['downloaded'],
+            'bytes_uploaded': clients[mac]['uploaded'],
+            'timestamp': int(snapshot_time),
+        }
+        for mac, (session_id, user_id) in valid.items()
+    ]
+    # Bounded batches keep each accounting script call short
+    batch_size = settings.PORTAL_CONFIG['AUTHORIZE_BATCH_MAX']
+    for start in range(0, len(reports), batch_size):
+        batch = reports[start:start + batch_size]
+        deltas = record_counters(batch)
+        apply_usage(
+            (report['user_id'], downloaded + uploaded, seconds)
+            for report, (downloaded, uploaded, seconds) in zip(batch, deltas)
+        )
+
+    logger.info(
+        f"Reconciled {len(clients)} clients of {gateway}: {len(valid)} active, "
+        f"{len(deauthorize)} to deauthorize, {len(closed)} orphaned sessions closed"
+    )
+    return {'deauthorize': deauthorize, 'closed': len(closed), 'active': len(valid)}
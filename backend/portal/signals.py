@@ -0,0 +1,136 @@
+"""
+Signal handlers that keep gateways in sync with access changes.
+
+Session status changes and device revocations invalidate the cached
+authorization decision for the MAC and are published on the change feed.
+Sessions, bindings and vouchers are (un)scheduled for expiry as they
+change, voucher codes are kept in the negative-lookup filter, the
+active-device sets follow session starts and ends and the current-binding
+index follows binding creation and session ends. Saving the walled
+garden rules makes every process recompile them, and saving any
+SystemConfig entry re-renders the splash pages.
+Bulk ``QuerySet.update()`` calls bypass these handlers and must publish
+their own deltas.
+"""
+import logging
+import time
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from access import codefilter, devices
+from access.models import Device, Session, Voucher
+from access.signals import sessions_closed, vouchers_minted
+from . import bindings, expiry, splash, walledgarden
+from .authcache import invalidate_decisions
+from .feed import publish_authorize, publish_deauthorize
+from .models import CaptiveBinding, SystemConfig
+
+logger = logging.getLogger(__name__)
+
+ENDED_STATUSES = {
+    Session.Status.EXPIRED,
+    Session.Status.REVOKED,
+    Session.Status.QUOTA_EXCEEDED,
+}
+
+
+@receiver(post_init, sender=Session)
+def remember_session_status(sender, instance, **kwargs):
+    instance._feed_status = instance.status
+
+
+@receiver(post_save, sender=Session)
+def publish_session_change(sender, instance, created, **kwargs):
+    if not created and instance.status == instance._feed_status:
+        return
+    instance._feed_status = instance.status
+
+    if instance.status == Session.Status.AUTHORIZED:
+        expires = instance.start_time.timestamp() + settings.PORTAL_CONFIG['SESSION_TIMEOUT']
+        invalidate_decisions([instance.mac_address])
+        publish_authorize([(instance.mac_address, max(int(expires - time.time()), 0))])
+        expiry.schedule_safely([(expiry.SESSION, instance.id, expires)])
+        devices.track([(instance.user_id, instance.mac_address)])
+    elif instance.status in ENDED_STATUSES:
+        invalidate_decisions([instance.mac_address])
+        publish_deauthorize([instance.mac_address])
+        expiry.cancel(expiry.SESSION, [instance.id])
+        devices.release([(instance.user_id, instance.mac_address)])
+
+
+@receiver(post_init, sender=Device)
+def remember_device_revocation(sender, instance, **kwargs):
+    instance._feed_revoked = instance.is_revoked
+
+
+@receiver(post_save, sender=Device)
+def publish_device_revocation(sender, instance, created, **kwargs):
+    if instance.is_revoked == instance._feed_revoked:
+        return
+    instance._feed_revoked = instance.is_revoked
+
+    invalidate_decisions([instance.mac_address])
+    if instance.is_revoked:
+        publish_deauthorize([instance.mac_address])
+
+
+@receiver(sessions_closed)
+def publish_closed_sessions(sender, sessions, status, **kwargs):
+    macs = {mac for _, mac, _ in sessions}
+    invalidate_decisions(macs)
+    publish_deauthorize(sorted(macs))
+    expiry.cancel(expiry.SESSION, [session_id for session_id, _, _ in sessions])
+    devices.release([(user_id, mac) for _, mac, user_id in sessions])
+
+
+@receiver(post_save, sender=CaptiveBinding)
+def schedule_binding_expiry(sender, instance, **kwargs):
+    expiry.schedule_safely([(expiry.BINDING, instance.id, instance.expires_at)])
+
+
+@receiver(post_save, sender=CaptiveBinding)
+def index_binding(sender, instance, created, **kwargs):
+    if not created:
+        return
+    _, displaced, _ = bindings.bind_safely(instance.mac_address, instance.ip_address, instance.id)
+    if displaced:
+        logger.info(f"{instance.ip_address} rebound from {displaced} to {instance.mac_address}")
+
+
+@receiver(sessions_closed)
+def unindex_closed_bindings(sender, sessions, status, **kwargs):
+    bindings.unbind(
+        CaptiveBinding.objects
+        .filter(session_id__in=[session_id for session_id, _, _ in sessions])
+        .values_list('id', 'mac_address')
+    )
+
+
+@receiver(post_save, sender=Voucher)
+def track_voucher(sender, instance, **kwargs):
+    if instance.status == Voucher.Status.ACTIVE:
+        expiry.schedule_safely([(expiry.VOUCHER, instance.id, instance.valid_until)])
+        codefilter.add_codes([instance.code])
+    else:
+        expiry.cancel(expiry.VOUCHER, [instance.id])
+        codefilter.remove_codes([instance.code])
+
+
+@receiver(vouchers_minted)
+def schedule_minted_vouchers(sender, vouchers, **kwargs):
+    expiry.schedule_safely([
+        (expiry.VOUCHER, voucher_id, valid_until) for voucher_id, _, valid_until in vouchers
+    ])
+
+
+@receiver(post_save, sender=SystemConfig)
+@receiver(post_delete, sender=SystemConfig)
+def reload_walled_garden(sender, instance, **kwargs):
+    if instance.key == walledgarden.CONFIG_KEY:
+        walledgarden.bump_version()
+
+
+@receiver(post_save, sender=SystemConfig)
+@receiver(post_delete, sender=SystemConfig)
+def rerender_splash_pages(sender, instance, **kwargs):
+    splash.bump_version()
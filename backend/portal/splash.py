@@ -0,0 +1,123 @@
+"""
+Pre-rendered splash pages.
+
+Every unauthenticated client loads the splash page, so it is rendered
+once per site and kept in memory as bytes, gzipped bytes and a content
+fingerprint used as strong ETag. Requests never render the template: the
+client MAC and IP are read from the query string by the page itself.
+
+The branding lives in SystemConfig: ``splash`` holds the default
+branding as a JSON object and ``splash:<site>`` the overrides of one site
+(or SSID). Saving any SystemConfig entry bumps the version counter in the
+cache; each process re-renders its pages when it sees a new version.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from .models import SystemConfig
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEY = 'splash'
+VERSION_KEY = 'portal:splash:version'
+
+DEFAULT_SITE = 'default'
+
+DEFAULT_BRANDING = {
+    'title': 'Accès Wi-Fi',
+    'welcome': 'Connectez-vous avec un ticket ou votre compte pour accéder à Internet.',
+    'logo_url': '',
+    'primary_color': '#2563eb',
+    'terms_url': '',
+    'footer': '',
+}
+
+
+class SplashPage:
+    """One rendered page with its compressed body and fingerprint."""
+
+    def __init__(self, site, body):
+        self.site = site
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.fingerprint = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.fingerprint}"'
+        # Strong ETags must differ between the gzip and identity bodies
+        self.gzip_etag = f'"{self.fingerprint}-gz"'
+
+
+def _load_branding(text, key):
+    try:
+        branding = json.loads(text)
+    except ValueError:
+        logger.warning(f"Ignored invalid splash branding in {key}")
+        return {}
+    if not isinstance(branding, dict):
+        logger.warning(f"Ignored splash branding in {key}: not an object")
+        return {}
+    return {name: value for name, value in branding.items() if name in DEFAULT_BRANDING}
+
+
+def render_pages():
+    """Render the page of every configured site, plus the default one."""
+    entries = dict(
+        SystemConfig.objects
+        .filter(key__startswith=CONFIG_KEY)
+        .values_list('key', 'value')
+    )
+    base = {**DEFAULT_BRANDING, **_load_branding(entries.get(CONFIG_KEY, '{}'), CONFIG_KEY)}
+    sites = {DEFAULT_SITE: base}
+    for key, value in entries.items():
+        prefix, _, site = key.partition(':')
+        if prefix == CONFIG_KEY and site:
+            sites[site] = {**base, **_load_branding(value, key)}
+
+    pages = {}
+    for site, branding in sites.items():
+        body = render_to_string('portal/splash.html', {
+            'site': site,
+            'branding': branding,
+            'login_url': '/api/v1/portal/login/',
+            'recognize_url': '/api/v1/portal/recognize/',
+        })
+        pages[site] = SplashPage(site, body.encode())
+    return pages
+
+
+_local = {'pages': {}, 'version': None, 'checked': 0.0}
+
+
+def bump_version():
+    """Tell every process to re-render its pages."""
+    if not cache.add(VERSION_KEY, time.time_ns(), timeout=None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_page(site=DEFAULT_SITE):
+    """
+    Return the rendered page of ``site``, or of the default site when
+    it has no branding of its own.
+
+    The cache version is checked at most every ``SPLASH_REFRESH``
+    seconds; the pages are re-rendered only when it moved.
+    """
+    now = time.monotonic()
+    if now - _local['checked'] >= settings.PORTAL_CONFIG['SPLASH_REFRESH']:
+        _local['checked'] = now
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            bump_version()
+            version = cache.get(VERSION_KEY)
+        if version != _local['version']:
+            _local['pages'] = render_pages()
+            _local['version'] = version
+    pages = _local['pages']
+    return pages.get(site) or pages[DEFAULT_SITE]
@@ -0,0 +1,11 @@
+"""
+Periodic portal tasks.
+"""
+from celery import shared_task
+from .gateways import sync_health
+
+
+@shared_task
+def sync_gateway_health():
+    """Copy gateway last-seen times from Redis to portal_gateway."""
+    return sync_health()
@@ -3,5 +3,21 @@ from . import views
 
 urlpatterns = [
     path('authorize/', views.authorize, name='portal_authorize'),
+    path('authorize/batch/', views.authorize_batch, name='portal_authorize_batch'),
     path('login/', views.portal_login, name='portal_login'),
+    path('recognize/', views.portal_recognize, name='portal_recognize'),
+    path('heartbeat/', views.heartbeat, name='portal_heartbeat'),
+    path('session-start/', views.heartbeat, name='portal_session_start'),
+    path('session-end/', views.session_end, name='portal_session_end'),
+    path('reconcile/', views.reconcile, name='portal_reconcile'),
+    path('bindings/', views.binding_lookup, name='portal_binding_lookup'),
+    path('gateways/', views.gateway_list, name='portal_gateway_list'),
+    path('gateways/<slug:name>/stats/', views.gateway_stats, name='portal_gateway_stats'),
+    path('walled-garden/check/', views.walled_garden_check, name='portal_walled_garden_check'),
+    path('walled-garden/export/', views.walled_garden_export, name='portal_walled_garden_export'),
+    path('feed/', views.feed, name='portal_feed'),
+    path('feed/stream/', views.feed_stream, name='portal_feed_stream'),
+    path('splash/', views.splash_page, name='portal_splash'),
+    path('splash/<slug:site>/', views.splash_page, name='portal_splash_site'),
+    path('splash/<slug:site>/<str:fingerprint>.html', views.splash_page_fingerprinted, name='portal_splash_fingerprinted'),
 ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Usage reports from gateways.
+
+Counter reports arrive over the HTTP gateway API (``heartbeat`` and
+``session-end``) and as RADIUS accounting; both are matched to the
+authorized sessions here and go through the same accounting pipeline.
+"""
+import time
+from access.accounting import record_counters
+from access.quota import apply_usage
+from access.utils import normalize_mac
+from .authcache import ALLOW
+from .authorization import lookup_decisions
+
+
+def usage_reports(entries, gateway, final=False, require_token=False):
+    """
+    Match gateway counter reports to authorized sessions.
+
+    Accepts binauth (``incoming``/``outgoing``) or API (``bytes_*``)
+    counter names. ``final`` marks session-end reports; with
+    ``require_token``, entries without the session token are refused.
+
+    Returns:
+        tuple: (reports for ``record_usage``, one result dict per entry)
+    """
+    now = int(time.time())
+    macs = {normalize_mac(entry.get('mac')) for entry in entries}
+    macs.discard(None)
+    decisions = lookup_decisions(macs, gateway)
+
+    reports = []
+    results = []
+    for entry in entries:
+        mac = normalize_mac(entry.get('mac'))
+        decision = decisions.get(mac)
+        token = entry.get('session_token')
+        if not decision or decision['status'] != ALLOW or ((token or require_token) and token != decision['token']):
+            results.append({'mac': mac or entry.get('mac'), 'status': 'inactive'})
+            continue
+
+        try:
+            downloaded = int(entry.get('incoming', entry.get('bytes_downloaded', 0)))
+            uploaded = int(entry.get('outgoing', entry.get('bytes_uploaded', 0)))
+            timestamp = int(entry.get('timestamp') or now)
+        except (TypeError, ValueError):
+            downloaded = uploaded = -1
+        if downloaded < 0 or uploaded < 0:
+            results.append({'mac': mac, 'status': 'invalid', 'error': 'Invalid counters'})
+            continue
+
+        reports.append({
+            'session_id': decision['session_id'],
+            'user_id': decision['user_id'],
+            'bytes_downloaded': downloaded,
+            'bytes_uploaded': uploaded,
+            'timestamp': timestamp,
+            'final': final,
+        })
+        results.append({'mac': mac, 'status': 'active', 'ttl': max(int(decision['expires'] - now), 0)})
+
+    return reports, results
+
+
+def record_usage(reports):
+    """Accumulate counters and advance the users' quota totals."""
+    deltas = record_counters(reports)
+    apply_usage(
+        (report['user_id'], downloaded + uploaded, seconds)
+        for report, (downloaded, uploaded, seconds) in zip(reports, deltas)
+    )
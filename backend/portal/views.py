@@ -1,12 +1,39 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes, throttle_classes
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.utils import timezone
-from datetime import timedelta
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import time
+from urllib.parse import quote
+from access import fingerprints
+from access.serializers import PortalSessionSerializer
+from access.sessions import close_sessions
+from access.utils import normalize_mac
+from access.vouchers import VoucherError, guess_limited, use_voucher
+from accounts.permissions import IsAdmin
+from accounts.serializers import LoginSerializer
+from audit.utils import audit_login_attempt
+from . import feed as change_feed
+from . import bindings, gateways, splash, walledgarden
+from .authcache import ALLOW, DEFAULT_GATEWAY
+from .authorization import resolve_clients
+from .gateways import EventStreamRenderer, GatewayAuthentication, GatewayRateThrottle, IsGateway, gateway_name, tracked
+from .logins import LoginRefused, admit_user, bind_session, observed_fingerprint, reauthorize_clients, remember_device
+from .models import Gateway
+from .reconcile import parse_clients, reconcile_clients
+from .usage import record_usage, usage_reports
 
+@tracked
 @api_view(['POST'])
-@permission_classes([AllowAny])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
 def authorize(request):
     """
     Captive portal authorization endpoint
@@ -19,20 +46,291 @@ def authorize(request):
     if not mac or not ip:
         return Response({'error': 'MAC and IP required'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check if device has active session
-    # This is a simplified version - full implementation would check quotas, etc.
+    client = {trait: request.data.get(trait) for trait in fingerprints.TRAITS}
+    client.update(mac=mac, ip=ip, token=request.data.get('token'))
+    result = resolve_clients([client], gateway_name(request), trusted=isinstance(request.auth, Gateway))[0]
+    if result['status'] == ALLOW:
+        return Response({
+            'status': ALLOW,
+            'ttl': result['ttl'],
+            'session_timeout': result['ttl'],
+        })
     
-    return Response({
-        'status': 'DENY',  # or 'ALLOW'
-        'redirect_url': f'/portal/login?mac={mac}&ip={ip}&url={url}',
+    redirect_url = f'/portal/login?mac={mac}&ip={ip}&url={url}'
+    response = {
+        'status': result['status'],
+        'redirect_url': redirect_url,
         'ttl': 3600  # 1 hour
+    }
+    if 'login_hint' in result:
+        # Pre-fills the login form; the client still has to log in
+        response['login_hint'] = result['login_hint']
+        response['redirect_url'] = f"{redirect_url}&login_hint={quote(result['login_hint'])}"
+    return Response(response)
+
+@tracked
+@api_view(['POST'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def authorize_batch(request):
+    """
+    Batch authorization endpoint for gateways
+    Resolves many (mac, ip, token) tuples in one round trip
+    """
+    clients = request.data.get('clients')
+    
+    if not isinstance(clients, list) or not all(isinstance(c, dict) for c in clients):
+        return Response({'error': 'clients must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    max_batch = settings.PORTAL_CONFIG['AUTHORIZE_BATCH_MAX']
+    if len(clients) > max_batch:
+        return Response(
+            {'error': f'At most {max_batch} clients per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = []
+    for result in resolve_clients(clients, gateway_name(request), trusted=isinstance(request.auth, Gateway)):
+        entry = {
+            'mac': result['mac'],
+            'ip': result['ip'],
+            'status': result['status'],
+            'ttl': result['ttl'],
+        }
+        if 'error' in result:
+            entry['error'] = result['error']
+        if 'login_hint' in result:
+            entry['login_hint'] = result['login_hint']
+        results.append(entry)
+    
+    return Response({'results': results})
+
+def _usage_entries(data):
+    """Single report or a `reports` list, None if malformed"""
+    entries = data.get('reports', [data])
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        return None
+    if len(entries) > settings.PORTAL_CONFIG['AUTHORIZE_BATCH_MAX']:
+        return None
+    return entries
+
+@tracked
+@api_view(['POST'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def heartbeat(request):
+    """
+    Session heartbeat with cumulative usage counters
+    Also used for the binauth client_auth hook (session-start)
+    """
+    entries = _usage_entries(request.data)
+    if entries is None:
+        return Response({'error': 'Invalid usage reports'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Unsigned callers may only report counters of a session they hold the token of
+    reports, results = usage_reports(
+        entries, gateway_name(request),
+        require_token=not isinstance(request.auth, Gateway)
+    )
+    record_usage(reports)
+    
+    if 'reports' in request.data:
+        return Response({'results': results})
+    return Response(results[0])
+
+@tracked
+@api_view(['POST'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def session_end(request):
+    """
+    Final usage report when the gateway deauthorizes a client
+    Records the counters and closes the session (binauth client_deauth)
+    """
+    entries = _usage_entries(request.data)
+    if entries is None:
+        return Response({'error': 'Invalid usage reports'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Unsigned callers may only end a session they hold the token of
+    reports, results = usage_reports(
+        entries, gateway_name(request), final=True,
+        require_token=not isinstance(request.auth, Gateway)
+    )
+    record_usage(reports)
+    close_sessions([report['session_id'] for report in reports])
+    
+    for result in results:
+        if result['status'] == 'active':
+            result['status'] = 'closed'
+            result.pop('ttl')
+    
+    if 'reports' in request.data:
+        return Response({'results': results})
+    return Response(results[0])
+
+@tracked
+@api_view(['POST'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def reconcile(request):
+    """
+    Full client list upload from a signed gateway
+    Closes sessions the gateway dropped and returns the MACs to deauthorize
+    """
+    if not isinstance(request.auth, Gateway):
+        return Response({'error': 'Gateway signature required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    clients = parse_clients(request.data.get('clients'))
+    if clients is None:
+        return Response({'error': 'clients must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    if not clients:
+        return Response({'error': 'clients must not be empty'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        snapshot_time = float(request.data.get('timestamp') or 0) or None
+    except (TypeError, ValueError):
+        return Response({'error': 'timestamp must be epoch seconds'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(reconcile_clients(clients, request.auth.name, snapshot_time=snapshot_time))
+
+def _feed_position(value):
+    """Parse a feed sequence number, None if invalid"""
+    try:
+        since = int(value or 0)
+    except (TypeError, ValueError):
+        return None
+    return since if since >= 0 else None
+
+def _feed_busy():
+    """All feed slots are taken: the gateway retries later."""
+    return Response(
+        {'error': 'Too many feed connections, retry later'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(settings.PORTAL_CONFIG['FEED_RETRY_AFTER'])},
+    )
+
+@tracked
+@api_view(['GET'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def feed(request):
+    """
+    Long-poll change feed for gateways
+    Returns authorize/deauthorize deltas after the `since` sequence number
+    """
+    since = _feed_position(request.query_params.get('since'))
+    if since is None:
+        return Response({'error': 'since must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Signed gateways always read their own feed
+    gateway = request.query_params.get('gateway', change_feed.DEFAULT_FEED)
+    if isinstance(request.auth, Gateway):
+        gateway = request.auth.name
+    max_timeout = settings.PORTAL_CONFIG['FEED_LONG_POLL_TIMEOUT']
+    try:
+        timeout = min(float(request.query_params.get('timeout', max_timeout)), max_timeout)
+    except ValueError:
+        timeout = max_timeout
+    
+    timeout = max(timeout, 0)
+    slot = change_feed.acquire_slot(timeout)
+    if slot is None:
+        return _feed_busy()
+    try:
+        deltas, last_seq, reset = change_feed.wait(since, gateway=gateway, timeout=timeout)
+    finally:
+        change_feed.release_slot(slot)
+    
+    return Response({
+        'deltas': deltas,
+        'last_seq': last_seq,
+        'reset': reset,
     })
 
+@tracked
+@api_view(['GET'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def feed_stream(request):
+    """
+    Server-Sent Events change feed for gateways
+    Resumes from the Last-Event-ID header or the `since` parameter
+    """
+    since = _feed_position(request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('since'))
+    if since is None:
+        return Response({'error': 'since must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Signed gateways always read their own feed
+    gateway = request.query_params.get('gateway', change_feed.DEFAULT_FEED)
+    if isinstance(request.auth, Gateway):
+        gateway = request.auth.name
+    
+    duration = settings.PORTAL_CONFIG['FEED_STREAM_DURATION']
+    slot = change_feed.acquire_slot(duration)
+    if slot is None:
+        return _feed_busy()
+    
+    def events(since):
+        # Bounded so workers are recycled; EventSource clients reconnect
+        deadline = time.monotonic() + duration
+        keepalive = settings.PORTAL_CONFIG['FEED_LONG_POLL_TIMEOUT']
+        try:
+            while time.monotonic() < deadline:
+                deltas, last_seq, reset = change_feed.wait(since, gateway=gateway, timeout=keepalive)
+                if reset:
+                    yield f"id: {last_seq}\nevent: reset\ndata: {{}}\n\n"
+                for delta in deltas:
+                    yield f"id: {delta['seq']}\nevent: delta\ndata: {json.dumps(delta)}\n\n"
+                if not deltas and not reset:
+                    yield ": keepalive\n\n"
+                since = last_seq
+        finally:
+            change_feed.release_slot(slot)
+    
+    response = StreamingHttpResponse(events(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _login_refused(code, message):
+    return Response({'error': {'code': code, 'message': message}}, status=status.HTTP_403_FORBIDDEN)
+
+def _login_response(request, session):
+    return Response({
+        'status': 'success',
+        'message': 'Access granted',
+        'session': PortalSessionSerializer(session).data,
+        'redirect_url': request.data.get('url', '') or '/'
+    })
+
+def _login_success(request, session):
+    """Bind the client to its new session and build the login response."""
+    bind_session(session, request.data.get('url', ''))
+    return _login_response(request, session)
+
+def _set_device_cookie(request, response, token):
+    response.set_cookie(
+        settings.PORTAL_CONFIG['DEVICE_COOKIE_NAME'],
+        token,
+        max_age=settings.PORTAL_CONFIG['DEVICE_COOKIE_MAX_AGE'],
+        secure=request.is_secure(),
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def portal_login(request):
     """Handle captive portal login"""
-    mac = request.data.get('mac')
+    mac = normalize_mac(request.data.get('mac'))
     ip = request.data.get('ip')
     code = request.data.get('code')  # voucher code
     
@@ -41,11 +339,223 @@ def portal_login(request):
     
     if code:
         # Voucher-based access
-        # Implementation would validate voucher and create session
-        pass
+        if guess_limited(request):
+            return Response(
+                {'error': 'Too many invalid voucher codes, try again later'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        try:
+            session, _ = use_voucher(code, mac, ip)
+        except VoucherError as e:
+            guess_limited(request, increment=True)
+            return _login_refused(e.code, str(e))
+        return _login_success(request, session)
+    
+    # Credentials-based access
+    serializer = LoginSerializer(data=request.data)
+    if not serializer.is_valid():
+        audit_login_attempt(
+            None, False, ip_address=ip,
+            metadata={'attempted_email': request.data.get('email', ''), 'mac_address': mac}
+        )
+        return Response({'error': serializer.errors}, status=status.HTTP_401_UNAUTHORIZED)
+    user = serializer.validated_data['user']
+    
+    try:
+        session = admit_user(user, mac, ip)
+    except LoginRefused as e:
+        return _login_refused(e.code, str(e))
+    
+    # Recognize the device when it comes back under another MAC; only the
+    # DHCP traits a signed gateway reported for this MAC are recorded
+    token = request.COOKIES.get(settings.PORTAL_CONFIG['DEVICE_COOKIE_NAME']) or fingerprints.new_token()
+    remember_device(session.device, fingerprints.hash_token(token), observed_fingerprint(mac))
+    return _set_device_cookie(request, _login_success(request, session), token)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def portal_recognize(request):
+    """
+    Log a known device back in under a new MAC
+    Only the device cookie is trusted: the MAC and traits are the client's claims
+    """
+    mac = normalize_mac(request.data.get('mac'))
+    ip = request.data.get('ip')
+    
+    if not mac or not ip:
+        return Response({'error': 'MAC and IP required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    token = request.COOKIES.get(settings.PORTAL_CONFIG['DEVICE_COOKIE_NAME'], '')
+    session = None
+    if token:
+        session = reauthorize_clients([{
+            'mac': mac,
+            'ip': ip,
+            'token_hash': fingerprints.hash_token(token),
+        }])[0]
+    if session is None:
+        return Response({'error': 'Device not recognized'}, status=status.HTTP_404_NOT_FOUND)
+    return _set_device_cookie(request, _login_response(request, session), token)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def walled_garden_check(request):
+    """
+    Pre-authentication lookup of a destination
+    Returns whether `host` (domain or IP) is in the walled garden
+    """
+    host = request.query_params.get('host', '')
+    if not host:
+        return Response({'error': 'host required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rule = walledgarden.get_garden().match(host)
+    return Response({'host': host, 'allowed': rule is not None, 'rule': rule})
+
+@tracked
+@api_view(['GET'])
+@authentication_classes([GatewayAuthentication])
+@permission_classes([IsGateway])
+@throttle_classes([GatewayRateThrottle])
+def walled_garden_export(request):
+    """
+    Walled garden rules in gateway format (opennds, coovachilli or json)
+    The ETag changes only when the rules are edited
+    """
+    fmt = request.query_params.get('target', 'opennds')
+    if fmt not in walledgarden.FORMATS:
+        return Response(
+            {'error': f"target must be one of {', '.join(walledgarden.FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
+    garden = walledgarden.get_garden()
+    etag = f'"{garden.version}-{fmt}"'
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    elif fmt == 'json':
+        response = Response(garden.export(fmt))
+    else:
+        response = HttpResponse(garden.export(fmt), content_type='text/plain; charset=utf-8')
+    response['ETag'] = etag
+    return response
+
+def _splash_response(request, page, cache_control):
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    etag = page.gzip_etag if gzipped else page.etag
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+    elif gzipped:
+        response = HttpResponse(page.gzipped, content_type='text/html; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(page.body, content_type='text/html; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+@require_GET
+def splash_page(request, site=splash.DEFAULT_SITE):
+    """
+    Pre-rendered splash page of a site
+    Revalidated on every load; unchanged pages answer 304
+    """
+    return _splash_response(request, splash.get_page(site), 'no-cache')
+
+@require_GET
+def splash_page_fingerprinted(request, site, fingerprint):
+    """
+    Splash page under its content fingerprint, cacheable forever
+    Stale fingerprints redirect to the current page, keeping the query string
+    """
+    page = splash.get_page(site)
+    if fingerprint != page.fingerprint:
+        location = reverse('portal_splash_site', args=[site])
+        if request.META.get('QUERY_STRING'):
+            location = f"{location}?{request.META['QUERY_STRING']}"
+        return HttpResponseRedirect(location)
+    return _splash_response(request, page, f"public, max-age={settings.PORTAL_CONFIG['SPLASH_MAX_AGE']}, immutable")
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def binding_lookup(request):
+    """
+    Current binding of an IP or a MAC
+    Answered from the binding index, without scanning bindings
+    """
+    ip = request.query_params.get('ip')
+    mac = normalize_mac(request.query_params.get('mac'))
+    if ip:
+        owner = bindings.owners([ip]).get(ip)
+        mac, binding_id = owner if owner else (None, None)
+    elif mac:
+        address = bindings.addresses([mac]).get(mac)
+        ip, binding_id = address if address else (None, None)
+    else:
+        return Response({'error': 'ip or mac required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if binding_id is None:
+        return Response({'error': 'No current binding'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'mac': mac, 'ip': ip, 'binding_id': binding_id})
+
+def _gateway_health(gateway, seen):
+    """Last call of a gateway, from Redis when newer than the synced row"""
+    seen_at, ip = gateway.last_seen_at, gateway.last_ip
+    if gateway.name in seen:
+        ts, ip = seen[gateway.name]
+        seen_at = datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+    return {
+        'last_seen_at': seen_at,
+        'last_ip': ip,
+        'healthy': gateways.is_healthy(seen_at),
+    }
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def gateway_list(request):
+    """
+    Registered gateways with their health
+    Optional ?site= filter
+    """
+    queryset = Gateway.objects.order_by('site', 'name')
+    if request.query_params.get('site'):
+        queryset = queryset.filter(site=request.query_params['site'])
+    
+    registered = list(queryset)
+    seen = gateways.last_seen(gateway.name for gateway in registered)
     return Response({
-        'status': 'success',
-        'message': 'Access granted',
-        'redirect_url': request.data.get('url', '/')
-    })
\ No newline at end of file
+        'gateways': [
+            {
+                'name': gateway.name,
+                'site': gateway.site,
+                'is_active': gateway.is_active,
+                'rate_limit': gateway.rate_limit or settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['gateway'],
+                **_gateway_health(gateway, seen),
+            }
+            for gateway in registered
+        ]
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def gateway_stats(request, name):
+    """
+    Request rates, errors and latencies of a gateway per endpoint
+    Over the last ?minutes= minutes (default 5)
+    """
+    gateway = Gateway.objects.filter(name=name).first()
+    if gateway is None and name != DEFAULT_GATEWAY:
+        return Response({'error': 'Gateway not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    retention = settings.PORTAL_CONFIG['GATEWAY_STATS_RETENTION'] // 60
+    try:
+        minutes = int(request.query_params.get('minutes', 5))
+    except ValueError:
+        minutes = 0
+    if not 1 <= minutes <= retention:
+        return Response({'error': f'minutes must be between 1 and {retention}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = {'name': name, 'minutes': minutes, 'endpoints': gateways.gateway_stats(name, minutes)}
+    if gateway:
+        response.update(_gateway_health(gateway, gateways.last_seen([name])))
+    return Response(response)
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Walled garden: destinations reachable before authentication.
+
+The rules live in the ``walled_garden`` SystemConfig entry, one per line:
+a domain (``paypal.com`` also covers its subdomains, ``*.apple.com``
+only the subdomains), an IP address or a CIDR. Blank lines and ``#``
+comments are ignored.
+
+The rules are compiled into a reversed-label domain trie and one binary
+radix tree per address family. Each process keeps the compiled garden
+and only recompiles when the version counter in the cache, bumped when
+the entry is saved, has changed.
+"""
+import ipaddress
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import SystemConfig
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEY = 'walled_garden'
+VERSION_KEY = 'portal:walledgarden:version'
+
+# Trie node markers, distinct from any label
+_SELF = 0
+_SUBTREE = 1
+
+FORMATS = ('opennds', 'coovachilli', 'json')
+
+
+def _normalize_domain(value):
+    domain = value.strip().lower().rstrip('.')
+    try:
+        domain = domain.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None
+    labels = domain.split('.')
+    if len(labels) < 2 or not all(labels) or any(len(label) > 63 for label in labels):
+        return None
+    return domain
+
+
+class DomainTrie:
+    """Domains keyed by their labels from right to left."""
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, domain, rule, subdomains_only=False):
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[_SUBTREE] = rule
+        if not subdomains_only:
+            node[_SELF] = rule
+
+    def match(self, domain):
+        """Return the rule covering ``domain``, None if there is none."""
+        node = self._root
+        labels = domain.split('.')
+        for i in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[i])
+            if node is None:
+                return None
+            if _SUBTREE in node:
+                return node[_SUBTREE]
+        node = node.get(labels[0])
+        return node.get(_SELF) if node else None
+
+
+class CidrTree:
+    """Binary radix tree of the networks of one address family."""
+
+    def __init__(self, bits):
+        self.bits = bits
+        # Nodes are [zero child, one child, rule]
+        self._root = [None, None, None]
+
+    def add(self, network, rule):
+        node = self._root
+        value = int(network.network_address)
+        for shift in range(self.bits - 1, self.bits - 1 - network.prefixlen, -1):
+            bit = (value >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = rule
+
+    def match(self, value):
+        """Return the rule of the first network containing ``value``."""
+        node = self._root
+        for shift in range(self.bits - 1, -1, -1):
+            if node[2] is not None:
+                return node[2]
+            node = node[(value >> shift) & 1]
+            if node is None:
+                return None
+        return node[2]
+
+
+class WalledGarden:
+    """Compiled walled-garden rules."""
+
+    def __init__(self, text='', version=None):
+        self.version = version
+        self.domains = []
+        self.networks = []
+        self.invalid = []
+        self._trie = DomainTrie()
+        self._trees = {4: CidrTree(32), 6: CidrTree(128)}
+        self._exports = {}
+
+        for line in text.splitlines():
+            rule = line.split('#', 1)[0].strip()
+            if rule:
+                self._add(rule)
+
+    def _add(self, rule):
+        try:
+            network = ipaddress.ip_network(rule, strict=False)
+        except ValueError:
+            network = None
+        if network is not None:
+            self._trees[network.version].add(network, str(network))
+            self.networks.append(network)
+            return
+
+        subdomains_only = rule.startswith('*.')
+        domain = _normalize_domain(rule[2:] if subdomains_only else rule)
+        if domain is None:
+            self.invalid.append(rule)
+            return
+        self._trie.add(domain, rule, subdomains_only)
+        self.domains.append((domain, subdomains_only))
+
+    def match(self, host):
+        """
+        Return the rule letting ``host`` through, None if it is blocked.
+
+        ``host`` is a domain name or an IP address.
+        """
+        host = host.strip().lower().rstrip('.')
+        if not host:
+            return None
+        if host[0].isdigit() or ':' in host:
+            try:
+                address = ipaddress.ip_address(host.strip('[]'))
+            except ValueError:
+                pass
+            else:
+                return self._trees[address.version].match(int(address))
+        return self._trie.match(host)
+
+    def export(self, fmt):
+        """Rules in a gateway configuration format, built once per version."""
+        if fmt not in self._exports:
+            self._exports[fmt] = getattr(self, f'_export_{fmt}')()
+        return self._exports[fmt]
+
+    def _export_opennds(self):
+        lines = ['FirewallRuleSet preauthenticated-users {']
+        lines.extend(f'    FirewallRule allow to {network}' for network in self.networks)
+        lines.append('}')
+        # OpenNDS resolves FQDNs into an ipset covering their subdomains
+        fqdns = sorted({domain for domain, _ in self.domains})
+        if fqdns:
+            lines.append(f"walledgarden_fqdn_list {' '.join(fqdns)}")
+        return '\n'.join(lines) + '\n'
+
+    def _export_coovachilli(self):
+        lines = []
+        hosts = [str(network) for network in self.networks]
+        hosts.extend(domain for domain, subdomains_only in self.domains if not subdomains_only)
+        if hosts:
+            lines.append(f"uamallowed {','.join(hosts)}")
+        lines.extend(f'uamdomain .{domain}' for domain, _ in sorted(set(self.domains)))
+        return '\n'.join(lines) + '\n'
+
+    def _export_json(self):
+        return {
+            'version': self.version,
+            'domains': [f'*.{domain}' if sub else domain for domain, sub in self.domains],
+            'networks': [str(network) for network in self.networks],
+        }
+
+
+# Process-local compiled garden
+_local = {'garden': WalledGarden(), 'version': None, 'checked': 0.0}
+
+
+def bump_version():
+    """Tell every process to recompile the garden."""
+    # Start from the clock so a lost key never comes back as an old version
+    if not cache.add(VERSION_KEY, time.time_ns(), timeout=None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def compile_garden(version=None):
+    """Compile the rules stored in SystemConfig."""
+    text = SystemConfig.objects.filter(key=CONFIG_KEY).values_list('value', flat=True).first()
+    garden = WalledGarden(text or '', version=version)
+    if garden.invalid:
+        logger.warning(f"Ignored invalid walled garden rules: {', '.join(garden.invalid[:10])}")
+    return garden
+
+
+def get_garden():
+    """
+    Return the compiled garden of this process.
+
+    The cache version is checked at most every ``WALLED_GARDEN_REFRESH``
+    seconds; the rules are recompiled only when it moved.
+    """
+    now = time.monotonic()
+    if now - _local['checked'] < settings.PORTAL_CONFIG['WALLED_GARDEN_REFRESH']:
+        return _local['garden']
+    _local['checked'] = now
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        bump_version()
+        version = cache.get(VERSION_KEY)
+    if version != _local['version']:
+        _local['garden'] = compile_garden(version)
+        _local['version'] = version
+    return _local['garden']
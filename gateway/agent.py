@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Gateway agent for OpenNDS binauth.
+
+Long-running daemon replacing the per-event curl/jq binauth script. The
+binauth hook forwards its arguments as one line on a Unix socket and
+reads one line back; the agent:
+
+- keeps persistent keep-alive connections to the portal,
+- batches authorization checks (``/portal/authorize/batch/``) arriving
+  within a few milliseconds, and counter reports (``/portal/heartbeat/``
+  and ``/portal/session-end/``) per flush interval,
+- caches ALLOW decisions for their TTL (capped), follows the portal
+  change feed to drop revoked clients early, and keeps answering ALLOW
+  for recently allowed clients while the portal is unreachable.
+
+With ``CAPTIVE_GATEWAY_SECRET`` set, requests are signed as the gateway
+given by ``--gateway`` (see ``register_gateway`` on the portal).
+
+Standard library only, so it runs on the gateway's stock python3.
+
+Usage:
+    CAPTIVE_GATEWAY_SECRET=... agent.py serve --portal-url https://captive.example.com --gateway gw-01
+    agent.py call auth_client AA:BB:CC:DD:EE:FF 192.168.1.100 TOKEN
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import os
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('captive-agent')
+
+DEFAULT_SOCKET = '/var/run/captive-agent.sock'
+
+ALLOW = 'ALLOW'
+
+_MAC_HEX_RE = re.compile(r'[^0-9A-Fa-f]')
+
+DEAUTH_METHODS = {
+    'client_deauth', 'idle_deauth', 'timeout_deauth', 'ndsctl_deauth', 'shutdown_deauth',
+}
+
+
+class PortalError(Exception):
+    pass
+
+
+def normalize_mac(value):
+    """Same canonical AA:BB:CC:DD:EE:FF form as the portal, or None."""
+    digits = _MAC_HEX_RE.sub('', value).upper()
+    if len(digits) != 12:
+        return None
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+class PortalClient:
+    """JSON over persistent HTTP/1.1 connections, one per worker thread."""
+
+    def __init__(self, base_url, timeout=5, connections=2, gateway=None, secret=None):
+        url = urlsplit(base_url)
+        self.gateway = gateway
+        self.secret = secret
+        self.secure = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.secure else 80)
+        self.prefix = url.path.rstrip('/') + '/api/v1/portal'
+        self.timeout = timeout
+        self.context = ssl.create_default_context() if self.secure else None
+        self.executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix='portal')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.secure:
+                conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.context)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        if self.secret:
+            headers.update(self._signature(method, self.prefix + path, body or b''))
+        # Retry once: the server may have closed an idle keep-alive connection
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise PortalError(str(e))
+                continue
+            if response.status >= 500:
+                raise PortalError(f"HTTP {response.status}")
+            try:
+                return response.status, json.loads(data or b'{}')
+            except ValueError:
+                raise PortalError('Invalid JSON response')
+
+    def _signature(self, method, path, body):
+        """X-Gateway-* headers checked by the portal against the gateway secret."""
+        timestamp = str(int(time.time()))
+        message = f"{timestamp}\n{method}\n{path}\n".encode() + body
+        return {
+            'X-Gateway-Id': self.gateway,
+            'X-Gateway-Timestamp': timestamp,
+            'X-Gateway-Signature': hmac.new(self.secret.encode(), message, hashlib.sha256).hexdigest(),
+        }
+
+    async def call(self, method, path, payload=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._request, method, path, payload)
+
+
+class DecisionCache:
+    """
+    ALLOW decisions by MAC.
+
+    Entries are fresh for min(portal TTL, ``ttl``) seconds. Once stale they
+    are only used when the portal cannot be reached, for ``grace`` more
+    seconds.
+    """
+
+    def __init__(self, ttl=30, grace=300):
+        self.ttl = ttl
+        self.grace = grace
+        self._entries = {}
+
+    def put(self, mac, ttl):
+        now = time.monotonic()
+        self._entries[mac] = (now + min(ttl, self.ttl), now + ttl)
+
+    def fresh(self, mac):
+        entry = self._entries.get(mac)
+        return bool(entry) and entry[0] > time.monotonic()
+
+    def fallback(self, mac):
+        """Whether ``mac`` may stay allowed while the portal is down."""
+        entry = self._entries.get(mac)
+        now = time.monotonic()
+        return bool(entry) and entry[0] + self.grace > now and entry[1] > now
+
+    def drop(self, mac):
+        self._entries.pop(mac, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def purge(self):
+        now = time.monotonic()
+        for mac in [mac for mac, entry in self._entries.items() if entry[0] + self.grace <= now]:
+            del self._entries[mac]
+
+
+class Agent:
+    def __init__(self, portal, cache, batch_window=0.02, batch_max=200, flush_interval=1.0, gateway='default'):
+        self.portal = portal
+        self.cache = cache
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self.gateway = gateway
+        self._pending = {}
+        self._clients = {}
+        self._batch_task = None
+        self._reports = {'/heartbeat/': [], '/session-end/': []}
+
+    # Authorization
+
+    async def authorize(self, mac, ip, token):
+        if self.cache.fresh(mac):
+            return True
+        future = self._pending.get(mac)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[mac] = future
+            self._clients[mac] = {'mac': mac, 'ip': ip, 'token': token}
+            if len(self._pending) >= self.batch_max:
+                self._send_batch()
+            elif self._batch_task is None:
+                self._batch_task = asyncio.get_running_loop().call_later(self.batch_window, self._send_batch)
+        return await asyncio.shield(future)
+
+    def _send_batch(self):
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+        pending, self._pending = self._pending, {}
+        clients, self._clients = self._clients, {}
+        asyncio.ensure_future(self._resolve(pending, list(clients.values())))
+
+    async def _resolve(self, pending, clients):
+        try:
+            status, body = await self.portal.call('POST', '/authorize/batch/', {'clients': clients})
+            results = {normalize_mac(entry['mac']): entry for entry in body.get('results', [])} if status == 200 else None
+        except PortalError as e:
+            logger.warning(f"Portal unreachable, answering {len(pending)} clients from cache: {e}")
+            results = None
+
+        for mac, future in pending.items():
+            if results is None:
+                allowed = self.cache.fallback(mac)
+            else:
+                entry = results.get(mac, {})
+                allowed = entry.get('status') == ALLOW
+                if allowed:
+                    self.cache.put(mac, entry.get('ttl', 0))
+                else:
+                    self.cache.drop(mac)
+            if not future.done():
+                future.set_result(allowed)
+
+    # Accounting
+
+    def report(self, path, mac, ip, incoming, outgoing):
+        try:
+            incoming, outgoing = int(incoming), int(outgoing)
+        except (TypeError, ValueError):
+            incoming = outgoing = 0
+        self._reports[path].append({
+            'mac': mac, 'ip': ip, 'incoming': incoming, 'outgoing': outgoing,
+            'timestamp': int(time.time()),
+        })
+
+    async def flush_reports(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            for path, reports in self._reports.items():
+                if not reports:
+                    continue
+                self._reports[path] = []
+                for start in range(0, len(reports), self.batch_max):
+                    batch = reports[start:start + self.batch_max]
+                    try:
+                        await self.portal.call('POST', path, {'reports': batch})
+                    except PortalError as e:
+                        # Counters are cumulative, the next report catches up
+                        logger.warning(f"Dropped {len(batch)} reports for {path}: {e}")
+            self.cache.purge()
+
+    # Change feed
+
+    async def follow_feed(self):
+        since = 0
+        while True:
+            try:
+                status, body = await self.portal.call(
+                    'GET', f'/feed/?since={since}&gateway={self.gateway}&timeout=25'
+                )
+            except PortalError as e:
+                logger.warning(f"Change feed unavailable: {e}")
+                await asyncio.sleep(5)
+                continue
+            if status != 200:
+                await asyncio.sleep(5)
+                continue
+            if body.get('reset'):
+                self.cache.clear()
+            for delta in body.get('deltas', []):
+                mac = normalize_mac(delta['mac'])
+                if delta['action'] == 'authorize' and delta.get('ttl'):
+                    self.cache.put(mac, delta['ttl'])
+                else:
+                    self.cache.drop(mac)
+            since = body.get('last_seq', since)
+
+    # Unix socket
+
+    async def handle(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            reply = await self.dispatch(line.decode().split())
+        except (asyncio.TimeoutError, UnicodeDecodeError):
+            reply = 'error'
+        writer.write(reply.encode() + b'\n')
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, args):
+        """binauth arguments: method mac ip token incoming outgoing"""
+        if len(args) < 2:
+            return 'error'
+        method, mac = args[0], normalize_mac(args[1])
+        if mac is None:
+            return 'error'
+        ip = args[2] if len(args) > 2 else ''
+        token = args[3] if len(args) > 3 else ''
+        incoming = args[4] if len(args) > 4 else 0
+        outgoing = args[5] if len(args) > 5 else 0
+
+        if method == 'auth_client':
+            return '1' if await self.authorize(mac, ip, token) else '0'
+        if method in ('client_auth', 'ndsctl_auth'):
+            self.report('/heartbeat/', mac, ip, incoming, outgoing)
+            return 'ok'
+        if method in DEAUTH_METHODS:
+            self.cache.drop(mac)
+            self.report('/session-end/', mac, ip, incoming, outgoing)
+            return 'ok'
+        return 'error'
+
+
+async def serve(options):
+    portal = PortalClient(
+        options.portal_url,
+        timeout=options.timeout,
+        connections=options.connections,
+        gateway=options.gateway,
+        secret=os.environ.get('CAPTIVE_GATEWAY_SECRET'),
+    )
+    agent = Agent(
+        portal,
+        DecisionCache(ttl=options.cache_ttl, grace=options.offline_grace),
+        batch_window=options.batch_window / 1000,
+        flush_interval=options.flush_interval,
+        gateway=options.gateway,
+    )
+    if os.path.exists(options.socket):
+        os.unlink(options.socket)
+    server = await asyncio.start_unix_server(agent.handle, path=options.socket)
+    os.chmod(options.socket, 0o660)
+    logger.info(f"Listening on {options.socket}, portal {options.portal_url}")
+
+    tasks = [asyncio.ensure_future(agent.flush_reports())]
+    if not options.no_feed:
+        tasks.append(asyncio.ensure_future(agent.follow_feed()))
+    async with server:
+        await server.serve_forever()
+
+
+def call(options):
+    """One-shot client for the binauth hook when socat is not available."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(10)
+        try:
+            sock.connect(options.socket)
+            sock.sendall((' '.join(options.args) + '\n').encode())
+            reply = sock.makefile().readline().strip()
+        except OSError as e:
+            print(f"agent unavailable: {e}", file=sys.stderr)
+            return 1
+    print(reply)
+    return 0 if reply in ('1', 'ok') else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('serve', help='Run the agent')
+    run.add_argument('--portal-url', required=True)
+    run.add_argument('--gateway', default='default',
+                     help='Gateway name; requests are signed when CAPTIVE_GATEWAY_SECRET is set')
+    run.add_argument('--connections', type=int, default=2, help='Persistent portal connections')
+    run.add_argument('--timeout', type=float, default=5, help='Portal request timeout (s)')
+    run.add_argument('--batch-window', type=float, default=20, help='Authorization batching window (ms)')
+    run.add_argument('--flush-interval', type=float, default=1, help='Counter report flush interval (s)')
+    run.add_argument('--cache-ttl', type=int, default=30, help='Max seconds an ALLOW is reused without asking')
+    run.add_argument('--offline-grace', type=int, default=300,
+                     help='Seconds clients stay allowed from cache while the portal is unreachable')
+    run.add_argument('--no-feed', action='store_true', help='Do not follow the portal change feed')
+    run.add_argument('--verbose', action='store_true')
+
+    one = commands.add_parser('call', help='Forward binauth arguments to the agent')
+    one.add_argument('args', nargs='+')
+
+    options = parser.parse_args()
+    if options.command == 'call':
+        return call(options)
+
+    logging.basicConfig(
+        level=logging.DEBUG if options.verbose else logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s',
+    )
+    try:
+        asyncio.run(serve(options))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())